@@ -0,0 +1,104 @@
+"""
+Measure throughput (messages/sec) of the asyncio consumer against the stub
+scoring server, for several concurrency limits, and check that the records
+of every partition reach the sink in offset order.
+
+No broker is needed: messages come from the fake consumer of
+bench_batched_inference.py and the stub server runs in-process with an
+artificial, jittered latency, so the gain from keeping requests in flight
+is visible and responses complete out of order.
+
+Usage:
+    python benchmarks/bench_async_scoring.py --messages 20000 --latency-ms 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "kafka"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+import async_consumer  # noqa: E402
+import consumer  # noqa: E402
+from bench_batched_inference import FakeConsumer, FakeMessage, build_messages  # noqa: E402
+from sinks import JsonlPredictionSink  # noqa: E402
+from stub_scoring_server import create_app  # noqa: E402
+
+
+def spread_over_partitions(messages: list, partitions: int) -> list:
+    """Interleave the messages over partitions with per-partition offsets."""
+    offsets = [0] * partitions
+    spread = []
+    for i, msg in enumerate(messages):
+        partition = i % partitions
+        spread.append(FakeMessage(msg.value(), offsets[partition], partition))
+        offsets[partition] += 1
+    return spread
+
+
+def check_order(sink_path: str) -> None:
+    last = {}
+    with open(sink_path) as f:
+        for line in f:
+            record = json.loads(line)
+            partition, offset = record["partition"], record["offset"]
+            if offset <= last.get(partition, -1):
+                raise AssertionError(f"Partition {partition} out of order at offset {offset}")
+            last[partition] = offset
+
+
+async def run(url: str, messages: list, sink_path: str, concurrency: int, chunk_size: int) -> float:
+    consumer.running = True
+    sink = JsonlPredictionSink(
+        path=sink_path, flush_records=1000, max_queue_batches=len(messages)).start()
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await async_consumer.read_messages_async(
+            FakeConsumer(messages), sink, async_consumer.RemoteScorer(session, url),
+            concurrency=concurrency, chunk_size=chunk_size, batch_timeout_ms=50)
+        sink.close()
+        elapsed = time.perf_counter() - start
+    check_order(sink_path)
+    return len(messages) / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--partitions", type=int, default=8)
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--port", type=int, default=5099)
+    args = parser.parse_args()
+
+    runner = web.AppRunner(create_app(args.latency_ms, jitter_ms=args.jitter_ms))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+    url = f"http://127.0.0.1:{args.port}/invocations"
+
+    messages = spread_over_partitions(build_messages(args.messages), args.partitions)
+    print(f"messages: {args.messages}, partitions: {args.partitions}, "
+          f"request size: {args.chunk_size}, "
+          f"server latency: {args.latency_ms}+{args.jitter_ms} ms")
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for concurrency in (1, 4, 16, 64):
+                sink_path = os.path.join(tmp_dir, f"predictions-{concurrency}.jsonl")
+                rate = await run(url, messages, sink_path, concurrency, args.chunk_size)
+                print(f"concurrency {concurrency:>3}: {rate:>10,.0f} msg/sec  (order ok)")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
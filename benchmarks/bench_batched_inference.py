@@ -0,0 +1,180 @@
+"""
+Compare consumer throughput (messages/sec) of the per-message path
+(read_messages_from_topic) against the micro-batched path
+(read_messages_in_batches), with the schemaless JSON decoder and with a
+SchemaDecoder decoding straight into typed columns, and of the pipelined
+path (read_messages_pipelined) running decode and predict on their own
+threads.
+
+No broker is needed: messages are served from memory by a fake consumer and
+scored by a small scikit-learn model saved and loaded through mlflow.pyfunc,
+so the pyfunc overhead is part of the measurement.
+
+Usage:
+    python benchmarks/bench_batched_inference.py --messages 20000 --batch-size 500
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import mlflow.pyfunc
+import mlflow.sklearn
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+
+# The consumer is a script living in kafka/, make it importable
+sys.path.insert(0, str(Path(__file__).parent.parent / "kafka"))
+
+import consumer  # noqa: E402
+from decoders import JSON_BACKEND, SchemaDecoder, parse_schema  # noqa: E402
+from model_watcher import ModelHandle  # noqa: E402
+from sinks import JsonlPredictionSink  # noqa: E402
+
+FEATURES = ["amount", "merchant_category", "hour", "card_age_days"]
+FEATURE_SCHEMA = "amount:float64,merchant_category:int64,hour:int64,card_age_days:int64"
+
+
+class FakeMessage:
+    def __init__(self, value: bytes, offset: int, partition: int = 0):
+        self._value = value
+        self._offset = offset
+        self._partition = partition
+
+    def value(self):
+        return self._value
+
+    def error(self):
+        return None
+
+    def topic(self):
+        return "benchmark"
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+
+class FakeConsumer:
+    """Serves pre-built messages and stops the consumer loop when exhausted."""
+
+    def __init__(self, messages: list):
+        self._messages = messages
+        self._position = 0
+        self._paused = False
+
+    def _take(self, count: int) -> list:
+        chunk = self._messages[self._position:self._position + count]
+        self._position += len(chunk)
+        if self._position >= len(self._messages):
+            consumer.running = False
+        return chunk
+
+    def poll(self, timeout=None):
+        if self._paused:
+            return None
+        chunk = self._take(1)
+        return chunk[0] if chunk else None
+
+    def consume(self, num_messages=1, timeout=None):
+        return self._take(num_messages)
+
+    def assignment(self):
+        return []
+
+    def pause(self, partitions):
+        self._paused = True
+
+    def resume(self, partitions):
+        self._paused = False
+
+    def close(self):
+        pass
+
+
+def build_messages(count: int, seed: int = 42) -> list:
+    rng = np.random.default_rng(seed)
+    messages = []
+    for offset in range(count):
+        payload = {
+            "amount": float(rng.gamma(2.0, 50.0)),
+            "merchant_category": int(rng.integers(0, 20)),
+            "hour": int(rng.integers(0, 24)),
+            "card_age_days": int(rng.integers(1, 3650)),
+        }
+        messages.append(FakeMessage(json.dumps(payload).encode("utf-8"), offset))
+    return messages
+
+
+def build_model(model_dir: str):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(1000, len(FEATURES)))
+    y = (X[:, 0] + rng.normal(size=1000) > 1.5).astype(int)
+    sk_model = LogisticRegression().fit(pd.DataFrame(X, columns=FEATURES), y)
+    mlflow.sklearn.save_model(sk_model, model_dir)
+    return ModelHandle(mlflow.pyfunc.load_model(model_dir), version="1")
+
+
+def run(read_fn, model_handle, messages: list, sink_path: str, **kwargs) -> float:
+    """Run one consumer loop over all messages and return messages/sec."""
+    consumer.running = True
+    fake_consumer = FakeConsumer(messages)
+    sink = JsonlPredictionSink(
+        path=sink_path, flush_records=1000, max_queue_batches=len(messages)).start()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        read_fn(fake_consumer, model_handle, sink, **kwargs)
+        sink.close()
+        elapsed = time.perf_counter() - start
+    return len(messages) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--batch-timeout-ms", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sink_path = os.path.join(tmp_dir, "batch_predictions.jsonl")
+        model_handle = build_model(os.path.join(tmp_dir, "model"))
+        messages = build_messages(args.messages)
+
+        single = run(consumer.read_messages_from_topic, model_handle, messages, sink_path)
+        batched = run(
+            consumer.read_messages_in_batches, model_handle, messages, sink_path,
+            batch_size=args.batch_size,
+            batch_timeout_ms=args.batch_timeout_ms,
+        )
+        schema = run(
+            consumer.read_messages_in_batches, model_handle, messages, sink_path,
+            batch_size=args.batch_size,
+            batch_timeout_ms=args.batch_timeout_ms,
+            decoder=SchemaDecoder(parse_schema(FEATURE_SCHEMA)),
+        )
+        pipelined = run(
+            consumer.read_messages_pipelined, model_handle, messages, sink_path,
+            batch_size=args.batch_size,
+            batch_timeout_ms=args.batch_timeout_ms,
+            decoder=SchemaDecoder(parse_schema(FEATURE_SCHEMA)),
+        )
+
+    print(f"messages:           {args.messages}  (JSON backend: {JSON_BACKEND})")
+    print(f"single  (msg/sec):  {single:,.0f}")
+    print(f"batched (msg/sec):  {batched:,.0f}  (batch size {args.batch_size})")
+    print(f"schema  (msg/sec):  {schema:,.0f}  (batched, typed columns)")
+    print(f"pipelined (msg/sec): {pipelined:,.0f}  (schema, decode and predict threads)")
+    print(f"speedup:            {batched / single:.1f}x batched, {schema / single:.1f}x schema, "
+          f"{pipelined / single:.1f}x pipelined")
+
+
+if __name__ == "__main__":
+    main()
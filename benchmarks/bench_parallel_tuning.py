@@ -0,0 +1,95 @@
+"""
+Compare the wall time of the serial hyperparameter search of model_tuning
+(hyperopt's fmin, one trial and one fold at a time) against the parallel
+search (orchestration/parallel_tuning.py) on the same trials budget.
+
+The data is a synthetic classification problem and the model a
+RandomForestClassifier from orchestration/model_registry.py, tuned over a
+small search space. Both searches use the same random state, the best
+scores are printed to show the parallel search is not worse.
+
+Usage:
+    python benchmarks/bench_parallel_tuning.py --evals 20 --parallel-trials 4
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from hyperopt import STATUS_OK, Trials, fmin, hp, tpe
+from hyperopt.pyll import scope
+from sklearn.datasets import make_classification
+from sklearn.model_selection import cross_val_score
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from orchestration.model_registry import model_registry  # noqa: E402
+from orchestration.parallel_tuning import parallel_fmin, plan_cores  # noqa: E402
+
+MODEL_NAME = "RandomForestClassifier"
+SPACE = {
+    "n_estimators": scope.int(hp.quniform("n_estimators", 20, 200, 10)),
+    "max_depth": scope.int(hp.quniform("max_depth", 2, 16, 1)),
+    "min_samples_leaf": scope.int(hp.quniform("min_samples_leaf", 1, 10, 1)),
+}
+METRIC = "roc_auc"
+
+
+def serial(model_class, X, y, evals: int, random_state: int) -> Trials:
+    def objective(params):
+        score = cross_val_score(model_class(**params), X, y, cv=5, scoring=METRIC).mean()
+        return {"loss": -score, "status": STATUS_OK}
+
+    trials = Trials()
+    fmin(fn=objective, space=SPACE, algo=tpe.suggest, max_evals=evals, trials=trials,
+         rstate=np.random.default_rng(random_state), show_progressbar=False)
+    return trials
+
+
+def parallel(model_class, X, y, evals: int, random_state: int, parallel_trials: int,
+             max_cores: int) -> Trials:
+    trials = Trials()
+    parallel_fmin(
+        model_class=model_class, space=SPACE, X_train=X, y_train=y, metric_name=METRIC,
+        loss_fn=lambda score: -score, max_evals=evals, trials=trials,
+        rstate=np.random.default_rng(random_state), parallel_trials=parallel_trials,
+        max_cores=max_cores)
+    return trials
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--evals", type=int, default=20)
+    parser.add_argument("--samples", type=int, default=5000)
+    parser.add_argument("--parallel-trials", type=int, default=4)
+    parser.add_argument("--max-cores", type=int, default=os.cpu_count())
+    parser.add_argument("--random-state", type=int, default=42)
+    args = parser.parse_args()
+
+    X, y = make_classification(
+        n_samples=args.samples, n_features=20, n_informative=8, random_state=args.random_state)
+    model_class = model_registry.get(MODEL_NAME)
+
+    start = time.perf_counter()
+    serial_trials = serial(model_class, X, y, args.evals, args.random_state)
+    serial_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel_trials = parallel(model_class, X, y, args.evals, args.random_state,
+                               args.parallel_trials, args.max_cores)
+    parallel_seconds = time.perf_counter() - start
+
+    processes, concurrent_trials = plan_cores(args.parallel_trials, args.max_cores)
+    print(f"trials: {args.evals}  samples: {args.samples}  cores: {args.max_cores}")
+    print(f"serial   (s): {serial_seconds:8.1f}  best {METRIC}: "
+          f"{-serial_trials.best_trial['result']['loss']:.4f}")
+    print(f"parallel (s): {parallel_seconds:8.1f}  best {METRIC}: "
+          f"{-parallel_trials.best_trial['result']['loss']:.4f}  "
+          f"({concurrent_trials} trials at once, {processes} processes)")
+    print(f"speedup:      {serial_seconds / parallel_seconds:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import sys
+from pathlib import Path
+
+# Add the project root (orchestration) and kafka/ (the consumer scripts)
+# to the Python path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "kafka"))
+sys.path.insert(0, str(Path(__file__).parent))
@@ -0,0 +1,200 @@
+"""
+Load test of the consumer's scoring path, without a broker.
+
+Drives the consumer's read loop for a CONSUMER_MODE (single, batch or
+pipeline) from a message source (see kafka/sources.py) released at a
+target rate, through decoding and scoring into a real JSONL sink. It
+reports the achieved throughput and latency percentiles. Latency runs
+from the time a message was due at the target rate until its record is
+handed to the sink, so a consumer that falls behind shows up as growing
+latency rather than as a slower schedule. With --output the results are
+appended as one JSON line per run, for regression tracking.
+
+Messages are synthetic transactions scored by a small scikit-learn model
+(as in bench_batched_inference.py) unless --source/--path and --model-dir
+point at other data and another MLflow model.
+
+Usage:
+    python benchmarks/load_test.py --mode batch --rate 20000 --duration 30
+    python benchmarks/load_test.py --source jsonl --path history.jsonl --rate 5000 \\
+        --model-dir models/3 --output load_tests.jsonl
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import mlflow.pyfunc
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "kafka"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+import consumer  # noqa: E402
+from bench_batched_inference import build_model  # noqa: E402
+from model_watcher import ModelHandle  # noqa: E402
+from sinks import JsonlPredictionSink  # noqa: E402
+from sources import (  # noqa: E402
+    JsonlFileSource,
+    ParquetFileSource,
+    RateLimitedSource,
+    SyntheticSource,
+)
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyRecordingSink:
+    """
+    Wraps a sink and records, when records are accepted, how long each one
+    took since its message was due (RateLimitedSource.release_times).
+    """
+
+    def __init__(self, sink, release_times: dict):
+        self.sink = sink
+        self.release_times = release_times
+        self.latencies = []
+        self.last_record_at = None
+
+    def submit(self, records, timeout: float = 0) -> bool:
+        if not self.sink.submit(records, timeout):
+            return False
+        now = time.perf_counter()
+        for record in records:
+            due = self.release_times.pop(
+                (record["topic"], record["partition"], record["offset"]), None)
+            if due is not None:
+                self.latencies.append(now - due)
+        self.last_record_at = now
+        return True
+
+    def __getattr__(self, name):
+        return getattr(self.sink, name)
+
+
+def stop_when_drained(source: RateLimitedSource, deadline: float) -> None:
+    """
+    Stop the read loop once every message was released and reached the
+    sink, or at the deadline.
+    """
+    while time.monotonic() < deadline and not (source.exhausted and not source.release_times):
+        time.sleep(0.05)
+    consumer.running = False
+
+
+def create_source(args):
+    if args.source == "jsonl":
+        return JsonlFileSource(args.path)
+    if args.source == "parquet":
+        return ParquetFileSource(args.path)
+    return SyntheticSource(partitions=args.partitions)
+
+
+def run_load_test(args, model_handle: ModelHandle, sink_path: str) -> dict:
+    scheduled = int(args.rate * args.duration)
+    source = RateLimitedSource(
+        create_source(args), args.rate, count=scheduled, record_release_times=True)
+    sink = LatencyRecordingSink(
+        JsonlPredictionSink(path=sink_path, max_queue_batches=consumer.SINK_QUEUE_SIZE).start(),
+        source.release_times)
+    kwargs = {}
+    if args.mode != "single":
+        kwargs = {"batch_size": args.batch_size, "batch_timeout_ms": args.batch_timeout_ms}
+    read_fn = {
+        "single": consumer.read_messages_from_topic,
+        "batch": consumer.read_messages_in_batches,
+        "pipeline": consumer.read_messages_pipelined,
+    }[args.mode]
+
+    consumer.running = True
+    stopper = threading.Thread(
+        target=stop_when_drained,
+        args=(source, time.monotonic() + args.duration + args.drain_timeout), daemon=True)
+    started = time.perf_counter()
+    stopper.start()
+    try:
+        read_fn(source, model_handle, sink, **kwargs)
+    finally:
+        sink.close()
+        source.close()
+
+    if source.source.exhausted:
+        # A file shorter than the run
+        scheduled = source.released
+    latencies_ms = np.asarray(sink.latencies) * 1000.0
+    elapsed = (sink.last_record_at or time.perf_counter()) - started
+    result = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "mode": args.mode,
+        "source": args.source,
+        "batch_size": args.batch_size if args.mode != "single" else 1,
+        "target_rate": args.rate,
+        "messages": scheduled,
+        "not_delivered": scheduled - int(latencies_ms.size),
+        "throughput": round(latencies_ms.size / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+    for percentile in PERCENTILES:
+        value = np.percentile(latencies_ms, percentile) if latencies_ms.size else float("nan")
+        result[f"p{percentile:g}_ms"] = round(float(value), 2)
+    result["max_ms"] = round(float(latencies_ms.max()), 2) if latencies_ms.size else float("nan")
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=("single", "batch", "pipeline"), default="batch")
+    parser.add_argument("--source", choices=("synthetic", "jsonl", "parquet"), default="synthetic")
+    parser.add_argument("--path", help="file replayed by the jsonl and parquet sources")
+    parser.add_argument("--rate", type=float, default=10000, help="target messages/sec")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds of messages at the target rate")
+    parser.add_argument("--partitions", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=consumer.INFERENCE_BATCH_SIZE)
+    parser.add_argument("--batch-timeout-ms", type=int, default=consumer.INFERENCE_BATCH_TIMEOUT_MS)
+    parser.add_argument("--drain-timeout", type=float, default=30,
+                        help="seconds to wait for the backlog after --duration")
+    parser.add_argument("--model-dir", help="MLflow model to score with, a synthetic one by default")
+    parser.add_argument("--output", help="append the results as a JSON line to this file")
+    args = parser.parse_args()
+    if args.source != "synthetic" and not args.path:
+        parser.error(f"--path is required with --source {args.source}")
+    if args.rate <= 0:
+        parser.error("--rate must be positive")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.model_dir:
+            model_handle = ModelHandle(mlflow.pyfunc.load_model(args.model_dir), version="load-test")
+        else:
+            model_handle = build_model(os.path.join(tmp_dir, "model"))
+        result = run_load_test(args, model_handle, os.path.join(tmp_dir, "predictions.jsonl"))
+
+    print(f"mode: {result['mode']}, source: {result['source']}, "
+          f"batch size: {result['batch_size']}, target: {args.rate:,.0f} msg/sec")
+    print(f"messages: {result['messages']:,}  not delivered: {result['not_delivered']:,}  "
+          f"throughput: {result['throughput']:,.0f} msg/sec")
+    print("latency ms: " + "  ".join(
+        f"p{percentile:g} {result[f'p{percentile:g}_ms']:,.1f}" for percentile in PERCENTILES)
+        + f"  max {result['max_ms']:,.1f}")
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Latency benchmarks of the inference path, with pytest-benchmark.
+
+Covers the steps a message goes through in the consumer, each on its own
+so a regression points at the step that got slower:
+
+- decode: JSON payloads into inputs (JsonDecoder, SchemaDecoder);
+- predict: predict() on one input and predict_batch() at batch sizes
+  1 to 10000, with a small RandomForestClassifier and XGBClassifier from
+  orchestration/model_registry.py trained on synthetic transactions and
+  loaded through mlflow.pyfunc like the consumer's models;
+- score: decode_messages + score_batch, the batched consumer's hot path;
+- sink: appending records to the sink buffers and flushing them, for the
+  JSONL and Parquet sinks, called on the benchmark thread instead of the
+  sink's writer thread.
+
+The suite is not part of the default test run (see testpaths in
+pyproject.toml). Run it and store the results, then compare later runs
+against them, failing on a slowdown:
+
+    pip install pytest-benchmark
+    python -m pytest benchmarks --benchmark-autosave
+    python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=median:20%
+
+Results are saved under .benchmarks/, per machine and Python version, and
+named after the commit they were run on.
+"""
+import os
+
+import mlflow.pyfunc
+import mlflow.sklearn
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import consumer  # noqa: E402
+from bench_batched_inference import FEATURES, FEATURE_SCHEMA, build_messages  # noqa: E402
+from decoders import JsonDecoder, SchemaDecoder, parse_schema  # noqa: E402
+from model_watcher import ModelHandle  # noqa: E402
+from orchestration.model_registry import model_registry  # noqa: E402
+from sinks import JsonlPredictionSink, ParquetPredictionSink  # noqa: E402
+
+MODELS = {
+    "RandomForestClassifier": {"n_estimators": 50, "max_depth": 8, "random_state": 42},
+    "XGBClassifier": {"n_estimators": 50, "max_depth": 4, "random_state": 42},
+}
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+# Messages per decode, score and sink benchmark, the consumer's default batch size
+BATCH = consumer.INFERENCE_BATCH_SIZE
+
+
+@pytest.fixture(scope="session")
+def messages():
+    return build_messages(max(BATCH_SIZES))
+
+
+@pytest.fixture(scope="session")
+def inputs(messages):
+    decoder = JsonDecoder()
+    return [decoder.decode(msg.value()) for msg in messages]
+
+
+@pytest.fixture(scope="session", params=list(MODELS))
+def model(request, tmp_path_factory):
+    """A model from the registry, saved and loaded back as an MLflow pyfunc model."""
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame({
+        "amount": rng.gamma(2.0, 50.0, size=5000),
+        "merchant_category": rng.integers(0, 20, size=5000),
+        "hour": rng.integers(0, 24, size=5000),
+        "card_age_days": rng.integers(1, 3650, size=5000),
+    }, columns=FEATURES)
+    y = ((X["amount"] > 150) & (X["card_age_days"] < 365)).astype(int)
+    model_class = model_registry.get(request.param)
+    sk_model = model_class(**MODELS[request.param]).fit(X, y)
+    model_dir = os.path.join(tmp_path_factory.mktemp("models"), request.param)
+    # Trained right here, so the pickle format is safe to load back
+    mlflow.sklearn.save_model(
+        sk_model, model_dir, serialization_format=mlflow.sklearn.SERIALIZATION_FORMAT_CLOUDPICKLE)
+    return mlflow.pyfunc.load_model(model_dir)
+
+
+@pytest.fixture
+def records(messages, inputs):
+    return [
+        consumer.make_record(input_data, 0, msg, "1")
+        for input_data, msg in zip(inputs[:BATCH], messages[:BATCH])
+    ]
+
+
+@pytest.mark.benchmark(group="decode")
+def test_decode_json(benchmark, messages):
+    batch = benchmark(JsonDecoder().decode_batch, messages[:BATCH])
+    assert len(batch.inputs) == BATCH
+
+
+@pytest.mark.benchmark(group="decode")
+def test_decode_schema(benchmark, messages):
+    decoder = SchemaDecoder(parse_schema(FEATURE_SCHEMA))
+    batch = benchmark(decoder.decode_batch, messages[:BATCH])
+    assert len(batch.frame) == BATCH
+
+
+@pytest.mark.benchmark(group="predict-single")
+def test_predict_single(benchmark, model, inputs):
+    benchmark(consumer.predict, model, inputs[0])
+
+
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+def test_predict_batch(benchmark, model, inputs, batch_size):
+    benchmark.group = f"predict-batch-{batch_size}"
+    predictions = benchmark(consumer.predict_batch, model, inputs[:batch_size])
+    assert len(predictions) == batch_size
+
+
+@pytest.mark.benchmark(group="score")
+@pytest.mark.parametrize("schema", [False, True], ids=["json", "schema"])
+def test_decode_and_score_batch(benchmark, model, messages, schema):
+    decoder = SchemaDecoder(parse_schema(FEATURE_SCHEMA)) if schema else JsonDecoder()
+    model_handle = ModelHandle(model, version="1")
+    message_log, error_log, summary = consumer.create_log_helpers(
+        model_handle, JsonlPredictionSink(path=os.devnull))
+
+    def decode_and_score():
+        batch = consumer.decode_messages(messages[:BATCH], decoder, error_log, summary)
+        return consumer.score_batch(batch, model_handle, message_log, error_log, summary)
+
+    assert len(benchmark(decode_and_score)) == BATCH
+
+
+@pytest.mark.benchmark(group="sink-submit")
+def test_sink_submit(benchmark, records):
+    # The writer thread is not started and the queue is unbounded
+    sink = JsonlPredictionSink(path=os.devnull, max_queue_batches=0)
+    assert benchmark(sink.submit, records)
+
+
+@pytest.mark.benchmark(group="sink-jsonl")
+def test_jsonl_sink_write_and_flush(benchmark, records, tmp_path):
+    sink = JsonlPredictionSink(path=str(tmp_path / "predictions.jsonl"))
+
+    def write_and_flush():
+        sink._write(records)
+        sink._flush()
+
+    benchmark(write_and_flush)
+    sink._close()
+
+
+@pytest.mark.benchmark(group="sink-parquet")
+def test_parquet_sink_append(benchmark, records, tmp_path):
+    # Rows are only buffered until a row group is full
+    sink = ParquetPredictionSink(root_dir=str(tmp_path), row_group_size=10 ** 9)
+
+    def append():
+        sink._write(records)
+        for partition_file in sink._files.values():
+            partition_file.pending.clear()
+
+    benchmark(append)
+
+
+@pytest.mark.benchmark(group="sink-parquet")
+def test_parquet_sink_write_row_group(benchmark, records, tmp_path):
+    sink = ParquetPredictionSink(root_dir=str(tmp_path), row_group_size=len(records))
+    benchmark(sink._write, records)
+    sink._close()
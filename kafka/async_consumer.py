@@ -0,0 +1,238 @@
+"""
+Asyncio consumer scoring against a remote model server.
+
+Instead of loading the model in-process, every micro-batch is posted to a
+scoring server speaking the MLflow scoring protocol (`mlflow models serve`,
+or stub_scoring_server.py for local runs):
+
+    POST <SCORING_URL>  {"dataframe_records": [...]}  ->  {"predictions": [...]}
+
+Many requests are kept in flight at once, bounded by SCORING_CONCURRENCY,
+over a pool of at most SCORING_MAX_CONNECTIONS keep-alive connections.
+Messages are grouped by partition before scoring; requests of the same
+partition may complete in any order, but their records are handed to the
+sink in offset order, so per-partition ordering (and the sink's offset
+tracking) is preserved. A batch the server fails to score is reported to
+the sink as failed, so offsets are not committed past it.
+
+Usage:
+    SCORING_URL=http://localhost:5001/invocations python async_consumer.py
+
+Consumer calls run on a dedicated thread. While all SCORING_CONCURRENCY
+slots are taken the consumer is not polled, so SCORING_TIMEOUT must stay
+well below the consumer's max.poll.interval.ms.
+"""
+import asyncio
+import logging
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+import consumer
+import decoders
+import metrics
+from consumer_logging import MessageLogSampler, PeriodicSummary, configure_logging
+from decoders import DecodedBatch, JsonDecoder
+from offsets import OffsetCommitter
+from sinks import PredictionSink
+
+SCORING_URL = os.getenv("SCORING_URL", "http://localhost:5001/invocations")
+# Maximum number of scoring requests in flight
+SCORING_CONCURRENCY = int(os.getenv("SCORING_CONCURRENCY", "32"))
+SCORING_MAX_CONNECTIONS = int(os.getenv("SCORING_MAX_CONNECTIONS", "32"))
+# Messages of one partition sent in a single request
+SCORING_BATCH_SIZE = int(os.getenv("SCORING_BATCH_SIZE", "100"))
+SCORING_TIMEOUT = float(os.getenv("SCORING_TIMEOUT", "10"))
+# Version written to the prediction records, the server does not report it
+SCORING_MODEL_VERSION = os.getenv("SCORING_MODEL_VERSION", "remote")
+
+logger = logging.getLogger("consumer.async")
+
+
+def split_by_partition(messages: list, chunk_size: int) -> List[list]:
+    """Group messages by partition, in offset order, in chunks of chunk_size."""
+    partitions: Dict[Tuple[str, int], list] = {}
+    for msg in messages:
+        partitions.setdefault((msg.topic(), msg.partition()), []).append(msg)
+    return [
+        partition_messages[i:i + chunk_size]
+        for partition_messages in partitions.values()
+        for i in range(0, len(partition_messages), chunk_size)
+    ]
+
+
+class RemoteScorer:
+    """Scores decoded batches with an MLflow-compatible scoring server."""
+
+    def __init__(self, session: aiohttp.ClientSession, url: str,
+                 model_version: str = SCORING_MODEL_VERSION):
+        self.session = session
+        self.url = url
+        self.model_version = model_version
+
+    async def score(self, batch: DecodedBatch) -> List[dict]:
+        payload = {"dataframe_records": batch.inputs}
+        start = time.perf_counter()
+        async with self.session.post(self.url, json=payload) as response:
+            response.raise_for_status()
+            body = await response.json(loads=decoders.loads)
+        metrics.PREDICT_SECONDS.observe(time.perf_counter() - start)
+
+        predictions = body["predictions"] if isinstance(body, dict) else body
+        if len(predictions) != len(batch.inputs):
+            raise ValueError(
+                f"Scoring server returned {len(predictions)} predictions "
+                f"for {len(batch.inputs)} inputs")
+        return [
+            consumer.make_record(input_data, prediction, msg, self.model_version)
+            for input_data, prediction, msg in zip(batch.inputs, predictions, batch.messages)
+        ]
+
+
+async def read_messages_async(
+    kafka_consumer,
+    sink: PredictionSink,
+    scorer: RemoteScorer,
+    concurrency: int = SCORING_CONCURRENCY,
+    batch_size: int = consumer.INFERENCE_BATCH_SIZE,
+    batch_timeout_ms: int = consumer.INFERENCE_BATCH_TIMEOUT_MS,
+    chunk_size: int = SCORING_BATCH_SIZE,
+    decoder: JsonDecoder = None,
+    committer: OffsetCommitter = None,
+) -> None:
+    """
+    Consume until consumer.running is cleared, keeping up to concurrency
+    scoring requests in flight, then wait for the outstanding ones.
+    :param kafka_consumer: Subscribed Kafka consumer
+    :param sink: Sink the prediction records are written to
+    :param scorer: Client of the scoring server
+    :param concurrency: Maximum number of requests in flight
+    :param batch_size: Maximum number of messages consumed at once
+    :param batch_timeout_ms: Maximum time spent collecting them
+    :param chunk_size: Maximum number of messages per request
+    :param decoder: Payload decoder, schemaless JSON by default
+    :param committer: Offset committer when auto-commit is disabled
+    """
+    decoder = decoder or JsonDecoder()
+    loop = asyncio.get_running_loop()
+    # librdkafka calls stay on one thread, off the event loop
+    kafka_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kafka")
+    slots = asyncio.Semaphore(concurrency)
+    in_flight = set()
+    # Last delivery task of every partition, the next one waits for it
+    partition_tails: Dict[Tuple[str, int], asyncio.Task] = {}
+
+    message_log = MessageLogSampler(logger)
+    error_log = MessageLogSampler(logger, level=logging.WARNING)
+    summary = PeriodicSummary(logger, sampler=message_log, fields=lambda: {
+        "sink_queue_depth": sink.queue_depth(),
+        "requests_in_flight": len(in_flight),
+    })
+
+    async def deliver(records: List[dict], submit=sink.submit) -> None:
+        if submit(records):
+            return
+        metrics.ERRORS.labels("sink_full").inc()
+        if consumer.SINK_BACKPRESSURE_POLICY == "drop":
+            logger.warning("Sink queue full, dropping records",
+                           extra={"fields": {"records": len(records)}})
+            return
+        # Holding the slot stops the poll loop until the sink catches up
+        while not submit(records):
+            if not sink.is_alive():
+                raise RuntimeError("Prediction sink writer thread is not running")
+            await asyncio.sleep(0.05)
+
+    async def score_and_deliver(batch: DecodedBatch, previous: Optional[asyncio.Task]) -> None:
+        try:
+            try:
+                records = await scorer.score(batch)
+            except Exception as e:
+                records = None
+                metrics.ERRORS.labels("predict").inc()
+                summary.add("errors")
+                if error_log.sample():
+                    logger.warning("Error scoring batch", extra={"fields": {
+                        "error": str(e), "batch_size": len(batch.inputs),
+                        **consumer.message_source(batch.messages[0])}})
+            # Keep the partition's records in offset order
+            if previous is not None:
+                await asyncio.wait([previous])
+            if records is None:
+                # Never produced: the sink must not let commits move past them
+                await deliver(consumer.failed_sources(batch.messages),
+                              submit=sink.submit_failed)
+                return
+            metrics.BATCH_SIZE.observe(len(records))
+            metrics.PREDICTIONS.inc(len(records))
+            summary.add("predictions", len(records))
+            await deliver(records)
+        finally:
+            slots.release()
+
+    try:
+        while consumer.running:
+            summary.maybe_log()
+            if committer is not None:
+                await loop.run_in_executor(kafka_executor, committer.maybe_commit, kafka_consumer)
+            messages = await loop.run_in_executor(
+                kafka_executor, consumer.consume_batch, kafka_consumer, batch_size, batch_timeout_ms)
+            if not messages:
+                continue
+            metrics.MESSAGES_CONSUMED.inc(len(messages))
+            summary.add("messages", len(messages))
+
+            for chunk in split_by_partition(messages, chunk_size):
+                batch = consumer.decode_messages(chunk, decoder, error_log, summary)
+                if batch is None:
+                    continue
+                await slots.acquire()
+                tp = (chunk[0].topic(), chunk[0].partition())
+                task = asyncio.create_task(score_and_deliver(batch, partition_tails.get(tp)))
+                partition_tails[tp] = task
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+    finally:
+        if in_flight:
+            await asyncio.wait(list(in_flight))
+        summary.log()
+        kafka_executor.shutdown()
+
+
+async def run_async_consumer(url: str = SCORING_URL) -> None:
+    metrics.start_metrics_server(consumer.METRICS_PORT)
+    sink = consumer.create_prediction_sink()
+    metrics.SINK_QUEUE_DEPTH.set_function(sink.queue_depth)
+    committer = None
+    if consumer.OFFSET_COMMIT_MODE == "sink":
+        committer = OffsetCommitter(sink, consumer.OFFSET_COMMIT_INTERVAL_MS / 1000.0)
+
+    logger.info("Starting Kafka consumer...", extra={"fields": {"scoring_url": url}})
+    kafka_consumer = consumer.start_kafka_consumer(committer)
+
+    connector = aiohttp.TCPConnector(limit=SCORING_MAX_CONNECTIONS)
+    timeout = aiohttp.ClientTimeout(total=SCORING_TIMEOUT)
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            await read_messages_async(
+                kafka_consumer, sink, RemoteScorer(session, url),
+                decoder=consumer.create_decoder(), committer=committer)
+    finally:
+        sink.close()
+        logger.info("Prediction sink closed",
+                    extra={"fields": {"records_written": sink.records_written}})
+        if committer is not None:
+            committer.commit(kafka_consumer, asynchronous=False)
+        logger.info("Closing Kafka consumer...")
+        kafka_consumer.close()
+
+
+if __name__ == "__main__":
+    configure_logging()
+    signal.signal(signal.SIGINT, consumer.shutdown_handler)
+    signal.signal(signal.SIGTERM, consumer.shutdown_handler)
+    asyncio.run(run_async_consumer())
@@ -0,0 +1,302 @@
+"""
+Rescore a bounded range of messages as fast as possible, e.g. days of
+history after shipping a new model, into the Parquet sink.
+
+The range is read from Kafka between two times or offsets per partition
+(see sources.resolve_ranges), or replayed from a JSONL file (raw payloads
+or a prediction log, see sources.JsonlFileSource). The ranges are split
+into pieces spread over worker processes, so all cores score even when the
+topic has fewer partitions than there are cores. As in supervisor.py the
+model is loaded once and inherited by the forked workers.
+
+Compared to the live consumer, a backfill only does what scoring needs:
+large batches, no per-message logs, no dedup, no feature store, no offset
+commits (partitions are assigned manually, the consumer group of the live
+consumer is left alone). The parent process logs progress, throughput and
+an ETA every --progress-interval seconds.
+
+Usage:
+    python backfill.py --from-time 2024-06-01T00:00:00 --to-time 2024-06-08T00:00:00 \\
+        --model-version 7 --workers 8 --output-dir rescored
+    python backfill.py --file batch_predictions.jsonl --output-dir rescored
+"""
+import argparse
+import gc
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+import consumer
+from consumer_logging import MessageLogSampler, PeriodicSummary, configure_logging
+from model_watcher import ModelHandle, load_latest_model
+from sinks import ParquetPredictionSink
+from sources import JsonlFileSource, KafkaRangeSource, PartitionRange, resolve_ranges
+
+# Messages scored per model.predict call
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "20000"))
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", str(os.cpu_count() or 1)))
+BACKFILL_OUTPUT_DIR = os.getenv("BACKFILL_OUTPUT_DIR", "backfill")
+# Ranges are not split into pieces smaller than this (offsets)
+MIN_PIECE_SIZE = 10000
+
+running = True
+
+logger = logging.getLogger("consumer.backfill")
+
+
+def shutdown_handler(sig, frame):
+    global running
+    logger.info("Shutdown signal received, stopping the backfill.")
+    running = False
+
+
+def parse_time(value: str) -> int:
+    """ISO 8601 time (UTC unless it has an offset) to epoch milliseconds."""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def split_ranges(ranges: List[PartitionRange], workers: int) -> List[List[PartitionRange]]:
+    """
+    Split the ranges into pieces and spread them over workers, largest
+    first to the least loaded worker. A worker never gets two pieces of the
+    same partition.
+    :return: Ranges of every worker, without empty workers
+    """
+    total = sum(r.size for r in ranges)
+    target = max(MIN_PIECE_SIZE, -(-total // workers)) if total else 1
+    pieces = []
+    for r in ranges:
+        if r.size == 0:
+            continue
+        count = min(workers, -(-r.size // target))
+        step = -(-r.size // count)
+        pieces.extend(
+            PartitionRange(r.topic, r.partition, start, min(r.end, start + step))
+            for start in range(r.start, r.end, step))
+
+    assigned = [[] for _ in range(workers)]
+    partitions = [set() for _ in range(workers)]
+    sizes = [0] * workers
+    for piece in sorted(pieces, key=lambda p: p.size, reverse=True):
+        key = (piece.topic, piece.partition)
+        worker = min((i for i in range(workers) if key not in partitions[i]),
+                     key=lambda i: sizes[i])
+        assigned[worker].append(piece)
+        partitions[worker].add(key)
+        sizes[worker] += piece.size
+    return [worker_ranges for worker_ranges in assigned if worker_ranges]
+
+
+def backfill_worker(worker_id: int, make_source: Callable, model_handle: ModelHandle,
+                    output_dir: str, batch_size: int, progress) -> None:
+    """
+    Entry point of a forked worker: score everything its source returns.
+    :param make_source: Creates the worker's source after the fork
+    :param progress: Queue receiving (worker_id, messages, done, total, finished)
+    """
+    signal.signal(signal.SIGINT, shutdown_handler)
+    signal.signal(signal.SIGTERM, shutdown_handler)
+    source = make_source()
+    sink = ParquetPredictionSink(
+        root_dir=output_dir,
+        row_group_size=max(batch_size, consumer.PARQUET_ROW_GROUP_SIZE),
+        rotate_rows=consumer.PARQUET_ROTATE_ROWS,
+        compression=consumer.PARQUET_COMPRESSION,
+        max_queue_batches=4,
+    ).start()
+    decoder = consumer.create_decoder()
+    # No per-message logs; errors stay rate limited, counts go in the summary
+    message_log = MessageLogSampler(logger, rate=0)
+    error_log = MessageLogSampler(logger, level=logging.WARNING)
+    summary = PeriodicSummary(logger, interval=float("inf"), sampler=message_log)
+    scored = 0
+    try:
+        while running and not source.exhausted:
+            messages = source.consume(batch_size, timeout=1.0)
+            if messages:
+                batch = consumer.decode_messages(messages, decoder, error_log, summary)
+                if batch is not None:
+                    records = consumer.score_batch(
+                        batch, model_handle, message_log, error_log, summary)
+                    if records is not None:
+                        # Block instead of dropping: a backfill has no lag to protect
+                        while not sink.submit(records, timeout=1.0):
+                            if not sink.is_alive():
+                                raise RuntimeError("Parquet sink writer thread is not running")
+                        scored += len(records)
+            progress.put((worker_id, scored, *source.progress(), False))
+    finally:
+        sink.close()
+        done, total = source.progress()
+        source.close()
+        summary.log()
+        progress.put((worker_id, scored, done, total, True))
+
+
+class ProgressReporter:
+    """Aggregates worker progress and logs it with throughput and ETA."""
+
+    def __init__(self, workers: int, interval: float):
+        self.interval = interval
+        self.started = time.monotonic()
+        self._last_log = self.started
+        self._state = {worker_id: (0, 0, 0) for worker_id in range(workers)}
+        self.finished = set()
+
+    def update(self, worker_id: int, scored: int, done: int, total: int, finished: bool) -> None:
+        self._state[worker_id] = (scored, done, total)
+        if finished:
+            self.finished.add(worker_id)
+
+    def maybe_log(self) -> None:
+        if time.monotonic() - self._last_log >= self.interval:
+            self.log()
+
+    def log(self, message: str = "Backfill progress") -> None:
+        self._last_log = time.monotonic()
+        elapsed = self._last_log - self.started
+        scored = sum(state[0] for state in self._state.values())
+        done = sum(state[1] for state in self._state.values())
+        total = sum(state[2] for state in self._state.values())
+        fraction = done / total if total else 0.0
+        eta = elapsed * (1 - fraction) / fraction if fraction else None
+        logger.info(message, extra={"fields": {
+            "scored": scored,
+            "percent": round(100 * fraction, 1),
+            "messages_per_sec": round(scored / elapsed) if elapsed else 0,
+            "elapsed_seconds": round(elapsed),
+            "eta_seconds": None if eta is None else round(eta),
+            "workers_finished": len(self.finished),
+        }})
+
+
+def backfill(source_factories: List[Callable], model_handle: ModelHandle,
+             output_dir: str = BACKFILL_OUTPUT_DIR, batch_size: int = BACKFILL_BATCH_SIZE,
+             progress_interval: float = 10) -> int:
+    """
+    Fork one worker per source and wait for all of them.
+    :param source_factories: One callable per worker, creating its source
+    :param model_handle: Model scoring the messages, inherited by the workers
+    :return: 0 if every worker finished cleanly, 1 otherwise
+    """
+    context = multiprocessing.get_context("fork")
+    progress = context.Queue()
+    reporter = ProgressReporter(len(source_factories), progress_interval)
+    # Keep the model's pages shared copy-on-write, see supervisor.py
+    gc.collect()
+    gc.freeze()
+
+    processes = [
+        context.Process(
+            target=backfill_worker,
+            args=(worker_id, make_source, model_handle, output_dir, batch_size, progress),
+            name=f"backfill-worker-{worker_id}")
+        for worker_id, make_source in enumerate(source_factories)]
+    for process in processes:
+        process.start()
+
+    while len(reporter.finished) < len(processes):
+        try:
+            reporter.update(*progress.get(timeout=1.0))
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+        reporter.maybe_log()
+        if not running:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+    exit_code = 0
+    for process in processes:
+        process.join()
+        if process.exitcode != 0:
+            logger.warning("Backfill worker failed", extra={"fields": {
+                "worker": process.name, "exit_code": process.exitcode}})
+            exit_code = 1
+    reporter.log("Backfill finished" if exit_code == 0 and running else "Backfill stopped")
+    return exit_code
+
+
+def kafka_conf() -> dict:
+    return {
+        "bootstrap.servers": os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"),
+        "group.id": os.getenv("BACKFILL_GROUP_ID", "backfill"),
+    }
+
+
+def kafka_sources(args, workers: int) -> List[Callable]:
+    ranges = resolve_ranges(
+        kafka_conf(), args.topic,
+        partitions=args.partitions,
+        start_time_ms=None if args.from_time is None else parse_time(args.from_time),
+        end_time_ms=None if args.to_time is None else parse_time(args.to_time),
+        start_offset=args.from_offset,
+        end_offset=args.to_offset)
+    logger.info("Resolved offset ranges", extra={"fields": {
+        "topic": args.topic, "messages": sum(r.size for r in ranges),
+        "ranges": {r.partition: [r.start, r.end] for r in ranges}}})
+    return [
+        (lambda worker_ranges=worker_ranges: KafkaRangeSource(kafka_conf(), worker_ranges))
+        for worker_ranges in split_ranges(ranges, workers)]
+
+
+def file_sources(args, workers: int) -> List[Callable]:
+    start_time_ms = None if args.from_time is None else parse_time(args.from_time)
+    end_time_ms = None if args.to_time is None else parse_time(args.to_time)
+    return [
+        (lambda shard=shard: JsonlFileSource(
+            args.file, shard=shard, shards=workers,
+            start_time_ms=start_time_ms, end_time_ms=end_time_ms))
+        for shard in range(workers)]
+
+
+def load_model(version: Optional[str]) -> ModelHandle:
+    registry = consumer.create_model_registry()
+    return load_latest_model(registry, version)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--topic", default=os.getenv("KAFKA_TOPIC", "my-topic"))
+    parser.add_argument("--partitions", type=int, nargs="*", help="all by default")
+    parser.add_argument("--from-time", help="ISO 8601, UTC unless an offset is given")
+    parser.add_argument("--to-time", help="ISO 8601, exclusive")
+    parser.add_argument("--from-offset", type=int)
+    parser.add_argument("--to-offset", type=int, help="exclusive")
+    parser.add_argument("--file", help="replay this JSONL file instead of Kafka")
+    parser.add_argument("--model-version", help="latest version by default")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument("--output-dir", default=BACKFILL_OUTPUT_DIR)
+    parser.add_argument("--progress-interval", type=float, default=10)
+    args = parser.parse_args()
+
+    configure_logging()
+    signal.signal(signal.SIGINT, shutdown_handler)
+    signal.signal(signal.SIGTERM, shutdown_handler)
+
+    logger.info("Loading model...")
+    model_handle = load_model(args.model_version)
+    if args.file:
+        sources = file_sources(args, args.workers)
+    else:
+        sources = kafka_sources(args, args.workers)
+    if not sources:
+        logger.info("Nothing to backfill in the requested range")
+        sys.exit(0)
+
+    logger.info("Starting backfill", extra={"fields": {
+        "workers": len(sources), "batch_size": args.batch_size, "output_dir": args.output_dir,
+        "model_version": model_handle.current().version}})
+    sys.exit(backfill(sources, model_handle, args.output_dir, args.batch_size,
+                      args.progress_interval))
@@ -0,0 +1,125 @@
+"""
+Adaptive inference batch size.
+
+AdaptiveBatchController adjusts the number of messages scored per
+model.predict call every BATCH_ADJUST_INTERVAL seconds, from two signals:
+
+- the p99 latency of the batches processed since the last adjustment,
+  measured from the moment a batch was consumed until its records were
+  handed to the sink;
+- the total consumer lag reported by librdkafka (metrics.total_consumer_lag).
+
+Target SLO: p99 batch latency <= BATCH_LATENCY_TARGET_MS (250 ms by default).
+When the p99 goes over the target the batch size is halved; when the lag is
+above BATCH_LAG_HIGH_WATERMARK or still rising and the p99 has headroom it
+grows by half. Larger batches amortize per-call overhead and drain lag
+faster, smaller ones bound the time a message waits behind its batch.
+The sink flush size follows the batch size, so flushes are neither tiny
+under load nor delayed by a large fixed count at low traffic (the sink
+still flushes at least every SINK_FLUSH_INTERVAL seconds).
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+import numpy as np
+
+import metrics
+
+ADAPTIVE_BATCHING = os.getenv("ADAPTIVE_BATCHING", "false").lower() in ("1", "true", "yes")
+BATCH_LATENCY_TARGET_MS = float(os.getenv("BATCH_LATENCY_TARGET_MS", "250"))
+BATCH_SIZE_MIN = int(os.getenv("BATCH_SIZE_MIN", "10"))
+BATCH_SIZE_MAX = int(os.getenv("BATCH_SIZE_MAX", "5000"))
+BATCH_ADJUST_INTERVAL = float(os.getenv("BATCH_ADJUST_INTERVAL", "5"))
+# Lag (messages, summed over partitions) above which batches always grow
+BATCH_LAG_HIGH_WATERMARK = int(os.getenv("BATCH_LAG_HIGH_WATERMARK", "10000"))
+# Only grow while the p99 stays under this fraction of the target
+GROW_HEADROOM = 0.8
+WINDOW_SIZE = 1000
+
+logger = logging.getLogger("consumer.batch_controller")
+
+
+class AdaptiveBatchController:
+    """
+    AIMD-style controller: multiplicative decrease on latency, growth on lag.
+    record() may be called from any thread.
+    """
+
+    def __init__(
+        self,
+        initial_size: int,
+        min_size: int = BATCH_SIZE_MIN,
+        max_size: int = BATCH_SIZE_MAX,
+        target_p99_ms: float = BATCH_LATENCY_TARGET_MS,
+        lag_high_watermark: int = BATCH_LAG_HIGH_WATERMARK,
+        adjust_interval: float = BATCH_ADJUST_INTERVAL,
+        lag: Callable[[], Optional[int]] = metrics.total_consumer_lag,
+        on_change: Callable[[int], None] = None,
+    ):
+        """
+        :param initial_size: Batch size to start with
+        :param min_size: Smallest batch size
+        :param max_size: Largest batch size
+        :param target_p99_ms: p99 batch latency SLO
+        :param lag_high_watermark: Lag above which batches grow
+        :param adjust_interval: Seconds between adjustments
+        :param lag: Returns the current total consumer lag, None if unknown
+        :param on_change: Called with the new size after every change
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self.batch_size = max(min_size, min(max_size, initial_size))
+        self.target_p99 = target_p99_ms / 1000.0
+        self.lag_high_watermark = lag_high_watermark
+        self.adjust_interval = adjust_interval
+        self.lag = lag
+        self.on_change = on_change
+        self._latencies = deque(maxlen=WINDOW_SIZE)
+        self._lock = threading.Lock()
+        self._last_adjust = time.monotonic()
+        self._last_lag = None
+        metrics.INFERENCE_BATCH_TARGET.set(self.batch_size)
+        if on_change is not None:
+            on_change(self.batch_size)
+
+    def record(self, latency: float) -> None:
+        """
+        Record the latency of one processed batch and adjust the size if
+        adjust_interval has passed.
+        """
+        with self._lock:
+            self._latencies.append(latency)
+            if time.monotonic() - self._last_adjust >= self.adjust_interval:
+                self._adjust()
+
+    def _adjust(self) -> None:
+        self._last_adjust = time.monotonic()
+        if not self._latencies:
+            return
+        p99 = float(np.percentile(self._latencies, 99))
+        self._latencies.clear()
+        lag = self.lag()
+        lag_rising = lag is not None and self._last_lag is not None and lag > self._last_lag
+        self._last_lag = lag
+
+        size = self.batch_size
+        if p99 > self.target_p99:
+            size = max(self.min_size, size // 2)
+        elif p99 < self.target_p99 * GROW_HEADROOM and lag is not None and (
+                lag > self.lag_high_watermark or (lag_rising and lag > size)):
+            size = min(self.max_size, size + max(1, size // 2))
+
+        metrics.BATCH_LATENCY_P99.set(p99)
+        if size == self.batch_size:
+            return
+        logger.info("Batch size adjusted", extra={"fields": {
+            "previous_size": self.batch_size, "batch_size": size,
+            "p99_ms": round(p99 * 1000, 1), "lag": lag}})
+        self.batch_size = size
+        metrics.INFERENCE_BATCH_TARGET.set(size)
+        if self.on_change is not None:
+            self.on_change(size)
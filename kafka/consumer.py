@@ -1,32 +1,165 @@
+import logging
 import os
 import signal
 import time
-import json
-import threading
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple, Union
 
 import mlflow
+import numpy as np
 import pandas as pd
-from confluent_kafka import Consumer
+from confluent_kafka import Consumer, TopicPartition
 from mlflow.pyfunc import PyFuncModel
-from mlflow.tracking import MlflowClient
+
+import metrics
+from batch_controller import ADAPTIVE_BATCHING, AdaptiveBatchController
+from consumer_logging import MessageLogSampler, PeriodicSummary, configure_logging
+from decoders import DecodedBatch, JsonDecoder, SchemaDecoder, parse_schema
+from dedup import DedupIndex
+from feature_store import FeatureStore, parse_windows
+from model_cache import CachingModelRegistry, LocalModelCache
+from model_router import ModelRouter, ShadowScorer
+from model_watcher import (
+    LocalModelRegistry,
+    MlflowModelRegistry,
+    ModelHandle,
+    ModelWatcher,
+    load_latest_model,
+)
+from offsets import OffsetCommitter
+from pipeline import Pipeline
+from prediction_cache import LocalPredictionCache, RedisPredictionCache, cached_predictions
+from sinks import JsonlPredictionSink, ParquetPredictionSink, PredictionSink
+from sources import JsonlFileSource, ParquetFileSource, RateLimitedSource, SyntheticSource
 
 # Control flags
 running = True
 
-# Buffer for batch logging: List of tuples (input_data_dict, prediction)
-batch_buffer: List[Tuple[dict, any]] = []
-buffer_lock = threading.Lock()  # To avoid race conditions on buffer
+# The sink flushes after SINK_FLUSH_RECORDS records or SINK_FLUSH_INTERVAL
+# seconds, whichever comes first. With ADAPTIVE_BATCHING the record
+# threshold of the JSONL sink follows the batch size instead
+SINK_FLUSH_RECORDS = int(os.getenv("SINK_FLUSH_RECORDS", "1000"))
+SINK_FLUSH_INTERVAL = float(os.getenv("SINK_FLUSH_INTERVAL", "1"))
+SINK_FLUSH_BATCHES = 4
 
-BATCH_SIZE = 10           # Save after every 10 messages (adjust as needed)
-BATCH_SAVE_INTERVAL = 30  # Also save every 30 seconds if batch not full
+# "single" polls and scores one message at a time, "batch" scores micro-batches,
+# "pipeline" scores micro-batches with decoding and scoring on their own threads
+CONSUMER_MODE = os.getenv("CONSUMER_MODE", "single")
+# Micro-batch limits: score once N messages are collected or T ms have passed
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "500"))
+INFERENCE_BATCH_TIMEOUT_MS = int(os.getenv("INFERENCE_BATCH_TIMEOUT_MS", "200"))
+# Batches queued in front of each pipeline stage
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+# Model features as "name:dtype,..." (see decoders.py). When set, batches are
+# decoded straight into typed columns in this order
+FEATURE_SCHEMA = os.getenv("FEATURE_SCHEMA", "")
 
 LOG_FILE_PATH = "batch_predictions.jsonl"
 
+# "mlflow" serves MLFLOW_MODEL_NAME from the MLflow registry, "local" serves
+# the MLflow model directories under LOCAL_MODEL_DIR (see LocalModelRegistry)
+MODEL_REGISTRY = os.getenv("MODEL_REGISTRY", "mlflow")
+LOCAL_MODEL_DIR = os.getenv("LOCAL_MODEL_DIR", "models")
+# Seconds between checks for a new model version, 0 disables hot-reload
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", "60"))
+# Local cache of MLflow model artifacts, set MODEL_CACHE_DIR="" to disable
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "model_cache")
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# MLflow URI of a model scoring in place of the primary when it raises or
+# overruns PRIMARY_LATENCY_BUDGET_MS per batch (0: no budget), "" disables.
+# After FALLBACK_FAILURE_THRESHOLD failures in a row the primary is skipped
+# for FALLBACK_COOLDOWN seconds (see model_router.py)
+FALLBACK_MODEL_URI = os.getenv("FALLBACK_MODEL_URI", "")
+PRIMARY_LATENCY_BUDGET_MS = float(os.getenv("PRIMARY_LATENCY_BUDGET_MS", "0"))
+FALLBACK_FAILURE_THRESHOLD = int(os.getenv("FALLBACK_FAILURE_THRESHOLD", "3"))
+FALLBACK_COOLDOWN = float(os.getenv("FALLBACK_COOLDOWN", "30"))
+# MLflow URI of a model scoring SHADOW_SAMPLE_RATE of the records off the hot
+# path; both predictions are logged to SHADOW_LOG_PATH. "" disables
+SHADOW_MODEL_URI = os.getenv("SHADOW_MODEL_URI", "")
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.1"))
+SHADOW_LOG_PATH = os.getenv("SHADOW_LOG_PATH", "shadow_predictions.jsonl")
+
+# Cache of predictions for payloads already scored: "" disables it, "local"
+# keeps it in process, "redis" shares it between workers through
+# PREDICTION_CACHE_REDIS_URL (see prediction_cache.py)
+PREDICTION_CACHE = os.getenv("PREDICTION_CACHE", "")
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "100000"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "3600"))
+PREDICTION_CACHE_REDIS_URL = os.getenv("PREDICTION_CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# Payload field holding the transaction ID; when set, messages repeating an
+# ID already seen are dropped before scoring (see dedup.py)
+DEDUP_ID_FIELD = os.getenv("DEDUP_ID_FIELD", "")
+# IDs per Bloom filter generation and its false positive rate when full
+DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "1000000"))
+DEDUP_ERROR_RATE = float(os.getenv("DEDUP_ERROR_RATE", "0.001"))
+DEDUP_GENERATIONS = int(os.getenv("DEDUP_GENERATIONS", "2"))
+# Recent IDs remembered exactly, should cover the messages between two commits
+DEDUP_WINDOW = int(os.getenv("DEDUP_WINDOW", "100000"))
+# Directory of the index snapshots, "" keeps the index in memory only
+DEDUP_SNAPSHOT_DIR = os.getenv("DEDUP_SNAPSHOT_DIR", "dedup")
+DEDUP_SNAPSHOT_INTERVAL = float(os.getenv("DEDUP_SNAPSHOT_INTERVAL", "60"))
+
+# Comma-separated entity fields (e.g. "card_id,account_id"); when set, rolling
+# per-entity features over FEATURE_WINDOWS are added to every input before
+# scoring (see feature_store.py)
+FEATURE_ENTITY_FIELDS = os.getenv("FEATURE_ENTITY_FIELDS", "")
+FEATURE_WINDOWS = os.getenv("FEATURE_WINDOWS", "1m,1h,24h")
+FEATURE_AMOUNT_FIELD = os.getenv("FEATURE_AMOUNT_FIELD", "amount")
+# "" disables the distinct merchant features
+FEATURE_MERCHANT_FIELD = os.getenv("FEATURE_MERCHANT_FIELD", "merchant_id")
+FEATURE_MAX_ENTITIES = int(os.getenv("FEATURE_MAX_ENTITIES", "1000000"))
+# Directory of the feature store snapshots, "" keeps it in memory only
+FEATURE_SNAPSHOT_DIR = os.getenv("FEATURE_SNAPSHOT_DIR", "feature_store")
+FEATURE_SNAPSHOT_INTERVAL = float(os.getenv("FEATURE_SNAPSHOT_INTERVAL", "60"))
+# Which features are joined onto the model inputs: "model" the ones in
+# FEATURE_SCHEMA, or without a schema in the model's input signature; "all"
+# every feature, only for models trained on all of them; "none" no feature
+FEATURE_JOIN = os.getenv("FEATURE_JOIN", "model")
+
+# Where messages come from: "kafka", or for tests and profiling without a
+# broker "jsonl" / "parquet" (replay MESSAGE_SOURCE_PATH) or "synthetic"
+# (generated transactions, SYNTHETIC_MESSAGES of them, 0 for no end).
+# MESSAGE_SOURCE_RATE limits the messages per second, 0 for no limit
+MESSAGE_SOURCE = os.getenv("MESSAGE_SOURCE", "kafka")
+MESSAGE_SOURCE_PATH = os.getenv("MESSAGE_SOURCE_PATH", "")
+MESSAGE_SOURCE_RATE = float(os.getenv("MESSAGE_SOURCE_RATE", "0"))
+SYNTHETIC_MESSAGES = int(os.getenv("SYNTHETIC_MESSAGES", "0"))
+
+# Prometheus /metrics port, worker N of supervisor.py serves on METRICS_PORT + N
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8000"))
+# How often librdkafka reports statistics (consumer lag), 0 disables
+KAFKA_STATS_INTERVAL_MS = int(os.getenv("KAFKA_STATS_INTERVAL_MS", "5000"))
+# "auto" leaves offset commits to librdkafka, "sink" commits only offsets whose
+# predictions the sink has made durable (at-least-once, see offsets.py)
+OFFSET_COMMIT_MODE = os.getenv("OFFSET_COMMIT_MODE", "auto")
+OFFSET_COMMIT_INTERVAL_MS = int(os.getenv("OFFSET_COMMIT_INTERVAL_MS", "5000"))
+
+# "jsonl" appends to LOG_FILE_PATH, "parquet" writes partitioned Parquet
+# files under PARQUET_SINK_DIR for the monitoring jobs
+PREDICTION_SINK = os.getenv("PREDICTION_SINK", "jsonl")
+PARQUET_SINK_DIR = os.getenv("PARQUET_SINK_DIR", "predictions")
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+PARQUET_ROW_GROUP_SIZE = int(os.getenv("PARQUET_ROW_GROUP_SIZE", "10000"))
+PARQUET_ROTATE_ROWS = int(os.getenv("PARQUET_ROTATE_ROWS", "1000000"))
+
+# Prediction sink settings, see sinks.JsonlPredictionSink
+SINK_QUEUE_SIZE = int(os.getenv("SINK_QUEUE_SIZE", "1000"))  # in batches
+SINK_FSYNC_POLICY = os.getenv("SINK_FSYNC_POLICY", "never")
+SINK_FSYNC_INTERVAL = float(os.getenv("SINK_FSYNC_INTERVAL", "5"))
+SINK_ROTATE_BYTES = int(os.getenv("SINK_ROTATE_BYTES", "0"))
+SINK_ROTATE_SECONDS = float(os.getenv("SINK_ROTATE_SECONDS", "0"))
+# What to do when the sink queue is full: "pause" the assigned partitions
+# until it drains, or "drop" the batch
+SINK_BACKPRESSURE_POLICY = os.getenv("SINK_BACKPRESSURE_POLICY", "pause")
+
+
+logger = logging.getLogger("consumer")
+
 
 def shutdown_handler(sig, frame):
     global running
-    print("Shutdown signal received.")
+    logger.info("Shutdown signal received.")
     running = False
 
 
@@ -34,96 +167,748 @@ signal.signal(signal.SIGINT, shutdown_handler)
 signal.signal(signal.SIGTERM, shutdown_handler)
 
 
-def save_batch_to_file():
-    """Save buffered input and predictions to file in JSONL format."""
-    global batch_buffer
+def create_prediction_sink(worker_id: int = None) -> PredictionSink:
+    """
+    Create and start the sink predictions are written to.
+    :param worker_id: Set when running as one of several worker processes,
+        each worker then appends to its own JSONL file
+    """
+    if PREDICTION_SINK == "parquet":
+        sink = ParquetPredictionSink(
+            root_dir=PARQUET_SINK_DIR,
+            compression=PARQUET_COMPRESSION,
+            row_group_size=PARQUET_ROW_GROUP_SIZE,
+            rotate_rows=PARQUET_ROTATE_ROWS,
+            rotate_bytes=SINK_ROTATE_BYTES or 256 * 1024 * 1024,
+            rotate_seconds=SINK_ROTATE_SECONDS or 3600,
+            max_queue_batches=SINK_QUEUE_SIZE,
+            flush_interval=SINK_FLUSH_INTERVAL,
+        )
+        return sink.start()
 
-    with buffer_lock:
-        if not batch_buffer:
-            return
+    path = LOG_FILE_PATH
+    if worker_id is not None:
+        base, ext = os.path.splitext(LOG_FILE_PATH)
+        path = f"{base}.worker-{worker_id}{ext}"
+
+    sink = JsonlPredictionSink(
+        path=path,
+        fsync_policy=SINK_FSYNC_POLICY,
+        fsync_interval=SINK_FSYNC_INTERVAL,
+        rotate_bytes=SINK_ROTATE_BYTES,
+        rotate_seconds=SINK_ROTATE_SECONDS,
+        max_queue_batches=SINK_QUEUE_SIZE,
+        flush_records=SINK_FLUSH_RECORDS,
+        flush_interval=SINK_FLUSH_INTERVAL,
+    )
+    return sink.start()
 
-        with open(LOG_FILE_PATH, "a") as f:
-            for input_data, prediction in batch_buffer:
-                record = {
-                    "input": input_data,
-                    "prediction": prediction,
-                    "timestamp": time.time(),
-                }
-                f.write(json.dumps(record) + "\n")
 
-        print(f"Saved batch of {len(batch_buffer)} records to {LOG_FILE_PATH}")
-        batch_buffer.clear()
+def create_batch_controller(sink: PredictionSink) -> Optional[AdaptiveBatchController]:
+    """Batch size controller if ADAPTIVE_BATCHING is on, see batch_controller.py."""
+    if not ADAPTIVE_BATCHING:
+        return None
 
+    def on_change(batch_size: int) -> None:
+        # Parquet flushes write row groups, their size stays fixed
+        if isinstance(sink, JsonlPredictionSink):
+            sink.flush_records = batch_size * SINK_FLUSH_BATCHES
 
-def periodic_saver():
-    """Background thread to save batch every BATCH_SAVE_INTERVAL seconds."""
-    while running:
-        time.sleep(BATCH_SAVE_INTERVAL)
-        save_batch_to_file()
+    return AdaptiveBatchController(INFERENCE_BATCH_SIZE, on_change=on_change)
 
 
-def start_kafka_consumer() -> Consumer:
+def create_prediction_cache():
+    """Prediction cache configured by PREDICTION_CACHE, None if disabled."""
+    if PREDICTION_CACHE == "redis":
+        return RedisPredictionCache(PREDICTION_CACHE_REDIS_URL, PREDICTION_CACHE_TTL)
+    if PREDICTION_CACHE == "local":
+        return LocalPredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
+    return None
+
+
+def create_dedup_index(worker_id: int = None) -> Optional[DedupIndex]:
+    """Dedup index configured by DEDUP_ID_FIELD, None if disabled."""
+    if not DEDUP_ID_FIELD:
+        return None
+    snapshot_path = None
+    if DEDUP_SNAPSHOT_DIR:
+        name = "index.bin" if worker_id is None else f"worker-{worker_id}.bin"
+        snapshot_path = os.path.join(DEDUP_SNAPSHOT_DIR, name)
+    return DedupIndex(
+        capacity=DEDUP_CAPACITY,
+        error_rate=DEDUP_ERROR_RATE,
+        generations=DEDUP_GENERATIONS,
+        window=DEDUP_WINDOW,
+        snapshot_path=snapshot_path,
+        snapshot_interval=DEDUP_SNAPSHOT_INTERVAL,
+    )
+
+
+def create_feature_store(worker_id: int = None) -> Optional[FeatureStore]:
+    """Feature store configured by FEATURE_ENTITY_FIELDS, None if disabled."""
+    entity_fields = [field.strip() for field in FEATURE_ENTITY_FIELDS.split(",") if field.strip()]
+    if not entity_fields:
+        return None
+    snapshot_path = None
+    if FEATURE_SNAPSHOT_DIR:
+        name = "store.pkl" if worker_id is None else f"worker-{worker_id}.pkl"
+        snapshot_path = os.path.join(FEATURE_SNAPSHOT_DIR, name)
+    return FeatureStore(
+        entity_fields,
+        parse_windows(FEATURE_WINDOWS),
+        amount_field=FEATURE_AMOUNT_FIELD,
+        merchant_field=FEATURE_MERCHANT_FIELD or None,
+        max_entities=FEATURE_MAX_ENTITIES,
+        snapshot_path=snapshot_path,
+        snapshot_interval=FEATURE_SNAPSHOT_INTERVAL,
+        join=FEATURE_JOIN,
+        schema_names=[name for name, _ in parse_schema(FEATURE_SCHEMA)] if FEATURE_SCHEMA else None,
+    )
+
+
+def create_model_router() -> Optional[ModelRouter]:
+    """Primary/fallback router configured by FALLBACK_MODEL_URI, None if disabled."""
+    if not FALLBACK_MODEL_URI:
+        return None
+    fallback_model = mlflow.pyfunc.load_model(FALLBACK_MODEL_URI)
+    logger.info("Loaded fallback model", extra={"fields": {"model_uri": FALLBACK_MODEL_URI}})
+    return ModelRouter(
+        fallback_model,
+        FALLBACK_MODEL_URI,
+        predict_batch,
+        latency_budget_ms=PRIMARY_LATENCY_BUDGET_MS,
+        failure_threshold=FALLBACK_FAILURE_THRESHOLD,
+        cooldown=FALLBACK_COOLDOWN,
+    )
+
+
+def create_shadow_scorer(worker_id: int = None) -> Optional[ShadowScorer]:
+    """Shadow scorer configured by SHADOW_MODEL_URI, None if disabled."""
+    if not SHADOW_MODEL_URI:
+        return None
+    shadow_model = mlflow.pyfunc.load_model(SHADOW_MODEL_URI)
+    logger.info("Loaded shadow model", extra={"fields": {
+        "model_uri": SHADOW_MODEL_URI, "sample_rate": SHADOW_SAMPLE_RATE}})
+    path = SHADOW_LOG_PATH
+    if worker_id is not None:
+        base, ext = os.path.splitext(SHADOW_LOG_PATH)
+        path = f"{base}.worker-{worker_id}{ext}"
+    sink = JsonlPredictionSink(
+        path=path, flush_records=SINK_FLUSH_RECORDS, flush_interval=SINK_FLUSH_INTERVAL)
+    return ShadowScorer(
+        shadow_model, SHADOW_MODEL_URI, sink.start(), predict_batch,
+        sample_rate=SHADOW_SAMPLE_RATE).start()
+
+
+def create_decoder(features: FeatureStore = None) -> JsonDecoder:
+    """
+    Payload decoder, schema-aware when FEATURE_SCHEMA is set.
+    :param features: Feature store whose features in the schema are joined
+        at scoring instead of read from the payload
+    """
+    if FEATURE_SCHEMA:
+        derived = features.feature_names() if features is not None else ()
+        return SchemaDecoder(parse_schema(FEATURE_SCHEMA), derived=derived)
+    return JsonDecoder()
+
+
+def start_kafka_consumer(committer: OffsetCommitter = None) -> Consumer:
+    """
+    :param committer: Commits offsets on behalf of librdkafka, which then
+        runs with auto-commit disabled
+    """
     conf = {
         'bootstrap.servers': os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"),
         'group.id': os.getenv('KAFKA_GROUP_ID', 'my-group'),
         'auto.offset.reset': os.getenv('KAFKA_AUTO_OFFSET_RESET', 'earliest'),
     }
+    if KAFKA_STATS_INTERVAL_MS > 0:
+        conf['statistics.interval.ms'] = KAFKA_STATS_INTERVAL_MS
+        conf['stats_cb'] = metrics.record_kafka_stats
+    if committer is not None:
+        conf['enable.auto.commit'] = False
+        conf['on_commit'] = committer.on_commit
     consumer = Consumer(conf)
-    consumer.subscribe([os.getenv('KAFKA_TOPIC', 'my-topic')])
+    topics = [os.getenv('KAFKA_TOPIC', 'my-topic')]
+    if committer is not None:
+        consumer.subscribe(topics, on_revoke=committer.on_revoke)
+    else:
+        consumer.subscribe(topics)
     return consumer
 
 
-def read_messages_from_topic(consumer: Consumer, model: PyFuncModel) -> None:
-    import json
+def create_message_source(committer: OffsetCommitter = None):
+    """
+    Source configured by MESSAGE_SOURCE: a subscribed Kafka consumer, or one
+    of the sources of sources.py, which behave like one.
+    """
+    if MESSAGE_SOURCE == "kafka":
+        return start_kafka_consumer(committer)
+    if MESSAGE_SOURCE == "jsonl":
+        source = JsonlFileSource(MESSAGE_SOURCE_PATH)
+    elif MESSAGE_SOURCE == "parquet":
+        source = ParquetFileSource(MESSAGE_SOURCE_PATH)
+    elif MESSAGE_SOURCE == "synthetic":
+        source = SyntheticSource(SYNTHETIC_MESSAGES or None)
+    else:
+        raise ValueError(f"Unknown message source '{MESSAGE_SOURCE}'")
+    if MESSAGE_SOURCE_RATE > 0:
+        source = RateLimitedSource(source, MESSAGE_SOURCE_RATE)
+    return source
+
+
+def message_source(msg) -> dict:
+    """Kafka coordinates of a message, used to map predictions back to offsets."""
+    return {
+        "topic": msg.topic(),
+        "partition": msg.partition(),
+        "offset": msg.offset(),
+    }
+
+
+def make_record(input_data: dict, prediction, msg, model_version: str) -> dict:
+    """Build the record written to the sink for one prediction."""
+    return {
+        "input": input_data,
+        "prediction": prediction,
+        "model_version": model_version,
+        "timestamp": time.time(),
+        **message_source(msg),
+    }
+
+
+def deliver_to_sink(
+        consumer: Consumer, sink: PredictionSink, records: List[dict],
+        submit: Callable[..., bool] = None) -> None:
+    """
+    Hand records over to the sink without ever blocking silently.
+    If the sink queue is full, either drop the batch or pause the assigned
+    partitions and keep polling (so the group session stays alive) until the
+    writer thread has made room.
+    :param submit: sink.submit by default, sink.submit_failed to report
+        messages that were consumed but not scored
+    """
+    submit = submit or sink.submit
+    if submit(records):
+        return
+
+    metrics.ERRORS.labels("sink_full").inc()
+    if SINK_BACKPRESSURE_POLICY == "drop":
+        logger.warning("Sink queue full, dropping records",
+                       extra={"fields": {"records": len(records)}})
+        return
+    pause_until_accepted(consumer, sink, records, "Sink", submit)
+
+
+def failed_sources(messages: list) -> List[dict]:
+    """Kafka coordinates of messages that were consumed but not scored, for
+    sink.submit_failed: offsets are not committed past them."""
+    return [message_source(msg) for msg in messages]
+
+
+def pause_until_accepted(consumer: Consumer, target, item, name: str,
+                         submit: Callable[..., bool] = None) -> None:
+    """
+    Pause the assigned partitions and keep polling, so the group session
+    stays alive, until target accepts item.
+    :param target: PredictionSink or Pipeline, anything with
+        submit(item, timeout) and is_alive()
+    :param name: Name of the target in logs and errors
+    :param submit: Called instead of target.submit
+    """
+    submit = submit or target.submit
+    assignment = consumer.assignment()
+    consumer.pause(assignment)
+    logger.warning(f"{name} queue full, pausing consumption",
+                   extra={"fields": {"partitions": len(assignment)}})
+    try:
+        while not submit(item, timeout=0.1):
+            if not target.is_alive():
+                raise RuntimeError(f"{name} thread is not running")
+            msg = consumer.poll(timeout=0)
+            if msg is not None and not msg.error():
+                # Delivered by a partition assigned after the pause,
+                # rewind so it is consumed again once we resume
+                consumer.seek(TopicPartition(
+                    msg.topic(), msg.partition(), msg.offset()))
+    finally:
+        consumer.resume(assignment)
+        logger.info(f"{name} queue drained, resuming consumption")
+
+
+def create_log_helpers(model_handle: ModelHandle, sink: PredictionSink):
+    """
+    Samplers for per-message and per-error logs, and the periodic summary
+    that reports throughput instead of logging every message.
+    """
+    message_log = MessageLogSampler(logger)
+    error_log = MessageLogSampler(logger, level=logging.WARNING)
+    summary = PeriodicSummary(logger, sampler=message_log, fields=lambda: {
+        "sink_queue_depth": sink.queue_depth(),
+        "model_version": model_handle.current().version,
+    })
+    return message_log, error_log, summary
+
 
+def read_messages_from_topic(
+        consumer: Consumer, model_handle: ModelHandle, sink: PredictionSink,
+        decoder: JsonDecoder = None, committer: OffsetCommitter = None,
+        cache=None, dedup: DedupIndex = None, features: FeatureStore = None,
+        router: ModelRouter = None, shadow: ShadowScorer = None) -> None:
+    decoder = decoder or JsonDecoder()
+    message_log, error_log, summary = create_log_helpers(model_handle, sink)
     try:
         while running:
+            summary.maybe_log()
+            if committer is not None:
+                committer.maybe_commit(consumer)
             msg = consumer.poll(timeout=1.0)
             if msg is None:
                 continue
             if msg.error():
-                print(f"Kafka error: {msg.error()}")
+                metrics.ERRORS.labels("kafka").inc()
+                summary.add("errors")
+                if error_log.sample():
+                    logger.warning("Kafka error", extra={"fields": {"error": str(msg.error())}})
                 continue
 
-            raw_value = msg.value().decode('utf-8')
-            print(f"Received message: {raw_value}")
+            metrics.MESSAGES_CONSUMED.inc()
+            summary.add("messages")
 
             try:
-                input_data = json.loads(raw_value)
-                prediction = predict(model, input_data)
-                print(f"Prediction: {prediction}")
+                start = time.perf_counter()
+                input_data = decoder.decode(msg.value())
+                metrics.DECODE_SECONDS.observe(time.perf_counter() - start)
+            except Exception as e:
+                metrics.ERRORS.labels("decode").inc()
+                summary.add("errors")
+                if error_log.sample():
+                    logger.warning("Error decoding message", extra={"fields": {
+                        "error": str(e), **message_source(msg)}})
+                continue
+
+            if dedup is not None and dedup.check(input_data.get(DEDUP_ID_FIELD), msg):
+                summary.add("duplicates")
+                continue
+            if features is not None:
+                feature_row = features.features([input_data], [msg])[0]
 
-                with buffer_lock:
-                    batch_buffer.append((input_data, prediction))
+            try:
+                model, model_version = model_handle.current()
+                if features is not None:
+                    for name in features.joined_names(model, model_version):
+                        input_data[name] = feature_row[name]
+                # Version of the model that made the prediction
+                scored_by = [model_version]
 
-                    if len(batch_buffer) >= BATCH_SIZE:
-                        save_batch_to_file()
+                def predict_misses(misses: List[int]) -> list:
+                    prediction, scored_by[0] = predict_one(
+                        model, model_version, input_data, router)
+                    return [prediction]
 
+                start = time.perf_counter()
+                if cache is None:
+                    prediction = predict_misses([0])[0]
+                else:
+                    prediction = cached_predictions(
+                        cache, model_version, [input_data], predict_misses,
+                        cacheable=lambda: scored_by[0] == model_version)[0]
+                metrics.PREDICT_SECONDS.observe(time.perf_counter() - start)
+                model_version = scored_by[0]
             except Exception as e:
-                print(f"Error processing message: {e}")
+                metrics.ERRORS.labels("predict").inc()
+                summary.add("errors")
+                if error_log.sample():
+                    logger.warning("Error processing message", extra={"fields": {
+                        "error": str(e), **message_source(msg)}})
+                deliver_to_sink(consumer, sink, failed_sources([msg]), sink.submit_failed)
+                continue
+
+            metrics.BATCH_SIZE.observe(1)
+            metrics.PREDICTIONS.inc()
+            summary.add("predictions")
+            if message_log.sample():
+                logger.debug("Scored message", extra={"fields": {
+                    "input": input_data, "prediction": prediction,
+                    "model_version": model_version, **message_source(msg)}})
+
+            record = make_record(input_data, prediction, msg, model_version)
+            deliver_to_sink(consumer, sink, [record])
+            if shadow is not None:
+                shadow.offer([record], [input_data])
 
     finally:
-        print("Closing Kafka consumer...")
-        consumer.close()
-        # Save remaining data on shutdown
-        save_batch_to_file()
+        summary.log()
 
 
-def get_latest_model_from_mlflow(model_name: str) -> PyFuncModel:
-    client = MlflowClient()
-    latest_versions = client.get_latest_versions(name=model_name, stages=["Production"])
+def consume_batch(consumer: Consumer, max_messages: int, timeout_ms: int) -> list:
+    """
+    Collect up to max_messages messages, waiting at most timeout_ms in total.
+    :param consumer: Subscribed Kafka consumer
+    :param max_messages: Maximum number of messages in the batch
+    :param timeout_ms: Maximum time to wait for the batch to fill up
+    :return: List of Kafka messages (may be empty)
+    """
+    messages = []
+    deadline = time.monotonic() + timeout_ms / 1000.0
+    while running and len(messages) < max_messages:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        messages.extend(consumer.consume(
+            num_messages=max_messages - len(messages), timeout=remaining))
+    return messages
 
-    if not latest_versions:
-        versions = client.search_model_versions(f"name='{model_name}'")
-        latest_version = max(versions, key=lambda v: int(v.version))
-    else:
-        latest_version = latest_versions[0]
 
-    print(f"Latest model version: {latest_version.version}, stage: {latest_version.current_stage}")
+def decode_messages(messages: list, decoder: JsonDecoder, error_log: MessageLogSampler,
+                    summary: PeriodicSummary) -> Optional[DecodedBatch]:
+    """
+    Decode one batch of Kafka messages, counting and logging the messages
+    that carry a Kafka error or fail to decode.
+    :return: The decoded batch, None if no message was valid
+    """
+    start = time.perf_counter()
+    valid_messages = []
+    for msg in messages:
+        if msg.error():
+            metrics.ERRORS.labels("kafka").inc()
+            summary.add("errors")
+            if error_log.sample():
+                logger.warning("Kafka error", extra={"fields": {"error": str(msg.error())}})
+            continue
+        valid_messages.append(msg)
+    batch = decoder.decode_batch(valid_messages)
+    for msg, e in batch.errors:
+        metrics.ERRORS.labels("decode").inc()
+        summary.add("errors")
+        if error_log.sample():
+            logger.warning("Error decoding message", extra={"fields": {
+                "error": str(e), **message_source(msg)}})
+    metrics.DECODE_SECONDS.observe(time.perf_counter() - start)
+    return batch if batch.inputs else None
 
-    model_uri = f"models:/{model_name}/{latest_version.version}"
-    model = mlflow.pyfunc.load_model(model_uri)
-    return model
+
+def drop_duplicates(batch: DecodedBatch, dedup: DedupIndex,
+                    summary: PeriodicSummary) -> Optional[DecodedBatch]:
+    """
+    Remove the messages repeating a transaction ID from a decoded batch.
+    :return: The batch without duplicates, None if nothing is left
+    """
+    keep = [
+        i for i, (input_data, msg) in enumerate(zip(batch.inputs, batch.messages))
+        if not dedup.check(input_data.get(DEDUP_ID_FIELD), msg)
+    ]
+    if len(keep) == len(batch.inputs):
+        return batch
+    summary.add("duplicates", len(batch.inputs) - len(keep))
+    if not keep:
+        return None
+    return DecodedBatch(
+        [batch.inputs[i] for i in keep],
+        [batch.messages[i] for i in keep],
+        None if batch.frame is None else batch.frame.iloc[keep].reset_index(drop=True),
+        batch.errors,
+    )
+
+
+def add_features(batch: DecodedBatch, features: FeatureStore) -> DecodedBatch:
+    """Compute the rolling features of every message, joined by score_batch."""
+    return batch._replace(features=features.features(batch.inputs, batch.messages))
+
+
+def join_features(batch: DecodedBatch, names: List[str]) -> DecodedBatch:
+    """
+    Join the named rolling features onto the batch inputs and frame. Schema
+    columns keep their place and dtype, other features are appended.
+    """
+    if not names or batch.features is None:
+        return batch
+    for input_data, row in zip(batch.inputs, batch.features):
+        for name in names:
+            input_data[name] = row[name]
+    if batch.frame is None:
+        return batch
+    columns = {}
+    for name in names:
+        values = [row[name] for row in batch.features]
+        dtype = batch.frame[name].dtype if name in batch.frame else None
+        columns[name] = np.asarray(values, dtype=dtype)
+    return batch._replace(frame=batch.frame.assign(**columns))
+
+
+def prepare_batch(batch: Optional[DecodedBatch], dedup: Optional[DedupIndex],
+                  features: Optional[FeatureStore],
+                  summary: PeriodicSummary) -> Optional[DecodedBatch]:
+    """Drop duplicates from a decoded batch, then compute the rolling features."""
+    if batch is not None and dedup is not None:
+        batch = drop_duplicates(batch, dedup, summary)
+    if batch is not None and features is not None:
+        batch = add_features(batch, features)
+    return batch
+
+
+def score_batch(batch: DecodedBatch, model_handle: ModelHandle, message_log: MessageLogSampler,
+                error_log: MessageLogSampler, summary: PeriodicSummary,
+                cache=None, router: ModelRouter = None,
+                shadow: ShadowScorer = None,
+                features: FeatureStore = None) -> Optional[List[dict]]:
+    """
+    Score a decoded batch with one model.predict call.
+    :param cache: Prediction cache, only the inputs it misses are scored
+    :param router: Routes to the fallback model when the primary fails
+    :param shadow: Shadow scorer offered a sample of the records
+    :param features: Store that computed the batch features (add_features),
+        the ones the model takes are joined onto its inputs
+    :return: Prediction records for the sink, None if the model failed
+    """
+    # The whole batch is scored and tagged with the same model, even
+    # if the watcher swaps in a new version meanwhile
+    model, model_version = model_handle.current()
+    if features is not None:
+        batch = join_features(batch, features.joined_names(model, model_version))
+    model_inputs = batch.inputs if batch.frame is None else batch.frame
+    fallback_rows = []
+
+    def predict_rows(rows: Optional[List[int]] = None) -> list:
+        if rows is None:
+            inputs = model_inputs
+        elif batch.frame is None:
+            inputs = [batch.inputs[i] for i in rows]
+        else:
+            inputs = batch.frame.iloc[rows]
+        if router is None:
+            return predict_batch(model, inputs)
+        predictions, version = router.predict(model, model_version, inputs)
+        if version != model_version:
+            fallback_rows.extend(range(len(batch.inputs)) if rows is None else rows)
+        return predictions
+
+    try:
+        start = time.perf_counter()
+        if cache is None:
+            predictions = predict_rows()
+        else:
+            predictions = cached_predictions(
+                cache, model_version, batch.inputs, predict_rows,
+                cacheable=lambda: not fallback_rows)
+        metrics.PREDICT_SECONDS.observe(time.perf_counter() - start)
+    except Exception as e:
+        metrics.ERRORS.labels("predict").inc()
+        summary.add("errors")
+        if error_log.sample():
+            logger.warning("Error processing batch", extra={"fields": {
+                "error": str(e), "batch_size": len(batch.inputs)}})
+        return None
+    metrics.BATCH_SIZE.observe(len(batch.inputs))
+    metrics.PREDICTIONS.inc(len(predictions))
+    summary.add("predictions", len(predictions))
+    summary.add("batches")
+    if message_log.sample():
+        logger.debug("Scored batch", extra={"fields": {
+            "batch_size": len(batch.inputs), "model_version": model_version,
+            "first": message_source(batch.messages[0]),
+            "last": message_source(batch.messages[-1])}})
+
+    versions = [model_version] * len(predictions)
+    for i in fallback_rows:
+        versions[i] = router.fallback_version
+    records = [
+        make_record(input_data, prediction, msg, version)
+        for input_data, prediction, msg, version
+        in zip(batch.inputs, predictions, batch.messages, versions)
+    ]
+    if shadow is not None:
+        shadow.offer(records, model_inputs)
+    return records
+
+
+def read_messages_in_batches(
+    consumer: Consumer,
+    model_handle: ModelHandle,
+    sink: PredictionSink,
+    batch_size: int = INFERENCE_BATCH_SIZE,
+    batch_timeout_ms: int = INFERENCE_BATCH_TIMEOUT_MS,
+    decoder: JsonDecoder = None,
+    committer: OffsetCommitter = None,
+    controller: AdaptiveBatchController = None,
+    cache=None,
+    dedup: DedupIndex = None,
+    features: FeatureStore = None,
+    router: ModelRouter = None,
+    shadow: ShadowScorer = None,
+) -> None:
+    """
+    Micro-batched variant of read_messages_from_topic: every batch is decoded
+    into a single DataFrame and scored with one model.predict call.
+    :param consumer: Subscribed Kafka consumer
+    :param model_handle: Handle to the model used for predictions
+    :param sink: Sink the prediction records are written to
+    :param batch_size: Maximum number of messages scored together
+    :param batch_timeout_ms: Maximum time spent collecting one batch
+    :param decoder: Payload decoder, schemaless JSON by default
+    :param committer: Offset committer when auto-commit is disabled
+    :param controller: Adaptive batch size controller, overrides batch_size
+    :param cache: Prediction cache, see prediction_cache.py
+    :param dedup: Index dropping repeated transactions before scoring
+    :param features: Store of rolling features joined onto the inputs
+    :param router: Routes to the fallback model when the primary fails
+    :param shadow: Shadow scorer offered a sample of the records
+    """
+    decoder = decoder or JsonDecoder()
+    message_log, error_log, summary = create_log_helpers(model_handle, sink)
+    try:
+        while running:
+            summary.maybe_log()
+            if committer is not None:
+                committer.maybe_commit(consumer)
+            if controller is not None:
+                batch_size = controller.batch_size
+            messages = consume_batch(consumer, batch_size, batch_timeout_ms)
+            if not messages:
+                continue
+            started = time.perf_counter()
+            metrics.MESSAGES_CONSUMED.inc(len(messages))
+            summary.add("messages", len(messages))
+
+            batch = prepare_batch(
+                decode_messages(messages, decoder, error_log, summary), dedup, features, summary)
+            if batch is None:
+                continue
+            records = score_batch(
+                batch, model_handle, message_log, error_log, summary, cache, router, shadow,
+                features)
+            if records is not None:
+                deliver_to_sink(consumer, sink, records)
+            else:
+                deliver_to_sink(consumer, sink, failed_sources(batch.messages),
+                                sink.submit_failed)
+            if controller is not None:
+                controller.record(time.perf_counter() - started)
+
+    finally:
+        summary.log()
+
+
+def read_messages_pipelined(
+    consumer: Consumer,
+    model_handle: ModelHandle,
+    sink: PredictionSink,
+    batch_size: int = INFERENCE_BATCH_SIZE,
+    batch_timeout_ms: int = INFERENCE_BATCH_TIMEOUT_MS,
+    decoder: JsonDecoder = None,
+    committer: OffsetCommitter = None,
+    controller: AdaptiveBatchController = None,
+    cache=None,
+    dedup: DedupIndex = None,
+    features: FeatureStore = None,
+    router: ModelRouter = None,
+    shadow: ShadowScorer = None,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+) -> None:
+    """
+    Same processing as read_messages_in_batches, split into pipeline stages
+    (see pipeline.py): this thread only polls, decoding and scoring run on
+    their own threads and the sink writes on its own.
+    :param queue_size: Batches queued in front of each stage
+    Other parameters as in read_messages_in_batches.
+    """
+    decoder = decoder or JsonDecoder()
+    message_log, error_log, summary = create_log_helpers(model_handle, sink)
+
+    def submit_records(records: List[dict], submit: Callable[..., bool] = None) -> None:
+        # Runs on the predict stage: wait for the sink instead of pausing
+        # the consumer, the full pipeline queue makes this thread pause
+        submit = submit or sink.submit
+        if submit(records):
+            return
+        metrics.ERRORS.labels("sink_full").inc()
+        if SINK_BACKPRESSURE_POLICY == "drop":
+            logger.warning("Sink queue full, dropping records",
+                           extra={"fields": {"records": len(records)}})
+            return
+        while not submit(records, timeout=0.1):
+            if not sink.is_alive():
+                raise RuntimeError("Prediction sink writer thread is not running")
+
+    # Items carry the time their messages were consumed, for the controller
+    def decode_stage(item: Tuple[float, list]) -> Optional[Tuple[float, DecodedBatch]]:
+        started, messages = item
+        batch = prepare_batch(
+            decode_messages(messages, decoder, error_log, summary), dedup, features, summary)
+        return None if batch is None else (started, batch)
+
+    def predict_stage(item: Tuple[float, DecodedBatch]) -> None:
+        started, batch = item
+        records = score_batch(
+            batch, model_handle, message_log, error_log, summary, cache, router, shadow,
+            features)
+        if records is not None:
+            submit_records(records)
+        else:
+            submit_records(failed_sources(batch.messages), sink.submit_failed)
+        if controller is not None:
+            controller.record(time.perf_counter() - started)
+
+    def stage_failed(stage: str, item: tuple) -> None:
+        # The stage raised, its messages were neither scored nor reported
+        messages = item[1] if stage == "decode" else item[1].messages
+        submit_records(failed_sources(messages), sink.submit_failed)
+
+    pipeline = Pipeline([
+        ("decode", decode_stage),
+        ("predict", predict_stage),
+    ], queue_size, on_error=stage_failed).start()
+    try:
+        while running:
+            summary.maybe_log()
+            if committer is not None:
+                committer.maybe_commit(consumer)
+            if controller is not None:
+                batch_size = controller.batch_size
+            messages = consume_batch(consumer, batch_size, batch_timeout_ms)
+            if not messages:
+                continue
+            item = (time.perf_counter(), messages)
+            metrics.MESSAGES_CONSUMED.inc(len(messages))
+            summary.add("messages", len(messages))
+
+            # A full pipeline is the normal steady state when scoring is the
+            # bottleneck: wait a little before falling back to pausing. The
+            # group session is kept alive by librdkafka's background thread
+            if not pipeline.submit(item, timeout=1.0):
+                pause_until_accepted(consumer, pipeline, item, "Pipeline")
+
+    finally:
+        # Score and hand over to the sink everything already consumed
+        pipeline.close()
+        summary.log()
+
+
+def create_model_registry():
+    """Registry the model is loaded and hot-reloaded from, see MODEL_REGISTRY."""
+    if MODEL_REGISTRY == "local":
+        return LocalModelRegistry(LOCAL_MODEL_DIR)
+    registry = MlflowModelRegistry(os.getenv("MLFLOW_MODEL_NAME", "your_model_name"))
+    if MODEL_CACHE_DIR:
+        registry = CachingModelRegistry(
+            registry, LocalModelCache(MODEL_CACHE_DIR, MODEL_CACHE_MAX_BYTES))
+    return registry
+
+
+def load_startup_model(registry) -> ModelHandle:
+    """
+    Load the model to start with. With the model cache and hot-reload
+    enabled, the version served last time is loaded straight from disk
+    without contacting the registry; the watcher then checks for a newer
+    version in the background.
+    """
+    if MODEL_RELOAD_INTERVAL > 0 and isinstance(registry, CachingModelRegistry):
+        version = registry.cached_version()
+        if version is not None:
+            logger.info("Starting from cached model version",
+                        extra={"fields": {"model_version": version}})
+            return load_latest_model(registry, version)
+    return load_latest_model(registry)
 
 
 def predict(model: PyFuncModel, input_data: dict):
@@ -134,20 +919,112 @@ def predict(model: PyFuncModel, input_data: dict):
     return prediction
 
 
-if __name__ == "__main__":
-    model_name = os.getenv("MLFLOW_MODEL_NAME", "your_model_name")
+def predict_one(model: PyFuncModel, model_version: str, input_data: dict,
+                router: ModelRouter = None) -> Tuple[object, str]:
+    """
+    Score one input, through the router when there is one.
+    :return: The prediction and the version of the model that made it
+    """
+    if router is None:
+        return predict(model, input_data), model_version
+    predictions, version = router.predict(model, model_version, [input_data])
+    return predictions[0], version
 
-    print("Loading model from MLflow...")
-    model = get_latest_model_from_mlflow(model_name)
 
-    # Start periodic saver thread
-    saver_thread = threading.Thread(target=periodic_saver, daemon=True)
-    saver_thread.start()
+def predict_batch(model: PyFuncModel, inputs: Union[List[dict], pd.DataFrame]) -> list:
+    """
+    Score a list of inputs with a single model.predict call.
+    :param model: Model used for predictions
+    :param inputs: Decoded input records, or a DataFrame already built by
+        a SchemaDecoder
+    :return: One prediction per input, in the same order
+    """
+    if isinstance(inputs, pd.DataFrame):
+        input_df = inputs
+    else:
+        input_df = pd.DataFrame.from_records(inputs)
+    predictions = model.predict(input_df)
+    if isinstance(predictions, pd.DataFrame):
+        predictions = predictions.to_dict(orient="records")
+    else:
+        predictions = np.asarray(predictions).tolist()
+    if len(predictions) != len(inputs):
+        raise ValueError(
+            f"Model returned {len(predictions)} predictions "
+            f"for {len(inputs)} inputs")
+    return predictions
+
+
+def run_consumer(model_handle: ModelHandle, registry, worker_id: int = None) -> None:
+    """
+    Consume and score messages until shutdown, then drain the sink.
+    :param model_handle: Handle to the model used for predictions
+    :param registry: Registry polled for new model versions
+    :param worker_id: Worker number when started by supervisor.py
+    """
+    metrics.start_metrics_server(METRICS_PORT + (worker_id or 0))
+
+    watcher = None
+    if MODEL_RELOAD_INTERVAL > 0:
+        watcher = ModelWatcher(registry, model_handle, MODEL_RELOAD_INTERVAL).start()
+
+    sink = create_prediction_sink(worker_id)
+    metrics.SINK_QUEUE_DEPTH.set_function(sink.queue_depth)
+
+    features = create_feature_store(worker_id)
+    decoder = create_decoder(features)
+    cache = create_prediction_cache()
+    dedup = create_dedup_index(worker_id)
+    router = create_model_router()
+    shadow = create_shadow_scorer(worker_id)
+    committer = None
+    if OFFSET_COMMIT_MODE == "sink" and MESSAGE_SOURCE == "kafka":
+        committer = OffsetCommitter(sink, OFFSET_COMMIT_INTERVAL_MS / 1000.0)
 
-    print("Starting Kafka consumer...")
-    consumer = start_kafka_consumer()
+    logger.info("Starting consumer...", extra={"fields": {"source": MESSAGE_SOURCE}})
+    consumer = create_message_source(committer)
+
+    try:
+        if CONSUMER_MODE == "pipeline":
+            read_messages_pipelined(
+                consumer, model_handle, sink, decoder=decoder, committer=committer,
+                controller=create_batch_controller(sink), cache=cache, dedup=dedup,
+                features=features, router=router, shadow=shadow)
+        elif CONSUMER_MODE == "batch":
+            read_messages_in_batches(
+                consumer, model_handle, sink, decoder=decoder, committer=committer,
+                controller=create_batch_controller(sink), cache=cache, dedup=dedup,
+                features=features, router=router, shadow=shadow)
+        else:
+            read_messages_from_topic(
+                consumer, model_handle, sink, decoder=decoder, committer=committer,
+                cache=cache, dedup=dedup, features=features, router=router, shadow=shadow)
+    finally:
+        if watcher is not None:
+            watcher.stop(timeout=5)
+        if router is not None:
+            router.close()
+        if shadow is not None:
+            shadow.close(timeout=10)
+        # Write out everything still queued on shutdown
+        sink.close()
+        logger.info("Prediction sink closed",
+                    extra={"fields": {"records_written": sink.records_written}})
+        if committer is not None:
+            committer.commit(consumer, asynchronous=False)
+        if dedup is not None:
+            dedup.close()
+        if features is not None:
+            features.close()
+        logger.info("Closing message source...")
+        consumer.close()
+
+
+if __name__ == "__main__":
+    configure_logging()
+    registry = create_model_registry()
 
-    read_messages_from_topic(consumer, model)
+    logger.info("Loading model...")
+    model_handle = load_startup_model(registry)
 
-    # Wait for saver thread to finish if needed (optional)
-    saver_thread.join(timeout=5)
+    run_consumer(model_handle, registry)
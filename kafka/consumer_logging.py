@@ -0,0 +1,143 @@
+"""
+Structured logging for the consumer.
+
+Everything goes through the standard logging module. LOG_FORMAT=json emits
+one JSON object per line, with the fields passed as extra={"fields": {...}}
+merged in; LOG_FORMAT=text prints them as key=value pairs.
+
+Per-message logs (raw payloads, predictions) go through a MessageLogSampler:
+they are DEBUG-level and rate limited to MESSAGE_LOG_RATE per second. When
+DEBUG is off the sampler's enabled flag is False, so the hot path pays a
+single attribute check and never builds the log message. Throughput is
+reported instead by a PeriodicSummary every LOG_SUMMARY_INTERVAL seconds.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Maximum per-message log lines per second, 0 disables them
+MESSAGE_LOG_RATE = float(os.getenv("MESSAGE_LOG_RATE", "10"))
+LOG_SUMMARY_INTERVAL = float(os.getenv("LOG_SUMMARY_INTERVAL", "30"))
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, as_json: bool = True):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", None) or {}
+        if not self.as_json:
+            line = (f"{self.formatTime(record)} {record.levelname} "
+                    f"{record.name}: {record.getMessage()}")
+            if fields:
+                line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+            if record.exc_info:
+                line += "\n" + self.formatException(record.exc_info)
+            return line
+
+        entry = {
+            "timestamp": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **fields,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT) -> None:
+    """Send all consumer logs to stdout in the configured format."""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(StructuredFormatter(as_json=log_format == "json"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper())
+
+
+class MessageLogSampler:
+    """
+    Token bucket for per-message logs. Call sample() before building a
+    per-message log line; it returns False when logging at this level is
+    disabled or the rate limit is exhausted. Skipped lines are counted and
+    reported by PeriodicSummary.
+    """
+
+    def __init__(self, logger: logging.Logger, rate: float = MESSAGE_LOG_RATE,
+                 level: int = logging.DEBUG):
+        self.logger = logger
+        self.level = level
+        self.rate = rate
+        self.enabled = rate > 0 and logger.isEnabledFor(level)
+        self.suppressed = 0
+        self._tokens = rate
+        self._last_refill = time.monotonic()
+
+    def sample(self) -> bool:
+        if not self.enabled:
+            return False
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+        if self._tokens < 1:
+            self.suppressed += 1
+            return False
+        self._tokens -= 1
+        return True
+
+
+class PeriodicSummary:
+    """
+    Aggregates counters on the hot path and logs them, with per-second
+    rates, once every interval seconds. The fields callable adds gauges
+    (queue depth, model version...) that are only read when logging.
+    Counters may be added from several threads.
+    """
+
+    def __init__(self, logger: logging.Logger, interval: float = LOG_SUMMARY_INTERVAL,
+                 sampler: MessageLogSampler = None, fields: Callable[[], dict] = None):
+        self.logger = logger
+        self.interval = interval
+        self.sampler = sampler
+        self.fields = fields
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+    def add(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counts[name] += amount
+
+    def maybe_log(self) -> None:
+        """Log and reset the counters if the interval has passed."""
+        elapsed = time.monotonic() - self._started
+        if elapsed < self.interval:
+            return
+        self.log(elapsed)
+
+    def log(self, elapsed: float = None) -> None:
+        if elapsed is None:
+            elapsed = time.monotonic() - self._started
+        with self._lock:
+            counts = dict(self.counts)
+            self.counts.clear()
+        summary = dict(counts)
+        for name, count in counts.items():
+            summary[f"{name}_per_sec"] = round(count / elapsed, 2) if elapsed else 0.0
+        if self.sampler is not None and self.sampler.suppressed:
+            summary["suppressed_message_logs"] = self.sampler.suppressed
+            self.sampler.suppressed = 0
+        summary["interval_seconds"] = round(elapsed, 2)
+        if self.fields is not None:
+            summary.update(self.fields())
+        self.logger.info("Consumer summary", extra={"fields": summary})
+        self._started = time.monotonic()
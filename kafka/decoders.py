@@ -0,0 +1,143 @@
+"""
+Decoders turning Kafka message payloads into model inputs.
+
+JsonDecoder parses straight from the message bytes, with orjson when it is
+installed and the standard json module otherwise. SchemaDecoder additionally
+knows the model's features and their dtypes: a batch is decoded into
+preallocated numpy columns and handed to the model as a DataFrame built
+from those columns, skipping the generic list-of-dicts to DataFrame
+conversion.
+
+A schema is declared as comma separated name:dtype pairs, e.g.
+    FEATURE_SCHEMA="amount:float64,merchant_category:int64,hour:int64"
+"""
+import json
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_dumps(value) -> bytes:
+    return json.dumps(value).encode("utf-8")
+
+
+if orjson is not None:
+    loads = orjson.loads
+    dumps = orjson.dumps
+    JSON_BACKEND = "orjson"
+else:
+    loads = json.loads
+    dumps = _json_dumps
+    JSON_BACKEND = "json"
+
+
+class DecodedBatch(NamedTuple):
+    inputs: List[dict]      # decoded payloads of the valid messages
+    messages: list          # Kafka messages the inputs came from, same order
+    frame: Optional[pd.DataFrame]  # model input, None without a schema
+    errors: List[Tuple[object, Exception]]  # (message, error) of invalid messages
+    # rolling features of every input (see feature_store.py), joined at scoring
+    features: Optional[List[dict]] = None
+
+
+def parse_schema(spec: str) -> List[Tuple[str, np.dtype]]:
+    """
+    Parse a "name:dtype,name:dtype" schema declaration.
+    :param spec: Schema declaration, the dtype defaults to float64
+    :return: List of (feature name, numpy dtype) in model input order
+    """
+    schema = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, dtype = item.partition(":")
+        schema.append((name.strip(), np.dtype(dtype.strip() or "float64")))
+    if not schema:
+        raise ValueError(f"Empty feature schema: {spec!r}")
+    return schema
+
+
+class JsonDecoder:
+    """Schemaless decoder: every message becomes a dict of its JSON fields."""
+
+    def decode(self, value: bytes) -> dict:
+        return loads(value)
+
+    def decode_batch(self, messages: list) -> DecodedBatch:
+        inputs, valid, errors = [], [], []
+        for msg in messages:
+            try:
+                inputs.append(self.decode(msg.value()))
+                valid.append(msg)
+            except Exception as e:
+                errors.append((msg, e))
+        return DecodedBatch(inputs, valid, None, errors)
+
+
+# JSON types accepted per dtype kind: numpy would silently convert the
+# others (1.7 to 1, None to NaN, "no" to True)
+_KIND_TYPES = {"b": (bool,), "i": (int,), "u": (int,), "f": (int, float)}
+
+
+def _check_type(name: str, dtype: np.dtype, value) -> None:
+    """Raise TypeError if value does not fit a column of dtype."""
+    types = _KIND_TYPES.get(dtype.kind)
+    if types is None:
+        return
+    # bool is an int, only boolean columns take it
+    if not isinstance(value, types) or (isinstance(value, bool) and dtype.kind != "b"):
+        raise TypeError(f"Feature {name!r} is {dtype}, got {type(value).__name__} {value!r}")
+
+
+class SchemaDecoder(JsonDecoder):
+    """
+    Decodes batches into typed columns following a feature schema. Messages
+    that are not JSON objects, miss a feature or hold a value that does not
+    fit the feature's dtype are reported as errors and left out of the
+    batch. Integer features take JSON integers, float features numbers and
+    bool features booleans; other dtypes convert like numpy does. Extra
+    fields are kept in the input records but not passed to the model.
+    Derived features, filled in after decoding (the rolling features), are
+    not read from the payload: their columns start at zero.
+    """
+
+    def __init__(self, schema: List[Tuple[str, np.dtype]], derived: Sequence[str] = ()):
+        """
+        :param schema: (feature name, dtype) pairs, see parse_schema
+        :param derived: Names of the schema features computed after decoding
+        """
+        self.schema = schema
+        derived = set(derived)
+        # (column, name, dtype) of the features read from the payload
+        self._payload_fields = [
+            (i, name, dtype) for i, (name, dtype) in enumerate(schema) if name not in derived]
+
+    def decode_batch(self, messages: list) -> DecodedBatch:
+        columns = [np.zeros(len(messages), dtype=dtype) for _, dtype in self.schema]
+        inputs, valid, errors = [], [], []
+        row = 0
+        for msg in messages:
+            try:
+                input_data = self.decode(msg.value())
+                for i, name, dtype in self._payload_fields:
+                    value = input_data[name]
+                    _check_type(name, dtype, value)
+                    columns[i][row] = value
+            except Exception as e:
+                errors.append((msg, e))
+                continue
+            inputs.append(input_data)
+            valid.append(msg)
+            row += 1
+
+        frame = pd.DataFrame(
+            {name: column[:row] for (name, _), column in zip(self.schema, columns)},
+            copy=False)
+        return DecodedBatch(inputs, valid, frame, errors)
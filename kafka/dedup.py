@@ -0,0 +1,241 @@
+"""
+Deduplication of transactions before scoring.
+
+Every message carries a transaction ID (DEDUP_ID_FIELD). DedupIndex drops
+a message whose ID was already seen in another message:
+
+- an exact window remembers the last `window` IDs together with the Kafka
+  coordinates (topic, partition, offset) of the message they came from;
+- a rotating Bloom filter remembers older IDs in bounded memory: once the
+  current generation holds `capacity` IDs a new one is started and the
+  oldest of `generations` is dropped, so memory stays at about
+  generations * capacity * 1.44 * log2(1 / error_rate) bits.
+
+An ID found in the exact window is a certain duplicate, unless it comes
+from the very same message: that is a replay after a restart or a
+rebalance (offsets are committed after the sink, see offsets.py) and it is
+scored again. An ID only found in the Bloom filter is a probable duplicate;
+the estimated false positive rate is exported as a metric. The window
+should therefore cover at least the messages consumed between two offset
+commits.
+
+The index is saved to disk every snapshot_interval seconds and on close,
+and loaded back on start, so duplicates are still caught after a restart.
+Each worker process keeps its own index: duplicates are only detected
+within the partitions a worker consumes, which holds when producers key
+messages by transaction ID.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from math import ceil, log
+from typing import Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger("consumer.dedup")
+
+SNAPSHOT_VERSION = 1
+# Refresh the gauges every N new IDs rather than on every message
+METRICS_EVERY = 1000
+
+
+def _hashes(key: str) -> Tuple[int, int]:
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, using double hashing."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        """
+        :param capacity: Number of keys the filter is sized for
+        :param error_rate: False positive rate at capacity
+        """
+        self.capacity = capacity
+        self.size = max(8, ceil(-capacity * log(error_rate) / log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.bits_set = 0
+
+    def _positions(self, key: str):
+        h1, h2 = _hashes(key)
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key: str) -> None:
+        bits = self.bits
+        for p in self._positions(key):
+            mask = 1 << (p & 7)
+            if not bits[p >> 3] & mask:
+                bits[p >> 3] |= mask
+                self.bits_set += 1
+        self.count += 1
+
+    def false_positive_rate(self) -> float:
+        """Current false positive rate, estimated from the share of bits set."""
+        return (self.bits_set / self.size) ** self.hash_count
+
+
+class DedupIndex:
+    """Exact window plus rotating Bloom filter, see the module docstring."""
+
+    def __init__(
+        self,
+        capacity: int = 1000000,
+        error_rate: float = 0.001,
+        generations: int = 2,
+        window: int = 100000,
+        snapshot_path: Optional[str] = None,
+        snapshot_interval: float = 60,
+    ):
+        """
+        :param capacity: IDs per Bloom filter generation
+        :param error_rate: False positive rate of a full generation
+        :param generations: Number of Bloom filter generations kept
+        :param window: Number of recent IDs remembered exactly
+        :param snapshot_path: File the index is saved to, None keeps it in memory
+        :param snapshot_interval: Seconds between snapshots
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.generations = generations
+        self.window = window
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._filters = [BloomFilter(capacity, error_rate)]
+        self._recent: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_snapshot = time.monotonic()
+        if snapshot_path and os.path.exists(snapshot_path):
+            self._load()
+        self._update_metrics()
+
+    def check(self, transaction_id, msg) -> bool:
+        """
+        Record the message's transaction ID.
+        :param transaction_id: ID of the transaction, None is never a duplicate
+        :param msg: Kafka message the ID was read from
+        :return: True if the message is a duplicate and must be dropped
+        """
+        if transaction_id is None:
+            return False
+        key = str(transaction_id)
+        source = [msg.topic(), msg.partition(), msg.offset()]
+        with self._lock:
+            seen_at = self._recent.get(key)
+            if seen_at is not None:
+                if seen_at == source:
+                    # The same message again, replayed from the last commit
+                    return False
+                metrics.DEDUP_DUPLICATES.labels("exact").inc()
+                return True
+            if any(key in bloom for bloom in self._filters):
+                metrics.DEDUP_DUPLICATES.labels("probable").inc()
+                return True
+
+            self._remember(key, source)
+            if self.snapshot_path and time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+                self._save()
+        return False
+
+    def _remember(self, key: str, source: list) -> None:
+        self._recent[key] = source
+        if len(self._recent) > self.window:
+            self._recent.popitem(last=False)
+
+        current = self._filters[-1]
+        current.add(key)
+        if current.count >= self.capacity:
+            self._filters.append(BloomFilter(self.capacity, self.error_rate))
+            if len(self._filters) > self.generations:
+                self._filters.pop(0)
+            logger.info("Rotated dedup Bloom filter",
+                        extra={"fields": {"generations": len(self._filters)}})
+        if current.count % METRICS_EVERY == 0:
+            self._update_metrics()
+
+    def false_positive_rate(self) -> float:
+        """Estimated probability that a new ID is taken for a duplicate."""
+        miss = 1.0
+        for bloom in self._filters:
+            miss *= 1.0 - bloom.false_positive_rate()
+        return 1.0 - miss
+
+    def _update_metrics(self) -> None:
+        metrics.DEDUP_FALSE_POSITIVE_RATE.set(self.false_positive_rate())
+        metrics.DEDUP_ENTRIES.set(sum(bloom.count for bloom in self._filters))
+        metrics.DEDUP_MEMORY_BYTES.set(sum(len(bloom.bits) for bloom in self._filters))
+
+    def close(self) -> None:
+        with self._lock:
+            self._update_metrics()
+            if self.snapshot_path:
+                self._save()
+
+    def _save(self) -> None:
+        start = time.perf_counter()
+        directory = os.path.dirname(self.snapshot_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        header = {
+            "version": SNAPSHOT_VERSION,
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "filters": [[bloom.count, bloom.bits_set] for bloom in self._filters],
+            "recent": list(self._recent.items()),
+        }
+        with open(tmp_path, "wb") as f:
+            header_bytes = json.dumps(header).encode("utf-8")
+            f.write(len(header_bytes).to_bytes(8, "little"))
+            f.write(header_bytes)
+            for bloom in self._filters:
+                f.write(bloom.bits)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._last_snapshot = time.monotonic()
+        metrics.DEDUP_SNAPSHOT_SECONDS.set(time.perf_counter() - start)
+
+    def _load(self) -> None:
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                header = json.loads(f.read(int.from_bytes(f.read(8), "little")))
+                if (header["version"] != SNAPSHOT_VERSION
+                        or header["capacity"] != self.capacity
+                        or header["error_rate"] != self.error_rate):
+                    logger.warning("Dedup snapshot was made with other settings, ignoring it",
+                                   extra={"fields": {"path": self.snapshot_path}})
+                    return
+                filters = []
+                # Only the newest generations are kept, skip the older bit arrays
+                skipped = max(0, len(header["filters"]) - self.generations)
+                f.seek(skipped * len(BloomFilter(self.capacity, self.error_rate).bits), os.SEEK_CUR)
+                for count, bits_set in header["filters"][skipped:]:
+                    bloom = BloomFilter(self.capacity, self.error_rate)
+                    bloom.bits = bytearray(f.read(len(bloom.bits)))
+                    if len(bloom.bits) != (bloom.size + 7) // 8:
+                        raise ValueError("truncated Bloom filter")
+                    bloom.count, bloom.bits_set = count, bits_set
+                    filters.append(bloom)
+        except (OSError, ValueError, KeyError) as e:
+            metrics.ERRORS.labels("dedup_snapshot").inc()
+            logger.warning("Could not load the dedup snapshot, starting empty",
+                           extra={"fields": {"path": self.snapshot_path, "error": str(e)}})
+            return
+
+        self._filters = filters or [BloomFilter(self.capacity, self.error_rate)]
+        self._recent = OrderedDict(
+            (key, source) for key, source in header["recent"][-self.window:])
+        logger.info("Loaded dedup snapshot", extra={"fields": {
+            "path": self.snapshot_path, "recent": len(self._recent),
+            "entries": sum(bloom.count for bloom in self._filters)}})
@@ -0,0 +1,354 @@
+"""
+In-process store of rolling per-entity aggregates (velocity features).
+
+For every entity field (e.g. card_id, account_id) and window (e.g. 1m, 1h,
+24h) FeatureStore keeps exponentially decayed counters with a time constant
+equal to the window: the transaction count, the amount sum and the sum of
+squared amounts, plus the last time each of the entity's most recent
+merchants was seen. From them it derives, per entity and window:
+
+- <entity>_txn_count_<window>: transactions in about the last window;
+- <entity>_amount_zscore_<window>: z-score of the amount against the
+  decayed mean and standard deviation of the entity's amounts;
+- <entity>_distinct_merchants_<window>: merchants seen in the window,
+  among the max_merchants most recent ones.
+
+Only the features the model takes are joined onto its inputs (join mode
+"model"): those listed in the feature schema when there is one, otherwise
+those named by the model's MLflow input signature; a model with neither
+gets none. Mode "all" joins every feature, for models trained on all of
+them without a signature, "none" only keeps the aggregates up to date.
+The aggregates are updated in every mode.
+
+Features describe the entity before the transaction being scored, which is
+then added to the aggregates. Time is the Kafka message timestamp, so
+replays and backfills see the windows as they were. Each message updates
+the aggregates once: messages at or below the last offset applied for
+their partition (replays after a restart or rebalance) get features but
+leave the aggregates untouched.
+
+Memory is bounded by max_entities per entity field, least recently seen
+entities are evicted. The store is saved to disk every snapshot_interval
+seconds and on close, and loaded back on start so the windows do not start
+cold after a restart.
+"""
+import logging
+import math
+import os
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import metrics
+
+logger = logging.getLogger("consumer.feature_store")
+
+SNAPSHOT_VERSION = 1
+JOIN_MODES = ("model", "all", "none")
+_WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_windows(spec: str) -> List[Tuple[str, float]]:
+    """
+    Parse "1m,1h,24h" into [("1m", 60.0), ("1h", 3600.0), ("24h", 86400.0)].
+    :raises ValueError: If a window is not a number followed by s, m, h or d
+    """
+    windows = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", part)
+        if match is None:
+            raise ValueError(f"Invalid window {part!r}, expected e.g. 30s, 5m, 1h or 1d")
+        windows.append((part, float(match.group(1)) * _WINDOW_UNITS[match.group(2)]))
+    if not windows:
+        raise ValueError("No feature window configured")
+    return windows
+
+
+def message_time(msg) -> float:
+    """Kafka message timestamp in seconds, the current time if it has none."""
+    timestamp_type, timestamp = msg.timestamp()
+    if timestamp_type == 0 or timestamp <= 0:  # TIMESTAMP_NOT_AVAILABLE
+        return time.time()
+    return timestamp / 1000.0
+
+
+def model_input_names(model) -> Optional[List[str]]:
+    """Input column names of an MLflow model's signature, None without one."""
+    try:
+        schema = model.metadata.get_input_schema()
+    except AttributeError:
+        return None
+    if schema is None or not schema.has_input_names():
+        return None
+    return schema.input_names()
+
+
+class _EntityState:
+    __slots__ = ("last_time", "counts", "sums", "squares", "merchants")
+
+    def __init__(self, window_count: int):
+        self.last_time = None
+        self.counts = [0.0] * window_count
+        self.sums = [0.0] * window_count
+        self.squares = [0.0] * window_count
+        self.merchants: "OrderedDict[str, float]" = OrderedDict()
+
+
+class FeatureStore:
+    """Rolling aggregates keyed by entity, see the module docstring."""
+
+    def __init__(
+        self,
+        entity_fields: Sequence[str],
+        windows: Sequence[Tuple[str, float]],
+        amount_field: str = "amount",
+        merchant_field: Optional[str] = "merchant_id",
+        max_entities: int = 1000000,
+        max_merchants: int = 32,
+        snapshot_path: Optional[str] = None,
+        snapshot_interval: float = 60,
+        join: str = "model",
+        schema_names: Optional[Sequence[str]] = None,
+    ):
+        """
+        :param entity_fields: Payload fields identifying the entities
+        :param windows: (name, seconds) pairs, see parse_windows
+        :param amount_field: Payload field holding the transaction amount
+        :param merchant_field: Payload field identifying the merchant, None
+            disables the distinct merchant features
+        :param max_entities: Entities kept per entity field
+        :param max_merchants: Recent merchants kept per entity
+        :param snapshot_path: File the store is saved to, None keeps it in memory
+        :param snapshot_interval: Seconds between snapshots
+        :param join: One of JOIN_MODES, see the module docstring
+        :param schema_names: Model inputs of the feature schema, None without one
+        """
+        if join not in JOIN_MODES:
+            raise ValueError(f"Unknown feature join mode '{join}', expected one of {JOIN_MODES}")
+        self.entity_fields = list(entity_fields)
+        self.windows = list(windows)
+        self.amount_field = amount_field
+        self.merchant_field = merchant_field
+        self.max_entities = max_entities
+        self.max_merchants = max_merchants
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.join = join
+        self.schema_names = None if schema_names is None else list(schema_names)
+        # (model version, joined feature names) of the last model seen
+        self._joined: Optional[Tuple[str, List[str]]] = None
+        self._entities: Dict[str, "OrderedDict[str, _EntityState]"] = {
+            field: OrderedDict() for field in self.entity_fields}
+        # Highest offset applied to the aggregates per (topic, partition)
+        self._applied: Dict[Tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+        self._last_snapshot = time.monotonic()
+        if snapshot_path and os.path.exists(snapshot_path):
+            self._load()
+        for field in self.entity_fields:
+            entities = self._entities[field]
+            metrics.FEATURE_STORE_ENTITIES.labels(field).set_function(lambda e=entities: len(e))
+
+    def feature_names(self) -> List[str]:
+        names = []
+        for field in self.entity_fields:
+            for window, _ in self.windows:
+                names.append(f"{field}_txn_count_{window}")
+                names.append(f"{field}_amount_zscore_{window}")
+                if self.merchant_field:
+                    names.append(f"{field}_distinct_merchants_{window}")
+        return names
+
+    def joined_names(self, model, model_version: str) -> List[str]:
+        """Names of the features joined onto the inputs of a model, see join."""
+        if self._joined is not None and self._joined[0] == model_version:
+            return self._joined[1]
+        names = []
+        if self.join == "all":
+            names = self.feature_names()
+        elif self.join == "model":
+            wanted = self.schema_names
+            if wanted is None:
+                wanted = model_input_names(model)
+            if wanted is None:
+                logger.warning("Model has no input signature, no rolling feature is joined",
+                               extra={"fields": {"model_version": model_version}})
+            else:
+                wanted = set(wanted)
+                names = [name for name in self.feature_names() if name in wanted]
+        logger.info("Joining rolling features", extra={"fields": {
+            "model_version": model_version, "join": self.join, "features": names}})
+        self._joined = (model_version, names)
+        return names
+
+    def features(self, inputs: List[dict], messages: list) -> List[dict]:
+        """
+        Compute the features of a batch of transactions, in order, and add
+        the transactions to the aggregates.
+        :param inputs: Decoded payloads
+        :param messages: Kafka messages the payloads came from, same order
+        :return: One dict of features per input
+        """
+        start = time.perf_counter()
+        results = []
+        with self._lock:
+            for input_data, msg in zip(inputs, messages):
+                source = (msg.topic(), msg.partition())
+                offset = msg.offset()
+                apply = offset > self._applied.get(source, -1)
+                if apply:
+                    self._applied[source] = offset
+                results.append(self._process(input_data, message_time(msg), apply))
+            if self.snapshot_path and time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+                self._save()
+        metrics.FEATURES_SECONDS.observe(time.perf_counter() - start)
+        return results
+
+    def _process(self, input_data: dict, now: float, apply: bool) -> dict:
+        try:
+            amount = float(input_data.get(self.amount_field) or 0.0)
+        except (TypeError, ValueError):
+            amount = 0.0
+        merchant = None
+        if self.merchant_field:
+            merchant = input_data.get(self.merchant_field)
+            merchant = None if merchant is None else str(merchant)
+
+        features = {}
+        for field in self.entity_fields:
+            key = input_data.get(field)
+            state = None
+            if key is not None:
+                entities = self._entities[field]
+                key = str(key)
+                state = entities.get(key)
+                if state is None and apply:
+                    state = entities[key] = _EntityState(len(self.windows))
+                    if len(entities) > self.max_entities:
+                        entities.popitem(last=False)
+                elif state is not None:
+                    entities.move_to_end(key)
+            if state is not None:
+                self._decay(state, now)
+            self._describe(features, field, state, amount, now)
+            if state is not None and apply:
+                self._add(state, amount, merchant, now)
+        return features
+
+    def _decay(self, state: _EntityState, now: float) -> None:
+        if state.last_time is None or now <= state.last_time:
+            return
+        elapsed = now - state.last_time
+        for i, (_, seconds) in enumerate(self.windows):
+            factor = math.exp(-elapsed / seconds)
+            state.counts[i] *= factor
+            state.sums[i] *= factor
+            state.squares[i] *= factor
+        state.last_time = now
+
+    def _describe(self, features: dict, field: str, state: Optional[_EntityState],
+                  amount: float, now: float) -> None:
+        for i, (window, seconds) in enumerate(self.windows):
+            count = zscore = 0.0
+            distinct = 0
+            if state is not None:
+                count = state.counts[i]
+                if count > 1.0:
+                    mean = state.sums[i] / count
+                    variance = state.squares[i] / count - mean * mean
+                    if variance > 1e-12:
+                        zscore = (amount - mean) / math.sqrt(variance)
+                if self.merchant_field:
+                    since = now - seconds
+                    distinct = sum(seen >= since for seen in state.merchants.values())
+            features[f"{field}_txn_count_{window}"] = round(count, 4)
+            features[f"{field}_amount_zscore_{window}"] = round(zscore, 4)
+            if self.merchant_field:
+                features[f"{field}_distinct_merchants_{window}"] = distinct
+
+    def _add(self, state: _EntityState, amount: float, merchant: Optional[str],
+             now: float) -> None:
+        if state.last_time is None:
+            state.last_time = now
+        for i in range(len(self.windows)):
+            state.counts[i] += 1.0
+            state.sums[i] += amount
+            state.squares[i] += amount * amount
+        if merchant is not None:
+            state.merchants[merchant] = max(now, state.merchants.get(merchant, now))
+            state.merchants.move_to_end(merchant)
+            if len(state.merchants) > self.max_merchants:
+                state.merchants.popitem(last=False)
+
+    def close(self) -> None:
+        if self.snapshot_path:
+            with self._lock:
+                self._save()
+
+    def _settings(self) -> dict:
+        return {
+            "version": SNAPSHOT_VERSION,
+            "entity_fields": self.entity_fields,
+            "windows": self.windows,
+            "merchant_field": self.merchant_field,
+        }
+
+    def _save(self) -> None:
+        start = time.perf_counter()
+        directory = os.path.dirname(self.snapshot_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        snapshot = {
+            "settings": self._settings(),
+            "applied": self._applied,
+            "entities": {
+                field: [(key, state.last_time, state.counts, state.sums, state.squares,
+                         list(state.merchants.items()))
+                        for key, state in entities.items()]
+                for field, entities in self._entities.items()
+            },
+        }
+        with open(tmp_path, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._last_snapshot = time.monotonic()
+        metrics.FEATURE_STORE_SNAPSHOT_SECONDS.set(time.perf_counter() - start)
+
+    def _load(self) -> None:
+        # The snapshot is written by this consumer only, never load files
+        # from elsewhere: unpickling runs arbitrary code
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                snapshot = pickle.load(f)
+            if snapshot["settings"] != self._settings():
+                logger.warning("Feature store snapshot was made with other settings, ignoring it",
+                               extra={"fields": {"path": self.snapshot_path}})
+                return
+            loaded = {}
+            for field, rows in snapshot["entities"].items():
+                entities = loaded[field] = OrderedDict()
+                for key, last_time, counts, sums, squares, merchants in rows[-self.max_entities:]:
+                    state = _EntityState(len(self.windows))
+                    state.last_time = last_time
+                    state.counts, state.sums, state.squares = counts, sums, squares
+                    state.merchants = OrderedDict(merchants[-self.max_merchants:])
+                    entities[key] = state
+        except (OSError, EOFError, pickle.UnpicklingError, KeyError, ValueError, TypeError) as e:
+            metrics.ERRORS.labels("feature_snapshot").inc()
+            logger.warning("Could not load the feature store snapshot, starting empty",
+                           extra={"fields": {"path": self.snapshot_path, "error": str(e)}})
+            return
+
+        self._entities = loaded
+        self._applied = snapshot["applied"]
+        logger.info("Loaded feature store snapshot", extra={"fields": {
+            "path": self.snapshot_path,
+            "entities": {field: len(entities) for field, entities in loaded.items()}}})
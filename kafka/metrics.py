@@ -0,0 +1,196 @@
+"""
+Prometheus metrics of the consumer, served on http://<host>:METRICS_PORT/metrics.
+
+prometheus_client is optional: without it every metric is a no-op and the
+consumer runs unchanged.
+"""
+import json
+import logging
+from typing import Optional
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, start_http_server
+except ImportError:
+    Counter = Gauge = Histogram = start_http_server = None
+
+
+class _NoopMetric:
+    """Stands in for a metric when prometheus_client is not installed."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def set_function(self, f):
+        pass
+
+
+if Counter is None:
+    Counter = Gauge = Histogram = _NoopMetric
+
+logger = logging.getLogger("consumer.metrics")
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BATCH_SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+MESSAGES_CONSUMED = Counter(
+    "consumer_messages_consumed_total",
+    "Messages read from Kafka")
+PREDICTIONS = Counter(
+    "consumer_predictions_total",
+    "Predictions made")
+DECODE_SECONDS = Histogram(
+    "consumer_decode_seconds",
+    "Time spent decoding one poll or batch of messages",
+    buckets=LATENCY_BUCKETS)
+PREDICT_SECONDS = Histogram(
+    "consumer_predict_seconds",
+    "Time spent in one model.predict call",
+    buckets=LATENCY_BUCKETS)
+SINK_SECONDS = Histogram(
+    "consumer_sink_seconds",
+    "Time the sink writer spends per operation",
+    ["operation"],
+    buckets=LATENCY_BUCKETS)
+BATCH_SIZE = Histogram(
+    "consumer_batch_size",
+    "Number of inputs scored per model.predict call",
+    buckets=BATCH_SIZE_BUCKETS)
+INFERENCE_BATCH_TARGET = Gauge(
+    "consumer_inference_batch_target",
+    "Batch size currently chosen by the adaptive batch controller")
+BATCH_LATENCY_P99 = Gauge(
+    "consumer_batch_latency_p99_seconds",
+    "p99 batch latency seen at the last batch size adjustment")
+SINK_QUEUE_DEPTH = Gauge(
+    "consumer_sink_queue_depth",
+    "Batches waiting in the sink queue")
+PIPELINE_QUEUE_DEPTH = Gauge(
+    "consumer_pipeline_queue_depth",
+    "Batches waiting in front of each pipeline stage",
+    ["stage"])
+CONSUMER_LAG = Gauge(
+    "consumer_lag_messages",
+    "Consumer lag per partition as reported by librdkafka",
+    ["topic", "partition"])
+ERRORS = Counter(
+    "consumer_errors_total",
+    "Errors by type",
+    ["type"])
+MODEL_VERSION = Gauge(
+    "consumer_model_version",
+    "Numeric model version currently used for scoring")
+MODEL_LOAD_SECONDS = Gauge(
+    "consumer_model_load_seconds",
+    "Duration of the phases of the last model load",
+    ["phase"])
+PREDICTION_CACHE_REQUESTS = Counter(
+    "consumer_prediction_cache_requests_total",
+    "Prediction cache lookups by result",
+    ["result"])
+PREDICTION_CACHE_ENTRIES = Gauge(
+    "consumer_prediction_cache_entries",
+    "Predictions held by the in-process prediction cache")
+DEDUP_DUPLICATES = Counter(
+    "consumer_dedup_duplicates_total",
+    "Messages dropped as duplicate transactions, exact or probable (Bloom filter)",
+    ["kind"])
+DEDUP_FALSE_POSITIVE_RATE = Gauge(
+    "consumer_dedup_false_positive_rate",
+    "Estimated probability that a new transaction is dropped as a duplicate")
+DEDUP_ENTRIES = Gauge(
+    "consumer_dedup_entries",
+    "Transaction IDs held by the dedup Bloom filters")
+DEDUP_MEMORY_BYTES = Gauge(
+    "consumer_dedup_memory_bytes",
+    "Size of the dedup Bloom filters")
+DEDUP_SNAPSHOT_SECONDS = Gauge(
+    "consumer_dedup_snapshot_seconds",
+    "Duration of the last dedup index snapshot")
+FEATURES_SECONDS = Histogram(
+    "consumer_features_seconds",
+    "Time spent computing rolling features, per message or batch",
+    buckets=LATENCY_BUCKETS)
+FEATURE_STORE_ENTITIES = Gauge(
+    "consumer_feature_store_entities",
+    "Entities held by the feature store",
+    ["entity"])
+FEATURE_STORE_SNAPSHOT_SECONDS = Gauge(
+    "consumer_feature_store_snapshot_seconds",
+    "Duration of the last feature store snapshot")
+MODEL_FALLBACKS = Counter(
+    "consumer_model_fallbacks_total",
+    "Batches scored by the fallback model, by reason",
+    ["reason"])
+SHADOW_PREDICTIONS = Counter(
+    "consumer_shadow_predictions_total",
+    "Sampled records by shadow scoring result (agree, disagree, dropped, error)",
+    ["result"])
+SHADOW_PREDICT_SECONDS = Histogram(
+    "consumer_shadow_predict_seconds",
+    "Time spent in the shadow model's predict, per sampled batch",
+    buckets=LATENCY_BUCKETS)
+MODEL_CACHE_LOADS = Counter(
+    "consumer_model_cache_loads_total",
+    "Model loads by local cache result",
+    ["result"])
+
+
+def start_metrics_server(port: int) -> None:
+    if start_http_server is None:
+        logger.warning("prometheus_client is not installed, metrics are disabled")
+        return
+    start_http_server(port)
+    logger.info("Serving Prometheus metrics", extra={"fields": {"port": port}})
+
+
+def set_model_version(version: str) -> None:
+    if str(version).isdigit():
+        MODEL_VERSION.set(int(version))
+
+
+# Lag per (topic, partition) from the last librdkafka statistics, None until
+# the first report
+_consumer_lag = None
+
+
+def record_kafka_stats(stats_json: str) -> None:
+    """librdkafka stats_cb: export the consumer lag of every assigned partition."""
+    global _consumer_lag
+    stats = json.loads(stats_json)
+    lags = {}
+    for topic, topic_stats in stats.get("topics", {}).items():
+        for partition, partition_stats in topic_stats.get("partitions", {}).items():
+            lag = partition_stats.get("consumer_lag", -1)
+            # Partition -1 is librdkafka's internal UA partition, -1 lag is unknown
+            if partition == "-1" or lag < 0:
+                continue
+            CONSUMER_LAG.labels(topic, partition).set(lag)
+            lags[(topic, partition)] = lag
+    _consumer_lag = lags
+
+
+def total_consumer_lag() -> Optional[int]:
+    """Lag summed over the assigned partitions, None if not reported yet."""
+    if _consumer_lag is None:
+        return None
+    return sum(_consumer_lag.values())
+
+
+def record_model_load(stats: dict) -> None:
+    """Export the timings collected by CachingModelRegistry.load."""
+    MODEL_CACHE_LOADS.labels("hit" if stats["cache_hit"] else "miss").inc()
+    for phase in ("verify", "download", "load", "total"):
+        MODEL_LOAD_SECONDS.labels(phase).set(stats[f"{phase}_seconds"])
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Optional
+
+import mlflow
+from mlflow.pyfunc import PyFuncModel
+
+import metrics
+
+MANIFEST_NAME = "manifest.json"
+
+logger = logging.getLogger("consumer.model_cache")
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LocalModelCache:
+    """
+    On-disk cache of downloaded models, keyed by model name and version.
+
+    Layout:
+        <root_dir>/objects/<key>/model/          the MLflow model directory
+        <root_dir>/objects/<key>/manifest.json   sha256 and size of every file
+        <root_dir>/pointers/<key of name>        last version served by name
+
+    Entries are verified against their manifest before use and evicted least
+    recently used first once the cache grows over max_bytes.
+    """
+
+    def __init__(self, root_dir: str, max_bytes: int = 2 * 1024 ** 3, verify: bool = True):
+        """
+        :param root_dir: Cache directory
+        :param max_bytes: Total size above which old entries are evicted
+        :param verify: Check file checksums before using an entry
+        """
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self.verify = verify
+        self._objects_dir = os.path.join(root_dir, "objects")
+        self._pointers_dir = os.path.join(root_dir, "pointers")
+        os.makedirs(self._objects_dir, exist_ok=True)
+        os.makedirs(self._pointers_dir, exist_ok=True)
+
+    @staticmethod
+    def key(model_name: str, version: str = "") -> str:
+        return hashlib.sha256(f"{model_name}/{version}".encode("utf-8")).hexdigest()
+
+    def _entry_dir(self, model_name: str, version: str) -> str:
+        return os.path.join(self._objects_dir, self.key(model_name, version))
+
+    def get_path(self, model_name: str, version: str) -> Optional[str]:
+        """
+        Local path of a cached model, or None if it is missing or corrupted.
+        Corrupted entries are removed.
+        """
+        entry_dir = self._entry_dir(model_name, version)
+        manifest_path = os.path.join(entry_dir, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return None
+
+        model_dir = os.path.join(entry_dir, "model")
+        if self.verify:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            for relative_path, checksum in manifest["files"].items():
+                path = os.path.join(model_dir, relative_path)
+                if not os.path.exists(path) or _sha256(path) != checksum:
+                    logger.warning("Cached model is corrupted, removing it", extra={
+                        "fields": {"model_name": model_name, "model_version": version}})
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    return None
+
+        # The manifest mtime is the last-used time for LRU eviction
+        os.utime(manifest_path)
+        return model_dir
+
+    def put(self, model_name: str, version: str, download: Callable[[str], str]) -> str:
+        """
+        Download a model into the cache.
+        :param download: Callable that downloads the model into the given
+            directory and returns the path of the model directory
+        :return: Local path of the cached model
+        """
+        entry_dir = self._entry_dir(model_name, version)
+        staging_dir = tempfile.mkdtemp(dir=self._objects_dir, prefix=".staging-")
+        try:
+            download_dir = os.path.join(staging_dir, "download")
+            os.makedirs(download_dir)
+            downloaded = download(download_dir)
+            os.replace(downloaded, os.path.join(staging_dir, "model"))
+            shutil.rmtree(download_dir, ignore_errors=True)
+
+            model_dir = os.path.join(staging_dir, "model")
+            files, size = {}, 0
+            for directory, _, names in os.walk(model_dir):
+                for name in names:
+                    path = os.path.join(directory, name)
+                    files[os.path.relpath(path, model_dir)] = _sha256(path)
+                    size += os.path.getsize(path)
+            with open(os.path.join(staging_dir, MANIFEST_NAME), "w") as f:
+                json.dump({
+                    "model_name": model_name,
+                    "version": str(version),
+                    "files": files,
+                    "size": size,
+                    "created_at": time.time(),
+                }, f)
+
+            try:
+                os.rename(staging_dir, entry_dir)
+            except OSError:
+                # Another worker cached the same version first
+                shutil.rmtree(staging_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        self.evict(keep=entry_dir)
+        return os.path.join(entry_dir, "model")
+
+    def evict(self, keep: str = None) -> None:
+        """Remove least recently used entries until the cache fits max_bytes."""
+        entries = []
+        for name in os.listdir(self._objects_dir):
+            manifest_path = os.path.join(self._objects_dir, name, MANIFEST_NAME)
+            if not os.path.exists(manifest_path):
+                continue
+            with open(manifest_path) as f:
+                size = json.load(f)["size"]
+            entries.append((os.path.getmtime(manifest_path), size, os.path.join(self._objects_dir, name)))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry_dir == keep:
+                continue
+            logger.info("Evicting cached model",
+                        extra={"fields": {"key": os.path.basename(entry_dir)}})
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+    def last_version(self, model_name: str) -> Optional[str]:
+        """Version last served for model_name, if it is still cached."""
+        pointer = os.path.join(self._pointers_dir, self.key(model_name))
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer) as f:
+            version = f.read().strip()
+        if not os.path.exists(os.path.join(self._entry_dir(model_name, version), MANIFEST_NAME)):
+            return None
+        return version
+
+    def remember_version(self, model_name: str, version: str) -> None:
+        pointer = os.path.join(self._pointers_dir, self.key(model_name))
+        tmp_pointer = f"{pointer}.{os.getpid()}.tmp"
+        with open(tmp_pointer, "w") as f:
+            f.write(str(version))
+        os.replace(tmp_pointer, pointer)
+
+
+class CachingModelRegistry:
+    """
+    Wraps MlflowModelRegistry so model artifacts are downloaded once and
+    then loaded from LocalModelCache. Timings of the last load are kept in
+    last_load_stats.
+    """
+
+    def __init__(self, registry, cache: LocalModelCache):
+        self.registry = registry
+        self.cache = cache
+        self.model_name = registry.model_name
+        self.last_load_stats = {}
+
+    def latest_version(self) -> str:
+        return self.registry.latest_version()
+
+    def cached_version(self) -> Optional[str]:
+        """Version served last time, loadable without touching the network."""
+        return self.cache.last_version(self.model_name)
+
+    def load(self, version: str) -> PyFuncModel:
+        stats = {"version": str(version), "cache_hit": True, "download_seconds": 0.0}
+        start = time.perf_counter()
+        path = self.cache.get_path(self.model_name, version)
+        stats["verify_seconds"] = time.perf_counter() - start
+
+        if path is None:
+            stats["cache_hit"] = False
+            download_start = time.perf_counter()
+            path = self.cache.put(
+                self.model_name, version,
+                lambda dst_path: mlflow.artifacts.download_artifacts(
+                    artifact_uri=f"models:/{self.model_name}/{version}",
+                    dst_path=dst_path))
+            stats["download_seconds"] = time.perf_counter() - download_start
+
+        load_start = time.perf_counter()
+        model = mlflow.pyfunc.load_model(path)
+        stats["load_seconds"] = time.perf_counter() - load_start
+        stats["total_seconds"] = time.perf_counter() - start
+
+        self.cache.remember_version(self.model_name, version)
+        self.last_load_stats = stats
+        metrics.record_model_load(stats)
+        logger.info("Model loaded", extra={"fields": {"model_name": self.model_name, **stats}})
+        return model
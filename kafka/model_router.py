@@ -0,0 +1,205 @@
+"""
+Fallback and shadow models around the primary model.
+
+ModelRouter scores with the primary model (the one in the ModelHandle)
+and switches to a fallback model when the primary raises or does not
+return within the per-batch latency budget. With a budget the primary
+runs on a worker thread: a call that overruns keeps running there, and
+batches arriving meanwhile go straight to the fallback. After
+failure_threshold consecutive failures or overruns the primary is skipped
+for cooldown seconds (circuit breaker), then tried again.
+
+ShadowScorer scores a sampled fraction of the primary's records with a
+shadow model on its own thread, on the same model inputs the primary got,
+and logs both predictions side by side for offline comparison. The
+scoring thread only samples and queues: when the shadow queue is full,
+the sample is dropped rather than slowing scoring.
+"""
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, List, Optional, Tuple
+
+import pandas as pd
+
+import metrics
+from pipeline import Pipeline
+
+logger = logging.getLogger("consumer.model_router")
+
+
+class _PrimaryBusy(Exception):
+    """The previous primary call overran its budget and is still running."""
+
+
+class ModelRouter:
+    """
+    Primary/fallback routing, see the module docstring. predict() is meant
+    to be called from one scoring thread.
+    """
+
+    def __init__(
+        self,
+        fallback_model,
+        fallback_version: str,
+        predict_fn: Callable,
+        latency_budget_ms: float = 0,
+        failure_threshold: int = 3,
+        cooldown: float = 30,
+    ):
+        """
+        :param fallback_model: Model used when the primary fails
+        :param fallback_version: Version recorded with fallback predictions
+        :param predict_fn: predict_fn(model, inputs) returns one prediction per input
+        :param latency_budget_ms: Time the primary gets per call, 0 waits for it
+        :param failure_threshold: Consecutive failures that open the circuit
+        :param cooldown: Seconds the primary is skipped once the circuit is open
+        """
+        self.fallback_model = fallback_model
+        self.fallback_version = fallback_version
+        self.predict_fn = predict_fn
+        self.latency_budget = latency_budget_ms / 1000.0
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._open_until = 0.0
+        self._inflight = None
+        self._executor = None
+        if self.latency_budget > 0:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="PrimaryModel")
+
+    def predict(self, model, model_version: str, inputs) -> Tuple[list, str]:
+        """
+        Score inputs with the primary model, or with the fallback.
+        :param model: Primary model
+        :param model_version: Version of the primary model
+        :param inputs: Anything predict_fn accepts
+        :return: Predictions and the version of the model that made them
+        :raises Exception: If the fallback fails too
+        """
+        if time.monotonic() < self._open_until:
+            reason = "circuit_open"
+        else:
+            try:
+                predictions = self._call_primary(model, inputs)
+                self._failures = 0
+                return predictions, model_version
+            except _PrimaryBusy:
+                reason = "busy"
+            except FutureTimeout:
+                reason = "timeout"
+                self._record_failure(model_version)
+            except Exception as e:
+                reason = "error"
+                logger.warning("Primary model failed, scoring with the fallback",
+                               extra={"fields": {"model_version": model_version, "error": str(e)}})
+                self._record_failure(model_version)
+
+        metrics.MODEL_FALLBACKS.labels(reason).inc()
+        return self.predict_fn(self.fallback_model, inputs), self.fallback_version
+
+    def _call_primary(self, model, inputs) -> list:
+        if self._executor is None:
+            return self.predict_fn(model, inputs)
+        if self._inflight is not None and not self._inflight.done():
+            raise _PrimaryBusy()
+        self._inflight = self._executor.submit(self.predict_fn, model, inputs)
+        return self._inflight.result(timeout=self.latency_budget)
+
+    def _record_failure(self, model_version: str) -> None:
+        self._failures += 1
+        if self._failures < self.failure_threshold:
+            return
+        self._failures = 0
+        self._open_until = time.monotonic() + self.cooldown
+        logger.warning("Primary model keeps failing, using the fallback only", extra={"fields": {
+            "model_version": model_version, "fallback_version": self.fallback_version,
+            "cooldown": self.cooldown}})
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+class ShadowScorer:
+    """Scores samples of the primary's records with a shadow model, see the module docstring."""
+
+    def __init__(
+        self,
+        model,
+        version: str,
+        sink,
+        predict_fn: Callable,
+        sample_rate: float = 0.1,
+        max_queue_batches: int = 100,
+    ):
+        """
+        :param model: Shadow model
+        :param version: Version recorded with the shadow predictions
+        :param sink: Started PredictionSink the comparison records go to
+        :param predict_fn: predict_fn(model, inputs) returns one prediction per input
+        :param sample_rate: Fraction of the records scored by the shadow model
+        :param max_queue_batches: Sampled batches queued for the shadow model
+        """
+        self.model = model
+        self.version = version
+        self.sink = sink
+        self.predict_fn = predict_fn
+        self.sample_rate = sample_rate
+        self._pipeline = Pipeline([("shadow", self._score)], max_queue_batches)
+
+    def start(self) -> "ShadowScorer":
+        self._pipeline.start()
+        return self
+
+    def offer(self, records: List[dict], inputs) -> None:
+        """
+        Queue a sample of the primary's records, never blocks.
+        :param records: Prediction records of the primary
+        :param inputs: Model inputs the primary was scored on, one per
+            record: the decoded frame or the list of input dicts
+        """
+        rows = range(len(records))
+        if self.sample_rate < 1.0:
+            rows = [row for row in rows if random.random() < self.sample_rate]
+            if not rows:
+                return
+            records = [records[row] for row in rows]
+            if isinstance(inputs, pd.DataFrame):
+                inputs = inputs.iloc[rows].reset_index(drop=True)
+            else:
+                inputs = [inputs[row] for row in rows]
+        if records and not self._pipeline.submit((records, inputs)):
+            metrics.SHADOW_PREDICTIONS.labels("dropped").inc(len(records))
+
+    def _score(self, item: Tuple[List[dict], object]) -> None:
+        records, inputs = item
+        start = time.perf_counter()
+        try:
+            predictions = self.predict_fn(self.model, inputs)
+        except Exception:
+            metrics.SHADOW_PREDICTIONS.labels("error").inc(len(records))
+            logger.warning("Shadow model failed", exc_info=True,
+                           extra={"fields": {"model_version": self.version}})
+            return
+        metrics.SHADOW_PREDICT_SECONDS.observe(time.perf_counter() - start)
+
+        comparisons = []
+        for record, prediction in zip(records, predictions):
+            agrees = prediction == record["prediction"]
+            metrics.SHADOW_PREDICTIONS.labels("agree" if agrees else "disagree").inc()
+            comparisons.append({
+                **record,
+                "prediction": prediction,
+                "model_version": self.version,
+                "primary_prediction": record["prediction"],
+                "primary_model_version": record["model_version"],
+            })
+        if not self.sink.submit(comparisons, timeout=1.0):
+            metrics.ERRORS.labels("shadow_sink_full").inc()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Score what is still queued, then close the shadow sink."""
+        self._pipeline.close(timeout)
+        self.sink.close()
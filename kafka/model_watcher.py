@@ -0,0 +1,154 @@
+import logging
+import os
+import threading
+from typing import NamedTuple
+
+import mlflow
+from mlflow.pyfunc import PyFuncModel
+from mlflow.tracking import MlflowClient
+
+import metrics
+
+logger = logging.getLogger("consumer.model_watcher")
+
+
+class LoadedModel(NamedTuple):
+    model: PyFuncModel
+    version: str
+
+
+class ModelHandle:
+    """
+    Reference to the model currently used for scoring.
+    The consumer reads current() once per batch, the watcher replaces it with
+    swap(). Model and version are swapped together as a single immutable
+    tuple, so a batch never sees a model paired with the wrong version.
+    """
+
+    def __init__(self, model: PyFuncModel, version: str):
+        self._current = LoadedModel(model, str(version))
+        metrics.set_model_version(version)
+
+    def current(self) -> LoadedModel:
+        return self._current
+
+    def swap(self, model: PyFuncModel, version: str) -> None:
+        self._current = LoadedModel(model, str(version))
+        metrics.set_model_version(version)
+
+
+class MlflowModelRegistry:
+    """Resolves and loads versions of a model from the MLflow Model Registry."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._client = MlflowClient()
+
+    def latest_version(self) -> str:
+        """Production version if there is one, the newest version otherwise."""
+        latest_versions = self._client.get_latest_versions(
+            name=self.model_name, stages=["Production"])
+
+        if not latest_versions:
+            versions = self._client.search_model_versions(f"name='{self.model_name}'")
+            latest_version = max(versions, key=lambda v: int(v.version))
+        else:
+            latest_version = latest_versions[0]
+        return str(latest_version.version)
+
+    def load(self, version: str) -> PyFuncModel:
+        return mlflow.pyfunc.load_model(f"models:/{self.model_name}/{version}")
+
+
+class LocalModelRegistry:
+    """
+    Local stand-in for the MLflow registry, for development and tests.
+    Versions are MLflow model directories <root_dir>/<version>/. The version
+    named in <root_dir>/production is served if that file exists, otherwise
+    the highest numeric version.
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    def latest_version(self) -> str:
+        pointer = os.path.join(self.root_dir, "production")
+        if os.path.exists(pointer):
+            with open(pointer) as f:
+                return f.read().strip()
+
+        versions = [
+            name for name in os.listdir(self.root_dir)
+            if name.isdigit() and os.path.isdir(os.path.join(self.root_dir, name))
+        ]
+        if not versions:
+            raise ValueError(f"No model versions found in {self.root_dir}")
+        return max(versions, key=int)
+
+    def load(self, version: str) -> PyFuncModel:
+        return mlflow.pyfunc.load_model(os.path.join(self.root_dir, version))
+
+
+def load_latest_model(registry, version: str = None) -> ModelHandle:
+    """Load the given version, or the latest one, into a new ModelHandle."""
+    if version is None:
+        version = registry.latest_version()
+    model = registry.load(version)
+    logger.info("Loaded model", extra={"fields": {"model_version": version}})
+    return ModelHandle(model, version)
+
+
+class ModelWatcher:
+    """
+    Background thread that polls the registry right after start and then
+    every interval seconds and, when a new version shows up, loads it and
+    swaps it into the handle.
+    Loading happens on the watcher thread, the consumer keeps scoring with
+    the previous model until the swap.
+    """
+
+    def __init__(self, registry, handle: ModelHandle, interval: float = 60):
+        self.registry = registry
+        self.handle = handle
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="ModelWatcher", daemon=True)
+
+    def start(self) -> "ModelWatcher":
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+
+    def check_once(self) -> bool:
+        """
+        Look for a new version and swap it in.
+        :return: True if the model was replaced
+        """
+        try:
+            version = self.registry.latest_version()
+            current_version = self.handle.current().version
+            if version == current_version:
+                return False
+
+            logger.info("New model version found, loading it...",
+                        extra={"fields": {"model_version": version}})
+            model = self.registry.load(version)
+        except Exception:
+            metrics.ERRORS.labels("model_reload").inc()
+            logger.exception("Error checking for a new model version")
+            return False
+
+        self.handle.swap(model, version)
+        logger.info("Swapped model", extra={"fields": {
+            "previous_version": current_version, "model_version": version}})
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.check_once()
+            self._stop.wait(self.interval)
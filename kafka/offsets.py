@@ -0,0 +1,93 @@
+"""
+At-least-once offset commits driven by the prediction sink.
+
+With OFFSET_COMMIT_MODE=sink the consumer runs with enable.auto.commit=false
+and an OffsetCommitter commits, every OFFSET_COMMIT_INTERVAL_MS, the offsets
+the sink reports as durable (see PredictionSink.committable_offsets). Commits
+are asynchronous and cover all assigned partitions in one request. After a
+crash the consumer restarts from the last commit, so predictions may be
+written twice but are never lost. A longer interval means fewer broker
+round-trips but more messages replayed after a crash.
+"""
+import logging
+import time
+from typing import List
+
+from confluent_kafka import Consumer, KafkaException, TopicPartition
+
+import metrics
+from sinks import PredictionSink
+
+logger = logging.getLogger("consumer.offsets")
+
+
+class OffsetCommitter:
+    """
+    Commits the sink's durable offsets. on_commit and on_revoke are meant
+    to be registered as the consumer's commit and rebalance callbacks.
+    """
+
+    def __init__(self, sink: PredictionSink, interval: float = 5.0):
+        """
+        :param sink: Sink whose durable offsets are committed
+        :param interval: Minimum seconds between two commits
+        """
+        self.sink = sink
+        self.interval = interval
+        self._committed = {}
+        self._last_commit = time.monotonic()
+
+    def maybe_commit(self, consumer: Consumer) -> None:
+        """Commit if interval seconds have passed since the last commit."""
+        if time.monotonic() - self._last_commit >= self.interval:
+            self.commit(consumer)
+
+    def commit(self, consumer: Consumer, asynchronous: bool = True,
+               partitions: List[TopicPartition] = None) -> None:
+        """
+        Commit the durable offsets that moved since the last commit.
+        :param consumer: Kafka consumer created with enable.auto.commit=false
+        :param asynchronous: Return without waiting for the broker
+        :param partitions: Only commit these partitions, all assigned ones by default
+        """
+        self._last_commit = time.monotonic()
+        if partitions is None:
+            partitions = consumer.assignment()
+        assigned = {(tp.topic, tp.partition) for tp in partitions}
+
+        offsets = [
+            TopicPartition(topic, partition, offset)
+            for (topic, partition), offset in self.sink.committable_offsets().items()
+            if (topic, partition) in assigned
+            and self._committed.get((topic, partition)) != offset
+        ]
+        if not offsets:
+            return
+        try:
+            consumer.commit(offsets=offsets, asynchronous=asynchronous)
+        except KafkaException as e:
+            metrics.ERRORS.labels("commit").inc()
+            logger.warning("Offset commit failed", extra={"fields": {"error": str(e)}})
+            return
+        for tp in offsets:
+            self._committed[(tp.topic, tp.partition)] = tp.offset
+
+    def on_commit(self, err, partitions: List[TopicPartition]) -> None:
+        """Result of an asynchronous commit, delivered from poll()."""
+        if err is None:
+            return
+        metrics.ERRORS.labels("commit").inc()
+        logger.warning("Offset commit failed", extra={"fields": {"error": str(err)}})
+        # Commit these partitions again on the next round
+        for tp in partitions:
+            self._committed.pop((tp.topic, tp.partition), None)
+
+    def on_revoke(self, consumer: Consumer, partitions: List[TopicPartition]) -> None:
+        """
+        Rebalance callback: commit what is durable for the partitions being
+        taken away before another consumer picks them up. Records of these
+        partitions still in the sink are replayed by the new owner.
+        """
+        self.commit(consumer, asynchronous=False, partitions=partitions)
+        for tp in partitions:
+            self._committed.pop((tp.topic, tp.partition), None)
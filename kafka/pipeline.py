@@ -0,0 +1,151 @@
+"""
+Staged processing for the consumer: poll -> decode -> predict -> sink.
+
+The Kafka consumer thread only polls and hands batches of raw messages to
+the first stage. Every stage runs on its own thread and is connected to the
+next one by a bounded queue, so parsing the next batch overlaps with model
+code that releases the GIL (numpy, scikit-learn, XGBoost) and with the
+sink's disk writes. One thread per stage keeps batches in order, which the
+sink's offset tracking relies on.
+
+An item whose handler raises is logged and dropped, after it is passed to
+the pipeline's on_error callback (the consumer reports its messages to the
+sink as failed, so their offsets are not committed).
+
+A full queue blocks the stage feeding it. The consumer thread only waits
+on the first queue for a bounded time: submit() then returns False and the
+caller pauses the assigned partitions until there is room again (see
+consumer.pause_until_accepted).
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+import metrics
+
+_STOP = object()
+
+logger = logging.getLogger("consumer.pipeline")
+
+
+class PipelineStage:
+    """
+    Worker thread applying handler to every item of its input queue and
+    passing the result, unless it is None, on to the next stage.
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any], Any], max_queue_batches: int,
+                 on_error: Callable[[str, Any], None] = None):
+        """
+        :param name: Stage name, used for the thread, logs and metrics
+        :param handler: Called with each item, returns the item for the next stage
+        :param max_queue_batches: Size of the input queue
+        :param on_error: Called with the stage name and the item when handler raises
+        """
+        self.name = name
+        self.handler = handler
+        self.on_error = on_error
+        self.next_stage: Optional["PipelineStage"] = None
+        self.queue = queue.Queue(maxsize=max_queue_batches)
+        self._thread = threading.Thread(
+            target=self._run, name=f"pipeline-{name}", daemon=True)
+        metrics.PIPELINE_QUEUE_DEPTH.labels(name).set_function(self.queue.qsize)
+
+    def start(self) -> "PipelineStage":
+        self._thread.start()
+        return self
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        self._thread.join(timeout=timeout)
+
+    def put(self, item, timeout: float = 0) -> bool:
+        try:
+            self.queue.put(item, block=timeout > 0, timeout=timeout or None)
+        except queue.Full:
+            return False
+        return True
+
+    def _forward(self, item) -> None:
+        # Blocking is fine between stages, only the consumer thread must not
+        # block; give up if the downstream stage died
+        while not self.next_stage.put(item, timeout=0.1):
+            if not self.next_stage.is_alive():
+                raise RuntimeError(f"Pipeline stage {self.next_stage.name} is not running")
+
+    def _report(self, item) -> None:
+        if self.on_error is None:
+            return
+        try:
+            self.on_error(self.name, item)
+        except Exception:
+            logger.exception("Pipeline error callback failed",
+                             extra={"fields": {"stage": self.name}})
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            try:
+                result = self.handler(item)
+            except Exception:
+                metrics.ERRORS.labels(f"pipeline_{self.name}").inc()
+                logger.exception("Pipeline stage failed", extra={"fields": {"stage": self.name}})
+                self._report(item)
+                continue
+            if result is not None and self.next_stage is not None:
+                self._forward(result)
+
+        if self.next_stage is not None:
+            self._forward(_STOP)
+
+
+class Pipeline:
+    """Chain of PipelineStages fed from the consumer thread."""
+
+    def __init__(self, stages: List[Tuple[str, Callable[[Any], Any]]], max_queue_batches: int = 4,
+                 on_error: Callable[[str, Any], None] = None):
+        """
+        :param stages: (name, handler) pairs in processing order
+        :param max_queue_batches: Size of the queue in front of every stage
+        :param on_error: Called with the stage name and the item when a
+            handler raises, see PipelineStage
+        """
+        self.stages = [
+            PipelineStage(name, handler, max_queue_batches, on_error)
+            for name, handler in stages]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_stage = next_stage
+
+    def start(self) -> "Pipeline":
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def submit(self, item, timeout: float = 0) -> bool:
+        """
+        Hand an item to the first stage.
+        :param timeout: Seconds to wait for room in the queue, 0 never waits
+        :return: False if the first queue is full, True otherwise
+        """
+        return self.stages[0].put(item, timeout=timeout)
+
+    def is_alive(self) -> bool:
+        return all(stage.is_alive() for stage in self.stages)
+
+    def queue_depths(self) -> dict:
+        return {stage.name: stage.queue.qsize() for stage in self.stages}
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Process everything still queued and stop the stage threads."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self.stages[0].is_alive():
+            self.stages[0].queue.put(_STOP)
+        for stage in self.stages:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            stage.join(timeout=remaining)
@@ -0,0 +1,184 @@
+"""
+Cache of predictions for payloads that were already scored.
+
+Upstream retries, replays after rebalances and reprocessing jobs make the
+consumer see identical payloads again. Predictions are cached under a hash
+of the canonical JSON form of the input (sorted keys, no whitespace) and
+the model version, so a hot-swapped model never serves predictions of the
+previous version.
+
+LocalPredictionCache keeps up to max_entries predictions in process, evicts
+the least recently used ones and expires them after ttl seconds; it is
+cleared when the model version changes. RedisPredictionCache shares the
+cache between worker processes through any Redis-compatible server and
+relies on the server's key expiry; it needs the redis package.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List
+
+import metrics
+
+try:
+    import redis
+except ImportError:  # redis is only needed by RedisPredictionCache
+    redis = None
+
+logger = logging.getLogger("consumer.prediction_cache")
+
+# Returned by get_many for keys that are not cached (None is a valid prediction)
+MISS = object()
+
+
+def _json_default(value):
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def input_key(input_data: dict, model_version: str) -> str:
+    """Stable cache key of an input for a model version."""
+    canonical = json.dumps(
+        input_data, sort_keys=True, separators=(",", ":"), default=_json_default)
+    digest = hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{model_version}:{digest}"
+
+
+def _count(hits: int, misses: int) -> None:
+    if hits:
+        metrics.PREDICTION_CACHE_REQUESTS.labels("hit").inc(hits)
+    if misses:
+        metrics.PREDICTION_CACHE_REQUESTS.labels("miss").inc(misses)
+
+
+class LocalPredictionCache:
+    """In-process LRU cache with a TTL. Safe to use from several threads."""
+
+    def __init__(self, max_entries: int = 100000, ttl: float = 3600):
+        """
+        :param max_entries: Maximum number of cached predictions
+        :param ttl: Seconds a prediction stays valid, 0 keeps it until evicted
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_version = None
+        metrics.PREDICTION_CACHE_ENTRIES.set_function(lambda: len(self._entries))
+
+    def set_model_version(self, model_version: str) -> None:
+        """Drop every entry when the model version changes."""
+        if model_version == self._model_version:
+            return
+        with self._lock:
+            if self._model_version is not None:
+                logger.info("Model version changed, clearing the prediction cache",
+                            extra={"fields": {"entries": len(self._entries),
+                                              "model_version": model_version}})
+            self._entries.clear()
+            self._model_version = model_version
+
+    def get_many(self, keys: List[str]) -> List[Any]:
+        now = time.monotonic()
+        results = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None or (self.ttl and entry[1] <= now):
+                    if entry is not None:
+                        del self._entries[key]
+                    results.append(MISS)
+                    continue
+                self._entries.move_to_end(key)
+                results.append(entry[0])
+        hits = sum(result is not MISS for result in results)
+        _count(hits, len(keys) - hits)
+        return results
+
+    def put_many(self, keys: List[str], predictions: List[Any]) -> None:
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, prediction in zip(keys, predictions):
+                self._entries[key] = (prediction, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class RedisPredictionCache:
+    """
+    Prediction cache shared by all workers through Redis. Errors talking to
+    the server are counted and treated as misses, scoring never fails
+    because of the cache.
+    """
+
+    def __init__(self, url: str, ttl: float = 3600, prefix: str = "prediction:"):
+        """
+        :param url: Server URL, e.g. redis://localhost:6379/0
+        :param ttl: Seconds a prediction stays valid
+        :param prefix: Prefix of the keys written to the server
+        """
+        if redis is None:
+            raise ImportError("RedisPredictionCache requires redis: pip install redis")
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def set_model_version(self, model_version: str) -> None:
+        # Keys carry the model version, entries of older versions expire
+        pass
+
+    def get_many(self, keys: List[str]) -> List[Any]:
+        try:
+            values = self._client.mget([self.prefix + key for key in keys])
+        except redis.RedisError:
+            metrics.ERRORS.labels("prediction_cache").inc()
+            logger.warning("Prediction cache lookup failed", exc_info=True)
+            values = [None] * len(keys)
+        results = [MISS if value is None else json.loads(value) for value in values]
+        hits = sum(result is not MISS for result in results)
+        _count(hits, len(keys) - hits)
+        return results
+
+    def put_many(self, keys: List[str], predictions: List[Any]) -> None:
+        try:
+            pipeline = self._client.pipeline(transaction=False)
+            for key, prediction in zip(keys, predictions):
+                pipeline.set(self.prefix + key, json.dumps(prediction, default=_json_default),
+                             px=int(self.ttl * 1000) or None)
+            pipeline.execute()
+        except redis.RedisError:
+            metrics.ERRORS.labels("prediction_cache").inc()
+            logger.warning("Prediction cache update failed", exc_info=True)
+
+
+def cached_predictions(cache, model_version: str, inputs: List[dict],
+                       predict_misses, cacheable: Callable[[], bool] = None) -> list:
+    """
+    Predictions for inputs, scoring only the ones that are not cached.
+    :param cache: LocalPredictionCache or RedisPredictionCache
+    :param model_version: Version of the model predict_misses scores with
+    :param inputs: Decoded input records
+    :param predict_misses: Called with the positions of the inputs to score,
+        returns their predictions in the same order
+    :param cacheable: Called after predict_misses, the new predictions are
+        not cached if it returns False (e.g. a fallback model made them)
+    :return: One prediction per input, in order
+    """
+    cache.set_model_version(model_version)
+    keys = [input_key(input_data, model_version) for input_data in inputs]
+    predictions = cache.get_many(keys)
+    misses = [i for i, prediction in enumerate(predictions) if prediction is MISS]
+    if not misses:
+        return predictions
+
+    scored = predict_misses(misses)
+    for i, prediction in zip(misses, scored):
+        predictions[i] = prediction
+    if cacheable is None or cacheable():
+        cache.put_many([keys[i] for i in misses], scored)
+    return predictions
@@ -0,0 +1,525 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is only needed by ParquetPredictionSink
+    pa = None
+    pq = None
+
+# How often the file is fsync'ed: never, on every flush, or at most once
+# per fsync_interval seconds
+FSYNC_POLICIES = ("never", "flush", "interval")
+
+_STOP = object()
+
+
+class _Failed:
+    """Queue item carrying records that were never produced, see submit_failed."""
+
+    def __init__(self, records: List[dict]):
+        self.records = records
+
+
+# (topic, partition) -> offset
+Offsets = Dict[Tuple[str, int], int]
+
+logger = logging.getLogger("consumer.sinks")
+
+
+def _offset_ranges(records: List[dict]) -> Dict[Tuple[str, int], Tuple[int, int]]:
+    """Lowest and highest offset per (topic, partition) of a batch of records."""
+    ranges = {}
+    for record in records:
+        offset = record.get("offset")
+        if offset is None or offset < 0:
+            continue
+        tp = (record.get("topic"), record.get("partition"))
+        low, high = ranges.get(tp, (offset, offset))
+        ranges[tp] = (min(low, offset), max(high, offset))
+    return ranges
+
+
+def _merge_ranges(target: dict, ranges: dict) -> None:
+    for tp, (low, high) in ranges.items():
+        current_low, current_high = target.get(tp, (low, high))
+        target[tp] = (min(current_low, low), max(current_high, high))
+
+
+def _clear_ranges(target: dict, ranges: dict) -> None:
+    """Remove from target the offsets covered by ranges, from the low end."""
+    for tp, (low, high) in ranges.items():
+        if tp not in target:
+            continue
+        target_low, target_high = target[tp]
+        if low <= target_low <= high:
+            if high >= target_high:
+                del target[tp]
+            else:
+                target[tp] = (high + 1, target_high)
+
+
+def _json_default(value):
+    """Serialize numpy scalars/arrays that json.dumps does not know about."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class PredictionSink:
+    """
+    Base class for prediction sinks.
+
+    Records are handed over in batches through a bounded queue and written by
+    a dedicated thread, so the Kafka poll loop never touches the disk.
+    When the queue is full submit() returns False and the caller decides how
+    to apply backpressure. Subclasses implement _write, _flush and _close.
+
+    The sink also tracks the Kafka offsets of the records it has made
+    durable. committable_offsets() returns, per partition, the offset to
+    commit for at-least-once delivery: the lowest offset not yet durable,
+    or the next one after the highest durable offset. Records whose write
+    or flush failed are not durable, so commits stop at them until they are
+    consumed again (after a rebalance) and made durable this time.
+    Batches must be submitted in offset order per partition.
+    """
+
+    # Records are durable once _flush returns (subclasses that only make
+    # data readable later report it themselves with _mark_durable)
+    durable_on_flush = True
+
+    def __init__(
+        self,
+        max_queue_batches: int = 1000,
+        flush_records: int = 1000,
+        flush_interval: float = 1.0,
+    ):
+        """
+        :param max_queue_batches: Maximum number of batches waiting in the queue
+        :param flush_records: Flush once this many records are written
+        :param flush_interval: Flush at least every flush_interval seconds
+        """
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval
+        self.records_written = 0
+        self.batches_rejected = 0
+        self._queue = queue.Queue(maxsize=max_queue_batches)
+        # Offset ranges by state, only touched by the writer thread
+        self._unflushed = {}
+        self._durable = {}
+        self._failed = {}
+        self._offsets_lock = threading.Lock()
+        self._committable: Offsets = {}
+        self._thread = threading.Thread(
+            target=self._run, name=type(self).__name__, daemon=True)
+
+    def start(self) -> "PredictionSink":
+        self._thread.start()
+        return self
+
+    def submit(self, records: List[dict], timeout: float = 0) -> bool:
+        """
+        Queue a batch of records for writing.
+        :param records: Prediction records
+        :param timeout: Seconds to wait for room in the queue, 0 never waits
+        :return: False if the queue is full, True otherwise
+        """
+        if not records:
+            return True
+        try:
+            self._queue.put(records, block=timeout > 0, timeout=timeout or None)
+        except queue.Full:
+            self.batches_rejected += 1
+            return False
+        return True
+
+    def submit_failed(self, records: List[dict], timeout: float = 0) -> bool:
+        """
+        Report records that could not be produced, e.g. their scoring failed:
+        nothing is written and commits stop at their offsets like at a failed
+        write. They are queued behind the batches already submitted, so the
+        offset order per partition is kept.
+        :param records: Records, or just their topic, partition and offset
+        :param timeout: See submit
+        :return: False if the queue is full, True otherwise
+        """
+        if not records:
+            return True
+        return self.submit(_Failed(records), timeout=timeout)
+
+    def queue_depth(self) -> int:
+        """Number of batches waiting to be written."""
+        return self._queue.qsize()
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def committable_offsets(self) -> Offsets:
+        """Offset to commit per (topic, partition), see the class docstring."""
+        with self._offsets_lock:
+            return dict(self._committable)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Write everything still queued, flush and close the sink."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+
+    def _run(self) -> None:
+        pending = 0
+        last_flush = time.monotonic()
+        while True:
+            wait = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                batch = self._queue.get(timeout=wait)
+            except queue.Empty:
+                batch = None
+            if batch is _STOP:
+                break
+
+            if isinstance(batch, _Failed):
+                _merge_ranges(self._failed, _offset_ranges(batch.records))
+                self._publish_offsets()
+            elif batch:
+                start = time.perf_counter()
+                try:
+                    self._write(batch)
+                    self.records_written += len(batch)
+                    pending += len(batch)
+                    _merge_ranges(self._unflushed, _offset_ranges(batch))
+                except Exception:
+                    _merge_ranges(self._failed, _offset_ranges(batch))
+                    metrics.ERRORS.labels("sink_write").inc()
+                    logger.exception("Error writing records", extra={"fields": {
+                        "sink": type(self).__name__, "records": len(batch)}})
+                metrics.SINK_SECONDS.labels("write").observe(time.perf_counter() - start)
+
+            if pending >= self.flush_records or (
+                    time.monotonic() - last_flush >= self.flush_interval):
+                if pending:
+                    self._safe_flush()
+                pending = 0
+                last_flush = time.monotonic()
+
+        self._safe_flush()
+        try:
+            self._close()
+        except Exception:
+            metrics.ERRORS.labels("sink_flush").inc()
+            logger.exception("Error closing sink",
+                             extra={"fields": {"sink": type(self).__name__}})
+        self._publish_offsets()
+
+    def _safe_flush(self) -> None:
+        start = time.perf_counter()
+        try:
+            self._flush()
+            if self.durable_on_flush:
+                self._mark_durable(self._unflushed)
+        except Exception:
+            _merge_ranges(self._failed, self._unflushed)
+            metrics.ERRORS.labels("sink_flush").inc()
+            logger.exception("Error flushing sink",
+                             extra={"fields": {"sink": type(self).__name__}})
+        self._unflushed = {}
+        self._publish_offsets()
+        metrics.SINK_SECONDS.labels("flush").observe(time.perf_counter() - start)
+
+    def _mark_durable(self, ranges: dict) -> None:
+        _merge_ranges(self._durable, ranges)
+        _clear_ranges(self._failed, ranges)
+
+    def _outstanding_ranges(self) -> dict:
+        """Offset ranges written but not durable yet."""
+        return self._unflushed
+
+    def _publish_offsets(self) -> None:
+        outstanding = self._outstanding_ranges()
+        committable = {}
+        for tp, (_, high) in self._durable.items():
+            committable[tp] = high + 1
+        for ranges in (outstanding, self._failed):
+            for tp, (low, _) in ranges.items():
+                committable[tp] = min(committable.get(tp, low), low)
+        with self._offsets_lock:
+            self._committable = committable
+
+    def _write(self, records: List[dict]) -> None:
+        raise NotImplementedError
+
+    def _flush(self) -> None:
+        raise NotImplementedError
+
+    def _close(self) -> None:
+        raise NotImplementedError
+
+
+class JsonlPredictionSink(PredictionSink):
+    """
+    Appends records as JSON lines to a file kept open by the writer thread.
+    The file is rotated to "<name>.<timestamp><ext>" once it reaches
+    rotate_bytes or is older than rotate_seconds.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fsync_policy: str = "never",
+        fsync_interval: float = 5.0,
+        rotate_bytes: int = 0,
+        rotate_seconds: float = 0,
+        write_buffer_bytes: int = 1024 * 1024,
+        **kwargs,
+    ):
+        """
+        :param path: Path of the JSONL file
+        :param fsync_policy: One of FSYNC_POLICIES
+        :param fsync_interval: Seconds between fsyncs for the "interval" policy
+        :param rotate_bytes: Rotate once the file is this large, 0 disables
+        :param rotate_seconds: Rotate once the file is this old, 0 disables
+        :param write_buffer_bytes: Size of the userspace write buffer
+        """
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(
+                f"Unknown fsync policy '{fsync_policy}', expected one of {FSYNC_POLICIES}")
+        super().__init__(**kwargs)
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.write_buffer_bytes = write_buffer_bytes
+        self._file = None
+        self._size = 0
+        self._opened_at = 0.0
+        self._last_fsync = 0.0
+
+    def _open(self) -> None:
+        self._file = open(self.path, "ab", buffering=self.write_buffer_bytes)
+        self._size = self._file.tell()
+        self._opened_at = time.monotonic()
+
+    def _write(self, records: List[dict]) -> None:
+        if self._file is None:
+            self._open()
+        data = "".join(
+            json.dumps(record, default=_json_default) + "\n" for record in records
+        ).encode("utf-8")
+        self._file.write(data)
+        self._size += len(data)
+
+    def _flush(self) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        now = time.monotonic()
+        if self.fsync_policy == "flush" or (
+                self.fsync_policy == "interval"
+                and now - self._last_fsync >= self.fsync_interval):
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+
+        if (self.rotate_bytes and self._size >= self.rotate_bytes) or (
+                self.rotate_seconds and now - self._opened_at >= self.rotate_seconds):
+            self._rotate()
+
+    def _rotate(self) -> None:
+        self._close()
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}.{time.strftime('%Y%m%dT%H%M%S')}{ext}"
+        suffix = 1
+        while os.path.exists(rotated):
+            rotated = f"{base}.{time.strftime('%Y%m%dT%H%M%S')}-{suffix}{ext}"
+            suffix += 1
+        os.replace(self.path, rotated)
+        logger.info("Rotated prediction log", extra={"fields": {"path": self.path, "rotated": rotated}})
+
+    def _close(self) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        if self.fsync_policy != "never":
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+
+class _ParquetPartitionFile:
+    """An open Parquet file of one (model_version, hour) partition."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = path + ".inprogress"
+        self.writer = None
+        self.pending: List[dict] = []
+        self.rows = 0
+        self.opened_at = time.monotonic()
+        # Kafka offset ranges of the rows, durable once the file is closed
+        self.offsets = {}
+
+
+class ParquetPredictionSink(PredictionSink):
+    """
+    Writes records to Parquet files partitioned by model version and hour:
+
+        <root_dir>/model_version=<version>/hour=<YYYY-MM-DDTHH>/part-*.parquet
+
+    The model version is only stored in the partition path. Input features
+    are flattened into "input_<name>" columns so monitoring
+    jobs can read only the columns they need. Rows are buffered and written
+    as row groups of up to row_group_size rows. A file is written under a
+    ".inprogress" name and only renamed to ".parquet" once it is closed, on
+    rotation by rows, bytes or age, so readers never see a partial file.
+    An open file has no footer and cannot be read back after a crash, so
+    its offsets only become committable once the file is closed.
+    """
+
+    durable_on_flush = False
+
+    def __init__(
+        self,
+        root_dir: str,
+        row_group_size: int = 10000,
+        compression: str = "zstd",
+        rotate_rows: int = 1000000,
+        rotate_bytes: int = 256 * 1024 * 1024,
+        rotate_seconds: float = 3600,
+        **kwargs,
+    ):
+        """
+        :param root_dir: Directory the partitions are created in
+        :param row_group_size: Maximum number of rows per row group
+        :param compression: Parquet compression codec (zstd, snappy, gzip, none)
+        :param rotate_rows: Close a file once it has this many rows, 0 disables
+        :param rotate_bytes: Close a file once it is this large, 0 disables
+        :param rotate_seconds: Close a file once it is this old, 0 disables
+        """
+        if pq is None:
+            raise ImportError("ParquetPredictionSink requires pyarrow: pip install pyarrow")
+        kwargs.setdefault("flush_records", row_group_size)
+        super().__init__(**kwargs)
+        self.root_dir = root_dir
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.rotate_rows = rotate_rows
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self._files: Dict[Tuple[str, str], _ParquetPartitionFile] = {}
+        self._sequence = 0
+
+    @staticmethod
+    def _partition_key(record: dict) -> Tuple[str, str]:
+        hour = time.strftime("%Y-%m-%dT%H", time.gmtime(record["timestamp"]))
+        return str(record.get("model_version") or "unknown"), hour
+
+    @staticmethod
+    def _to_row(record: dict) -> dict:
+        row = {
+            "timestamp": datetime.fromtimestamp(record["timestamp"], timezone.utc),
+            "topic": record.get("topic"),
+            "partition": record.get("partition"),
+            "offset": record.get("offset"),
+            "prediction": record["prediction"],
+        }
+        for name, value in record["input"].items():
+            row[f"input_{name}"] = value
+        return row
+
+    def _open(self, key: Tuple[str, str]) -> _ParquetPartitionFile:
+        model_version, hour = key
+        directory = os.path.join(
+            self.root_dir, f"model_version={model_version}", f"hour={hour}")
+        os.makedirs(directory, exist_ok=True)
+        self._sequence += 1
+        name = f"part-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self._sequence}.parquet"
+        partition_file = _ParquetPartitionFile(os.path.join(directory, name))
+        self._files[key] = partition_file
+        return partition_file
+
+    def _write(self, records: List[dict]) -> None:
+        for record in records:
+            key = self._partition_key(record)
+            partition_file = self._files.get(key) or self._open(key)
+            partition_file.pending.append(self._to_row(record))
+            _merge_ranges(partition_file.offsets, _offset_ranges([record]))
+            if len(partition_file.pending) >= self.row_group_size:
+                self._write_row_group(key, partition_file)
+
+    def _write_row_group(self, key: Tuple[str, str], partition_file: _ParquetPartitionFile) -> None:
+        if not partition_file.pending:
+            return
+        table = pa.Table.from_pylist(partition_file.pending)
+        if partition_file.writer is not None:
+            schema = partition_file.writer.schema
+            try:
+                if set(table.schema.names) != set(schema.names):
+                    raise KeyError("columns differ")
+                table = table.select(schema.names).cast(schema)
+            except (KeyError, pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                # The input schema changed, continue in a new file
+                # The offsets cannot be split between the buffered rows and
+                # the rows already written, keep all of them outstanding
+                # until the new file is closed
+                offsets, partition_file.offsets = partition_file.offsets, {}
+                self._close_file(key, partition_file)
+                partition_file = self._open(key)
+                partition_file.offsets = offsets
+        if partition_file.writer is None:
+            partition_file.writer = pq.ParquetWriter(
+                partition_file.tmp_path, table.schema, compression=self.compression)
+        partition_file.writer.write_table(table, row_group_size=self.row_group_size)
+        partition_file.rows += table.num_rows
+        partition_file.pending = []
+
+    def _close_file(self, key: Tuple[str, str], partition_file: _ParquetPartitionFile) -> None:
+        self._files.pop(key, None)
+        if partition_file.writer is None:
+            return
+        try:
+            partition_file.writer.close()
+            os.replace(partition_file.tmp_path, partition_file.path)
+        except Exception:
+            _merge_ranges(self._failed, partition_file.offsets)
+            raise
+        self._mark_durable(partition_file.offsets)
+        logger.info("Closed Parquet file", extra={"fields": {
+            "path": partition_file.path, "rows": partition_file.rows}})
+
+    def _outstanding_ranges(self) -> dict:
+        outstanding = {}
+        for partition_file in self._files.values():
+            _merge_ranges(outstanding, partition_file.offsets)
+        return outstanding
+
+    def _flush(self) -> None:
+        now = time.monotonic()
+        current_hour = time.strftime("%Y-%m-%dT%H", time.gmtime())
+        for key, partition_file in list(self._files.items()):
+            self._write_row_group(key, partition_file)
+            partition_file = self._files.get(key)
+            if partition_file is None or partition_file.writer is None:
+                continue
+            if (key[1] != current_hour
+                    or (self.rotate_rows and partition_file.rows >= self.rotate_rows)
+                    or (self.rotate_bytes
+                        and os.path.getsize(partition_file.tmp_path) >= self.rotate_bytes)
+                    or (self.rotate_seconds
+                        and now - partition_file.opened_at >= self.rotate_seconds)):
+                self._close_file(key, partition_file)
+
+    def _close(self) -> None:
+        for key, partition_file in list(self._files.items()):
+            self._write_row_group(key, partition_file)
+            partition_file = self._files.get(key)
+            if partition_file is not None:
+                self._close_file(key, partition_file)
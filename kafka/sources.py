@@ -0,0 +1,525 @@
+"""
+Message sources the consumer can read from instead of a Kafka topic.
+
+A source implements the part of confluent_kafka.Consumer the consumer
+uses: poll(timeout), consume(num_messages, timeout), assignment(),
+pause(partitions), resume(partitions) and close(), and hands out messages
+with the Kafka message accessors (value(), topic(), partition(), offset(),
+timestamp(), error()). The read loops, decoders and sinks therefore run
+unchanged on any source, which makes it possible to benchmark and profile
+the scoring path without a broker (see benchmarks/load_test.py).
+
+- a confluent_kafka.Consumer is the Kafka source of the live consumer;
+- KafkaRangeSource reads [start, end) offset ranges, for backfills;
+- JsonlFileSource replays raw JSON payloads or a JSONL prediction log;
+- ParquetFileSource replays Parquet files, e.g. the Parquet sink's output;
+- SyntheticSource generates transactions;
+- RateLimitedSource releases another source's messages at a fixed rate.
+
+Bounded sources are exhausted once everything has been read, and report
+progress as (done, total) in units of their own (offsets, bytes, rows).
+"""
+import logging
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from confluent_kafka import OFFSET_END, Consumer, KafkaError, TopicPartition
+
+from decoders import dumps, loads
+
+try:
+    import pyarrow.dataset as pa_dataset
+except ImportError:  # pyarrow is only needed by ParquetFileSource
+    pa_dataset = None
+
+logger = logging.getLogger("consumer.sources")
+
+# confluent_kafka timestamp types
+TIMESTAMP_NOT_AVAILABLE = 0
+TIMESTAMP_CREATE_TIME = 1
+
+
+class SourceMessage:
+    """Message read from a source other than Kafka, with the Kafka message accessors."""
+
+    __slots__ = ("_value", "_topic", "_partition", "_offset", "_timestamp_ms")
+
+    def __init__(self, value: bytes, topic: str, partition: int, offset: int,
+                 timestamp_ms: Optional[int] = None):
+        self._value = value
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._timestamp_ms = timestamp_ms
+
+    def value(self) -> bytes:
+        return self._value
+
+    def key(self):
+        return None
+
+    def topic(self) -> str:
+        return self._topic
+
+    def partition(self) -> int:
+        return self._partition
+
+    def offset(self) -> int:
+        return self._offset
+
+    def timestamp(self) -> Tuple[int, int]:
+        if self._timestamp_ms is None:
+            return TIMESTAMP_NOT_AVAILABLE, -1
+        return TIMESTAMP_CREATE_TIME, self._timestamp_ms
+
+    def error(self):
+        return None
+
+
+class MessageSource:
+    """
+    Base of the sources that are not Kafka consumers. Subclasses implement
+    _read(num_messages), which returns the messages available right now
+    (possibly none), and set exhausted once they will never return more.
+    Pausing pauses the whole source.
+    """
+
+    exhausted = False
+
+    def __init__(self):
+        self._paused = False
+        self._partitions = set()
+
+    def _read(self, num_messages: int) -> list:
+        raise NotImplementedError
+
+    def _wait(self, timeout: float) -> None:
+        """Wait for more messages, at most timeout seconds."""
+        time.sleep(timeout)
+
+    def consume(self, num_messages: int = 1, timeout: float = -1) -> list:
+        """
+        Up to num_messages messages, waiting at most timeout seconds for the
+        first ones. A negative timeout never waits.
+        """
+        deadline = time.monotonic() + max(0.0, timeout)
+        while True:
+            messages = [] if self._paused else self._read(num_messages)
+            remaining = deadline - time.monotonic()
+            if messages or remaining <= 0:
+                break
+            self._wait(remaining)
+        for msg in messages:
+            self._partitions.add((msg.topic(), msg.partition()))
+        return messages
+
+    def poll(self, timeout: float = -1):
+        messages = self.consume(1, timeout)
+        return messages[0] if messages else None
+
+    def assignment(self) -> List[TopicPartition]:
+        return [TopicPartition(topic, partition) for topic, partition in sorted(self._partitions)]
+
+    def pause(self, partitions: List[TopicPartition]) -> None:
+        self._paused = True
+
+    def resume(self, partitions: List[TopicPartition]) -> None:
+        self._paused = False
+
+    def close(self) -> None:
+        pass
+
+
+class PartitionRange(NamedTuple):
+    topic: str
+    partition: int
+    start: int  # first offset to read
+    end: int    # offset after the last one to read
+
+    @property
+    def size(self) -> int:
+        return max(0, self.end - self.start)
+
+
+def resolve_ranges(
+    conf: dict,
+    topic: str,
+    partitions: Optional[List[int]] = None,
+    start_time_ms: Optional[int] = None,
+    end_time_ms: Optional[int] = None,
+    start_offset: Optional[int] = None,
+    end_offset: Optional[int] = None,
+    timeout: float = 10,
+) -> List[PartitionRange]:
+    """
+    Offset ranges of a topic's partitions between two times or offsets.
+    Missing bounds default to the oldest retained and the latest offset.
+    :param conf: librdkafka configuration (bootstrap.servers...)
+    :param partitions: Partitions to read, all by default
+    :return: One range per partition, empty ranges included
+    """
+    consumer = Consumer({**conf, "enable.auto.commit": False})
+    try:
+        if partitions is None:
+            metadata = consumer.list_topics(topic, timeout=timeout)
+            if topic not in metadata.topics or metadata.topics[topic].error is not None:
+                raise ValueError(f"Topic {topic} not found")
+            partitions = sorted(metadata.topics[topic].partitions)
+
+        def offsets_at(time_ms: int) -> Dict[int, int]:
+            found = consumer.offsets_for_times(
+                [TopicPartition(topic, p, time_ms) for p in partitions], timeout=timeout)
+            # -1 (OFFSET_END): no message at or after that time
+            return {tp.partition: tp.offset for tp in found}
+
+        starts = offsets_at(start_time_ms) if start_time_ms is not None else {}
+        ends = offsets_at(end_time_ms) if end_time_ms is not None else {}
+        ranges = []
+        for p in partitions:
+            low, high = consumer.get_watermark_offsets(
+                TopicPartition(topic, p), timeout=timeout)
+            start = starts.get(p, low if start_offset is None else start_offset)
+            end = ends.get(p, high if end_offset is None else end_offset)
+            start = high if start == OFFSET_END else max(low, start)
+            end = high if end == OFFSET_END else min(high, end)
+            ranges.append(PartitionRange(topic, p, start, end))
+        return ranges
+    finally:
+        consumer.close()
+
+
+class KafkaRangeSource:
+    """
+    Reads offset ranges with a manually assigned consumer: no consumer group
+    rebalances and no commits. Each (topic, partition) may appear in one
+    range only.
+    """
+
+    def __init__(self, conf: dict, ranges: List[PartitionRange]):
+        """
+        :param conf: librdkafka configuration (bootstrap.servers...)
+        :param ranges: Offset ranges to read
+        """
+        self.ranges = {(r.topic, r.partition): r for r in ranges}
+        if len(self.ranges) != len(ranges):
+            raise ValueError("A partition may only appear in one range per source")
+        self._positions = {key: r.start for key, r in self.ranges.items()}
+        self._remaining = {key for key, r in self.ranges.items() if r.size > 0}
+        self._consumer = Consumer({
+            "group.id": "backfill",
+            **conf,
+            "enable.auto.commit": False,
+            "enable.partition.eof": True,
+        })
+        self._consumer.assign([
+            TopicPartition(topic, partition, self.ranges[(topic, partition)].start)
+            for topic, partition in self._remaining])
+
+    @property
+    def exhausted(self) -> bool:
+        return not self._remaining
+
+    def progress(self) -> Tuple[int, int]:
+        """Offsets read and offsets in the ranges."""
+        done = sum(min(self._positions[key], r.end) - r.start
+                   for key, r in self.ranges.items() if r.size > 0)
+        return done, sum(r.size for r in self.ranges.values())
+
+    def consume(self, num_messages: int = 1, timeout: float = -1) -> list:
+        """Next messages inside the ranges, an empty list once exhausted."""
+        if self.exhausted:
+            return []
+        messages = []
+        for msg in self._consumer.consume(num_messages=num_messages, timeout=timeout):
+            key = (msg.topic(), msg.partition())
+            if msg.error():
+                if msg.error().code() == KafkaError._PARTITION_EOF:
+                    self._done(key)
+                else:
+                    messages.append(msg)
+                continue
+            r = self.ranges.get(key)
+            if key not in self._remaining or msg.offset() >= r.end:
+                self._done(key)
+                continue
+            self._positions[key] = msg.offset() + 1
+            messages.append(msg)
+            if msg.offset() + 1 >= r.end:
+                self._done(key)
+        if not messages and self._remaining:
+            # The last offsets may be transaction markers or compacted away
+            for tp in self._consumer.position([TopicPartition(t, p) for t, p in self._remaining]):
+                if tp.offset >= self.ranges[(tp.topic, tp.partition)].end:
+                    self._done((tp.topic, tp.partition))
+        return messages
+
+    def _done(self, key: Tuple[str, int]) -> None:
+        if key not in self._remaining:
+            return
+        self._remaining.discard(key)
+        self._positions[key] = self.ranges[key].end
+        self._consumer.pause([TopicPartition(*key)])
+
+    def close(self) -> None:
+        self._consumer.close()
+
+
+class JsonlFileSource(MessageSource):
+    """
+    Replays a JSONL file. Raw payload lines become messages of partition 0
+    at their line number, without timestamp; prediction records keep their
+    topic, partition, offset and timestamp. With shards > 1 the source only
+    returns every shards-th line, starting at line shard.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        topic: str = "file",
+        shard: int = 0,
+        shards: int = 1,
+        start_time_ms: Optional[int] = None,
+        end_time_ms: Optional[int] = None,
+    ):
+        """
+        :param path: JSONL file to replay
+        :param topic: Topic name given to raw payload messages
+        :param shard: Index of the lines returned by this source
+        :param shards: Number of sources the file is split between
+        :param start_time_ms: Skip records older than this
+        :param end_time_ms: Skip records from this time on
+        """
+        super().__init__()
+        self.path = path
+        self.topic = topic
+        self.shard = shard
+        self.shards = shards
+        self.start_time_ms = start_time_ms
+        self.end_time_ms = end_time_ms
+        self._size = os.path.getsize(path)
+        self._file = open(path, "rb")
+        self._line = 0
+        self.exhausted = False
+
+    def progress(self) -> Tuple[int, int]:
+        """Bytes read and size of the file."""
+        return (self._size if self.exhausted else self._file.tell()), self._size
+
+    def _read(self, num_messages: int) -> list:
+        messages = []
+        while len(messages) < num_messages and not self.exhausted:
+            line = self._file.readline()
+            if not line:
+                self.exhausted = True
+                break
+            number = self._line
+            self._line += 1
+            if number % self.shards != self.shard or not line.strip():
+                continue
+            msg = self._message(line, number)
+            if msg is not None:
+                messages.append(msg)
+        return messages
+
+    def _message(self, line: bytes, number: int) -> Optional[SourceMessage]:
+        if b'"input"' in line:
+            try:
+                record = loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict) and "input" in record and "offset" in record:
+                timestamp_ms = None
+                if record.get("timestamp") is not None:
+                    timestamp_ms = int(record["timestamp"] * 1000)
+                    if self.start_time_ms is not None and timestamp_ms < self.start_time_ms:
+                        return None
+                    if self.end_time_ms is not None and timestamp_ms >= self.end_time_ms:
+                        return None
+                return SourceMessage(
+                    dumps(record["input"]), record.get("topic") or self.topic,
+                    record.get("partition") or 0, record["offset"], timestamp_ms)
+        return SourceMessage(line.rstrip(b"\r\n"), self.topic, 0, number)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetFileSource(MessageSource):
+    """
+    Replays Parquet files: a file, or a directory of hive-partitioned files
+    such as the output of ParquetPredictionSink. Every row becomes a JSON
+    payload of partition 0 at its row number. Files written by the sink
+    are recognised by their "input_" columns: the payload is rebuilt from
+    those columns and the rows keep their topic, partition, offset and
+    timestamp.
+    """
+
+    def __init__(self, path: str, topic: str = "file", batch_rows: int = 10000):
+        """
+        :param path: Parquet file or directory
+        :param topic: Topic name given to messages without one
+        :param batch_rows: Rows read from the files at once
+        """
+        if pa_dataset is None:
+            raise ImportError("ParquetFileSource requires pyarrow: pip install pyarrow")
+        super().__init__()
+        self.path = path
+        self.topic = topic
+        dataset = pa_dataset.dataset(path, format="parquet", partitioning="hive")
+        self._total = dataset.count_rows()
+        self._batches = dataset.to_batches(batch_size=batch_rows)
+        self._buffer = []
+        self._row = 0
+
+    def progress(self) -> Tuple[int, int]:
+        """Rows read and rows in the files."""
+        return self._row - len(self._buffer), self._total
+
+    def _read(self, num_messages: int) -> list:
+        while len(self._buffer) < num_messages and not self.exhausted:
+            batch = next(self._batches, None)
+            if batch is None:
+                self.exhausted = True
+                break
+            self._buffer.extend(self._messages(batch.to_pylist()))
+        messages = self._buffer[:num_messages]
+        del self._buffer[:num_messages]
+        return messages
+
+    def _messages(self, rows: List[dict]) -> list:
+        messages = []
+        for row in rows:
+            number = self._row
+            self._row += 1
+            inputs = {key[6:]: value for key, value in row.items() if key.startswith("input_")}
+            if not inputs or row.get("offset") is None:
+                messages.append(SourceMessage(dumps(row), self.topic, 0, number))
+                continue
+            timestamp = row.get("timestamp")
+            messages.append(SourceMessage(
+                dumps(inputs), row.get("topic") or self.topic, row.get("partition") or 0,
+                row["offset"],
+                None if timestamp is None else int(timestamp.timestamp() * 1000)))
+        return messages
+
+
+class SyntheticSource(MessageSource):
+    """
+    Generates card transactions with the features of the benchmark model
+    (amount, merchant_category, hour, card_age_days), spread round-robin
+    over partitions, as fast as they are consumed.
+    """
+
+    def __init__(self, count: Optional[int] = None, partitions: int = 1,
+                 topic: str = "synthetic", seed: int = 42):
+        """
+        :param count: Messages to generate, None never stops
+        :param partitions: Partitions the messages are spread over
+        :param topic: Topic name of the messages
+        :param seed: Seed of the random generator
+        """
+        super().__init__()
+        self.count = count
+        self.partitions = partitions
+        self.topic = topic
+        self._rng = np.random.default_rng(seed)
+        self._generated = 0
+
+    def progress(self) -> Tuple[int, Optional[int]]:
+        """Messages generated and messages to generate."""
+        return self._generated, self.count
+
+    def _read(self, num_messages: int) -> list:
+        if self.count is not None:
+            num_messages = min(num_messages, self.count - self._generated)
+        if num_messages <= 0:
+            self.exhausted = True
+            return []
+        rng = self._rng
+        amounts = rng.gamma(2.0, 50.0, num_messages)
+        categories = rng.integers(0, 20, num_messages)
+        hours = rng.integers(0, 24, num_messages)
+        card_ages = rng.integers(1, 3650, num_messages)
+        now_ms = int(time.time() * 1000)
+        messages = []
+        for i in range(num_messages):
+            number = self._generated + i
+            payload = {
+                "amount": float(amounts[i]),
+                "merchant_category": int(categories[i]),
+                "hour": int(hours[i]),
+                "card_age_days": int(card_ages[i]),
+            }
+            messages.append(SourceMessage(
+                dumps(payload), self.topic, number % self.partitions,
+                number // self.partitions, now_ms))
+        self._generated += num_messages
+        return messages
+
+
+class RateLimitedSource(MessageSource):
+    """
+    Releases the messages of another source at a fixed rate: message k is
+    due at start + k / rate. With record_release_times, the due time of
+    every released message is kept in release_times until the caller pops
+    it, so latency can be measured from when a message was due rather than
+    from when it was consumed (no coordinated omission: a slow consumer
+    does not slow down the schedule).
+    """
+
+    def __init__(self, source: MessageSource, rate: float, count: Optional[int] = None,
+                 record_release_times: bool = False):
+        """
+        :param source: Source the messages come from
+        :param rate: Messages per second
+        :param count: Messages to release at most, None until the source ends
+        :param record_release_times: Fill release_times; the caller must pop
+            every entry or it grows by one per message
+        """
+        super().__init__()
+        self.source = source
+        self.rate = rate
+        self.count = count
+        self.record_release_times = record_release_times
+        self.release_times: Dict[Tuple[str, int, int], float] = {}
+        self.released = 0
+        self._started = None
+
+    @property
+    def exhausted(self) -> bool:
+        return self.source.exhausted or (self.count is not None and self.released >= self.count)
+
+    def progress(self):
+        return self.source.progress()
+
+    def _due(self, now: float) -> int:
+        if self._started is None:
+            self._started = now
+        due = int((now - self._started) * self.rate) + 1
+        if self.count is not None:
+            due = min(due, self.count)
+        return due - self.released
+
+    def _wait(self, timeout: float) -> None:
+        if self._started is None or self.exhausted:
+            time.sleep(timeout)
+            return
+        next_due = self._started + self.released / self.rate
+        time.sleep(max(0.0, min(timeout, next_due - time.perf_counter())))
+
+    def _read(self, num_messages: int) -> list:
+        due = self._due(time.perf_counter())
+        if due <= 0:
+            return []
+        messages = self.source.consume(min(num_messages, due), timeout=-1)
+        if self.record_release_times:
+            for i, msg in enumerate(messages):
+                self.release_times[(msg.topic(), msg.partition(), msg.offset())] = (
+                    self._started + (self.released + i) / self.rate)
+        self.released += len(messages)
+        return messages
+
+    def close(self) -> None:
+        self.source.close()
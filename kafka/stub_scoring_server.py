@@ -0,0 +1,53 @@
+"""
+Stand-in for a remote model server, to run async_consumer.py locally.
+
+Speaks the subset of the MLflow scoring protocol the consumer uses: POST
+/invocations with {"dataframe_records": [...]} returns {"predictions": [...]}.
+The prediction is 1 when the "amount" field is above --threshold, 0
+otherwise. --latency-ms delays every response to mimic a real model server,
+--jitter-ms adds a random extra delay so responses complete out of order.
+
+Usage:
+    python stub_scoring_server.py --port 5001 --latency-ms 20
+"""
+import argparse
+import asyncio
+import random
+
+from aiohttp import web
+
+
+def create_app(latency_ms: float = 0, threshold: float = 500.0,
+               jitter_ms: float = 0) -> web.Application:
+    async def invocations(request: web.Request) -> web.Response:
+        body = await request.json()
+        records = body.get("dataframe_records")
+        if not isinstance(records, list):
+            return web.json_response(
+                {"error_code": "BAD_REQUEST", "message": "dataframe_records is required"},
+                status=400)
+        delay_ms = latency_ms + random.uniform(0, jitter_ms)
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000.0)
+        predictions = [int(float(record.get("amount", 0)) > threshold) for record in records]
+        return web.json_response({"predictions": predictions})
+
+    async def ping(request: web.Request) -> web.Response:
+        return web.Response(text="\n")
+
+    app = web.Application()
+    app.router.add_post("/invocations", invocations)
+    app.router.add_get("/ping", ping)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--threshold", type=float, default=500.0)
+    args = parser.parse_args()
+    web.run_app(create_app(args.latency_ms, args.threshold, args.jitter_ms),
+                host=args.host, port=args.port)
@@ -0,0 +1,155 @@
+"""
+Run several consumer processes in the same Kafka consumer group.
+
+The model is loaded once by the supervisor and inherited copy-on-write by
+the forked workers, so N workers do not pay N model loads or N copies of
+the model in memory. Each worker creates its own Kafka consumer, sink and
+model watcher after the fork (librdkafka handles and threads do not
+survive a fork), so hot-reloaded versions are loaded by every worker.
+Crashed workers are restarted with exponential backoff. SIGTERM/SIGINT
+are forwarded to every worker and the supervisor exits once all of them
+have drained their sinks.
+
+Usage:
+    CONSUMER_WORKERS=4 MLFLOW_MODEL_NAME=fraud-model python supervisor.py
+
+Throughput only scales while there are at least as many topic partitions
+as workers; extra workers stay idle in the group.
+"""
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+import consumer
+from consumer_logging import configure_logging
+from model_watcher import ModelHandle
+
+CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", str(os.cpu_count() or 1)))
+# Restart delay doubles on every crash of the same worker, up to the maximum
+WORKER_RESTART_BACKOFF = float(os.getenv("WORKER_RESTART_BACKOFF", "1"))
+WORKER_MAX_RESTART_BACKOFF = float(os.getenv("WORKER_MAX_RESTART_BACKOFF", "60"))
+# A worker that stayed up this long gets its backoff reset
+WORKER_STABLE_SECONDS = 60
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", "30"))
+
+running = True
+
+logger = logging.getLogger("consumer.supervisor")
+
+
+def shutdown_handler(sig, frame):
+    global running
+    logger.info("Shutdown signal received, stopping workers.")
+    running = False
+
+
+def worker_main(model_handle: ModelHandle, registry, worker_id: int) -> None:
+    """Entry point of a forked worker process."""
+    # The supervisor's handlers were inherited, the worker stops on its own flag
+    signal.signal(signal.SIGINT, consumer.shutdown_handler)
+    signal.signal(signal.SIGTERM, consumer.shutdown_handler)
+    consumer.running = True
+    logger.info("Worker started", extra={"fields": {"worker_id": worker_id, "pid": os.getpid()}})
+    consumer.run_consumer(model_handle, registry, worker_id=worker_id)
+
+
+def stop_workers(processes: dict) -> int:
+    """
+    Forward SIGTERM to all workers and wait for them to exit.
+    :return: 0 if every worker exited cleanly, 1 otherwise
+    """
+    for process in processes.values():
+        if process.is_alive():
+            process.terminate()
+
+    deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT
+    exit_code = 0
+    for worker_id, process in processes.items():
+        process.join(timeout=max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning("Worker did not stop in time, killing it",
+                           extra={"fields": {"worker_id": worker_id}})
+            process.kill()
+            process.join()
+            exit_code = 1
+        elif process.exitcode != 0:
+            logger.warning("Worker exited with an error", extra={"fields": {
+                "worker_id": worker_id, "exit_code": process.exitcode}})
+            exit_code = 1
+    return exit_code
+
+
+def supervise(
+        model_handle: ModelHandle, registry, workers: int = CONSUMER_WORKERS) -> int:
+    """
+    Fork the workers and keep them running until a shutdown signal.
+    :param model_handle: Handle to the model shared with the workers
+    :param registry: Registry the workers poll for new model versions
+    :param workers: Number of worker processes
+    :return: Aggregated exit code of the workers
+    """
+    context = multiprocessing.get_context("fork")
+    processes = {}
+    started_at = {}
+    failures = {worker_id: 0 for worker_id in range(workers)}
+    restart_at = {worker_id: 0.0 for worker_id in range(workers)}
+
+    # Move everything allocated so far (the model included) out of the
+    # collector's reach, so gc passes in the workers do not write to those
+    # pages and break copy-on-write sharing
+    gc.collect()
+    gc.freeze()
+
+    while running:
+        now = time.monotonic()
+        for worker_id in range(workers):
+            process = processes.get(worker_id)
+            if process is not None and process.is_alive():
+                continue
+
+            if process is not None:
+                # The worker died on its own
+                process.join()
+                if now - started_at[worker_id] >= WORKER_STABLE_SECONDS:
+                    failures[worker_id] = 0
+                failures[worker_id] += 1
+                backoff = min(
+                    WORKER_RESTART_BACKOFF * 2 ** (failures[worker_id] - 1),
+                    WORKER_MAX_RESTART_BACKOFF)
+                logger.warning("Worker exited, restarting it", extra={"fields": {
+                    "worker_id": worker_id, "exit_code": process.exitcode,
+                    "restart_in_seconds": backoff}})
+                restart_at[worker_id] = now + backoff
+                del processes[worker_id]
+
+            if now < restart_at[worker_id]:
+                continue
+
+            process = context.Process(
+                target=worker_main, args=(model_handle, registry, worker_id),
+                name=f"consumer-worker-{worker_id}")
+            process.start()
+            processes[worker_id] = process
+            started_at[worker_id] = now
+
+        time.sleep(0.5)
+
+    return stop_workers(processes)
+
+
+if __name__ == "__main__":
+    configure_logging()
+    signal.signal(signal.SIGINT, shutdown_handler)
+    signal.signal(signal.SIGTERM, shutdown_handler)
+
+    registry = consumer.create_model_registry()
+
+    logger.info("Loading model...")
+    model_handle = consumer.load_startup_model(registry)
+
+    logger.info("Starting consumer workers", extra={"fields": {"workers": CONSUMER_WORKERS}})
+    sys.exit(supervise(model_handle, registry, CONSUMER_WORKERS))
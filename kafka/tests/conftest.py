@@ -0,0 +1,114 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# The consumer modules import each other as top-level modules (they run as
+# scripts from kafka/), add kafka/ to the Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import consumer  # noqa: E402
+from decoders import dumps  # noqa: E402
+from sinks import PredictionSink  # noqa: E402
+from sources import SourceMessage  # noqa: E402
+
+
+class ListSink:
+    """PredictionSink stand-in keeping the submitted records in memory."""
+
+    def __init__(self, accept: bool = True):
+        self.accept = accept
+        self.records = []
+        self.failed = []
+        self.closed = False
+
+    def submit(self, records, timeout: float = 0) -> bool:
+        if self.accept:
+            self.records.extend(records)
+        return self.accept
+
+    def submit_failed(self, records, timeout: float = 0) -> bool:
+        if self.accept:
+            self.failed.extend(records)
+        return self.accept
+
+    def queue_depth(self) -> int:
+        return 0
+
+    def is_alive(self) -> bool:
+        return True
+
+    def close(self, timeout=None) -> None:
+        self.closed = True
+
+
+class MemorySink(PredictionSink):
+    """Sink keeping the records in memory, failing to write the batches
+    holding fail_offsets. Flushes after every batch."""
+
+    def __init__(self, fail_offsets=(), **kwargs):
+        kwargs.setdefault("flush_records", 1)
+        super().__init__(**kwargs)
+        self.fail_offsets = set(fail_offsets)
+        self.written = []
+
+    def _write(self, batch):
+        if any(record["offset"] in self.fail_offsets for record in batch):
+            raise OSError("disk full")
+        self.written.extend(batch)
+
+    def _flush(self):
+        pass
+
+    def _close(self):
+        pass
+
+
+class StoppingSource:
+    """Hands out the given batches, then clears consumer.running."""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+
+    def consume(self, num_messages=1, timeout=-1):
+        if not self.batches:
+            consumer.running = False
+            return []
+        return self.batches.pop(0)
+
+    def poll(self, timeout=-1):
+        while self.batches and not self.batches[0]:
+            self.batches.pop(0)
+        if not self.batches:
+            consumer.running = False
+            return None
+        return self.batches[0].pop(0)
+
+
+@pytest.fixture
+def list_sink():
+    return ListSink()
+
+
+@pytest.fixture
+def make_messages():
+    """Kafka-like messages of a list of payloads, at consecutive offsets."""
+    def make(payloads, topic="transactions", partition=0, first_offset=0,
+             timestamp_ms=None):
+        return [
+            SourceMessage(dumps(payload), topic, partition, first_offset + i,
+                          None if timestamp_ms is None else timestamp_ms + i)
+            for i, payload in enumerate(payloads)
+        ]
+    return make
+
+
+def wait_for(predicate, timeout: float = 5.0) -> bool:
+    """Poll predicate until it is true, for state changed by another thread."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
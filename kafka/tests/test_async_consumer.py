@@ -0,0 +1,75 @@
+import asyncio
+
+import aiohttp
+from aiohttp.test_utils import TestServer
+
+import async_consumer
+import consumer
+from conftest import MemorySink, StoppingSource
+from stub_scoring_server import create_app
+
+PAYLOADS = [{"amount": float(100 * i)} for i in range(10)]
+
+
+class FailingScorer:
+    """Wraps a scorer, failing the batches that start at fail_offsets."""
+
+    def __init__(self, scorer, fail_offsets):
+        self.scorer = scorer
+        self.fail_offsets = set(fail_offsets)
+
+    async def score(self, batch):
+        if batch.messages[0].offset() in self.fail_offsets:
+            raise aiohttp.ClientError("503 Service Unavailable")
+        return await self.scorer.score(batch)
+
+
+def run(source, sink, fail_offsets=(), **kwargs):
+    async def main():
+        async with TestServer(create_app(threshold=450, jitter_ms=5)) as server:
+            async with aiohttp.ClientSession() as session:
+                scorer = async_consumer.RemoteScorer(
+                    session, str(server.make_url("/invocations")), model_version="7")
+                if fail_offsets:
+                    scorer = FailingScorer(scorer, fail_offsets)
+                await async_consumer.read_messages_async(source, sink, scorer, **kwargs)
+
+    consumer.running = True
+    try:
+        asyncio.run(main())
+    finally:
+        consumer.running = True
+        sink.close(timeout=5)
+
+
+def test_split_by_partition(make_messages):
+    messages = make_messages(PAYLOADS[:3], partition=0) + make_messages(PAYLOADS[:2], partition=1)
+    chunks = async_consumer.split_by_partition(messages, chunk_size=2)
+    assert [[(m.partition(), m.offset()) for m in chunk] for chunk in chunks] == [
+        [(0, 0), (0, 1)], [(0, 2)], [(1, 0), (1, 1)]]
+
+
+def test_records_reach_the_sink_in_offset_order(make_messages):
+    """Requests complete out of order, records are delivered in order"""
+    sink = MemorySink().start()
+    source = StoppingSource([make_messages(PAYLOADS, partition=p) for p in (0, 1)])
+
+    run(source, sink, chunk_size=2, concurrency=8)
+
+    for partition in (0, 1):
+        written = [r for r in sink.written if r["partition"] == partition]
+        assert [r["offset"] for r in written] == list(range(10))
+        assert [r["prediction"] for r in written] == [0] * 5 + [1] * 5
+    assert {r["model_version"] for r in sink.written} == {"7"}
+    assert sink.committable_offsets() == {("transactions", 0): 10, ("transactions", 1): 10}
+
+
+def test_failed_batches_are_not_committed(make_messages):
+    """Offsets of a batch the server failed to score stay uncommitted"""
+    sink = MemorySink().start()
+    source = StoppingSource([make_messages(PAYLOADS)])
+
+    run(source, sink, fail_offsets={4}, chunk_size=2)
+
+    assert [r["offset"] for r in sink.written] == [0, 1, 2, 3, 6, 7, 8, 9]
+    assert sink.committable_offsets() == {("transactions", 0): 4}
@@ -0,0 +1,101 @@
+import pytest
+
+import consumer
+from conftest import ListSink
+from sources import SourceMessage
+
+
+class PausingConsumer:
+    """Consumer recording pauses and seeks; the sink frees up after polls."""
+
+    def __init__(self, sink, polls_until_room=3, message=None):
+        self.sink = sink
+        self.polls_until_room = polls_until_room
+        self.message = message
+        self.polls = 0
+        self.events = []
+
+    def assignment(self):
+        return ["tp0", "tp1"]
+
+    def pause(self, partitions):
+        self.events.append(("pause", list(partitions)))
+
+    def resume(self, partitions):
+        self.events.append(("resume", list(partitions)))
+
+    def seek(self, tp):
+        self.events.append(("seek", (tp.topic, tp.partition, tp.offset)))
+
+    def poll(self, timeout=None):
+        self.polls += 1
+        if self.polls >= self.polls_until_room:
+            self.sink.accept = True
+        msg, self.message = self.message, None
+        return msg
+
+
+class FullSink(ListSink):
+    def __init__(self, alive=True):
+        super().__init__(accept=False)
+        self.alive = alive
+        self.attempts = 0
+
+    def submit(self, records, timeout=0):
+        self.attempts += 1
+        return super().submit(records, timeout)
+
+    def is_alive(self):
+        return self.alive
+
+
+def test_delivered_records_go_to_the_sink(list_sink):
+    kafka = PausingConsumer(list_sink)
+    consumer.deliver_to_sink(kafka, list_sink, [{"offset": 0}])
+    assert list_sink.records == [{"offset": 0}]
+    assert kafka.events == []
+
+
+def test_full_sink_pauses_until_it_accepts(monkeypatch):
+    monkeypatch.setattr(consumer, "SINK_BACKPRESSURE_POLICY", "pause")
+    sink = FullSink()
+    kafka = PausingConsumer(sink, polls_until_room=3)
+
+    consumer.deliver_to_sink(kafka, sink, [{"offset": 0}])
+
+    assert sink.records == [{"offset": 0}]
+    assert kafka.polls == 3
+    assert kafka.events == [("pause", ["tp0", "tp1"]), ("resume", ["tp0", "tp1"])]
+
+
+def test_full_sink_drops_with_the_drop_policy(monkeypatch):
+    monkeypatch.setattr(consumer, "SINK_BACKPRESSURE_POLICY", "drop")
+    sink = FullSink()
+    kafka = PausingConsumer(sink)
+
+    consumer.deliver_to_sink(kafka, sink, [{"offset": 0}])
+
+    assert sink.records == []
+    assert sink.attempts == 1
+    assert kafka.events == []
+
+
+def test_message_polled_while_paused_is_consumed_again():
+    """A partition assigned during the pause is rewound, not skipped"""
+    sink = FullSink()
+    msg = SourceMessage(b"{}", "transactions", 2, 41)
+    kafka = PausingConsumer(sink, polls_until_room=2, message=msg)
+
+    consumer.pause_until_accepted(kafka, sink, [{"offset": 0}], "Sink")
+
+    assert ("seek", ("transactions", 2, 41)) in kafka.events
+    assert kafka.events[-1] == ("resume", ["tp0", "tp1"])
+
+
+def test_dead_sink_raises_and_resumes():
+    sink = FullSink(alive=False)
+    kafka = PausingConsumer(sink, polls_until_room=100)
+
+    with pytest.raises(RuntimeError):
+        consumer.pause_until_accepted(kafka, sink, [{"offset": 0}], "Sink")
+    assert kafka.events[-1] == ("resume", ["tp0", "tp1"])
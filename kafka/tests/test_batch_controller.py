@@ -0,0 +1,53 @@
+from batch_controller import AdaptiveBatchController
+
+
+def make_controller(lag=None, **kwargs):
+    sizes = []
+    controller = AdaptiveBatchController(
+        100, min_size=10, max_size=400, target_p99_ms=100, lag_high_watermark=1000,
+        adjust_interval=0, lag=lambda: lag, on_change=sizes.append, **kwargs)
+    return controller, sizes
+
+
+def test_slow_batches_halve_the_size():
+    controller, sizes = make_controller(lag=0)
+    controller.record(0.5)
+    controller.record(0.5)
+    assert sizes == [100, 50, 25]
+
+
+def test_size_stays_within_bounds():
+    controller, _ = make_controller(lag=0)
+    for _ in range(10):
+        controller.record(1.0)
+    assert controller.batch_size == 10
+
+    controller, _ = make_controller(lag=10**6)
+    for _ in range(10):
+        controller.record(0.001)
+    assert controller.batch_size == 400
+
+
+def test_lag_grows_the_size_when_there_is_headroom():
+    controller, sizes = make_controller(lag=5000)
+    controller.record(0.01)
+    assert sizes == [100, 150]
+
+    # Over 80% of the target: no growth even with lag
+    controller.record(0.09)
+    assert controller.batch_size == 150
+
+
+def test_no_lag_keeps_the_size():
+    for lag in (None, 10):
+        controller, sizes = make_controller(lag=lag)
+        controller.record(0.01)
+        assert sizes == [100]
+
+
+def test_waits_for_the_adjust_interval():
+    sizes = []
+    controller = AdaptiveBatchController(
+        100, target_p99_ms=100, adjust_interval=3600, lag=lambda: 0, on_change=sizes.append)
+    controller.record(1.0)
+    assert sizes == [100]
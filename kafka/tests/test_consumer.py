@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import consumer
+from conftest import MemorySink, StoppingSource
+from model_watcher import ModelHandle
+
+PAYLOADS = [{"amount": float(100 * i)} for i in range(10)]
+
+
+class FailingModel:
+    """Predicts 0, fails on any frame holding one of fail_amounts."""
+
+    def __init__(self, fail_amounts):
+        self.fail_amounts = set(fail_amounts)
+
+    def predict(self, frame: pd.DataFrame):
+        if self.fail_amounts & set(frame["amount"]):
+            raise ValueError("model failed")
+        return np.zeros(len(frame))
+
+
+def run(read_messages, batches, fail_amounts, **kwargs):
+    sink = MemorySink().start()
+    model_handle = ModelHandle(FailingModel(fail_amounts), "1")
+    consumer.running = True
+    try:
+        read_messages(StoppingSource(batches), model_handle, sink, **kwargs)
+    finally:
+        consumer.running = True
+        sink.close(timeout=5)
+    return sink
+
+
+@pytest.mark.parametrize("read_messages", [
+    consumer.read_messages_in_batches, consumer.read_messages_pipelined])
+def test_failed_batches_are_not_committed(make_messages, read_messages):
+    """Offsets of a batch the model failed to score stay uncommitted"""
+    messages = make_messages(PAYLOADS)
+    sink = run(read_messages, [messages[i:i + 2] for i in range(0, 10, 2)],
+               fail_amounts={500.0}, batch_size=2)
+
+    assert [r["offset"] for r in sink.written] == [0, 1, 2, 3, 6, 7, 8, 9]
+    assert sink.committable_offsets() == {("transactions", 0): 4}
+
+
+def test_failed_messages_are_not_committed(make_messages):
+    """Single message mode: the failed message holds the commits back"""
+    sink = run(consumer.read_messages_from_topic, [make_messages(PAYLOADS)],
+               fail_amounts={300.0})
+
+    assert [r["offset"] for r in sink.written] == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert sink.committable_offsets() == {("transactions", 0): 3}
+
+
+def test_failing_pipeline_stage_is_not_committed(make_messages, monkeypatch):
+    """A batch lost to an exception in a stage is reported as failed"""
+    score_batch = consumer.score_batch
+
+    def crashing_score_batch(batch, *args, **kwargs):
+        if batch.messages[0].offset() == 4:
+            raise RuntimeError("stage crashed")
+        return score_batch(batch, *args, **kwargs)
+
+    monkeypatch.setattr(consumer, "score_batch", crashing_score_batch)
+    messages = make_messages(PAYLOADS)
+    sink = run(consumer.read_messages_pipelined, [messages[i:i + 2] for i in range(0, 10, 2)],
+               fail_amounts=(), batch_size=2)
+
+    assert [r["offset"] for r in sink.written] == [0, 1, 2, 3, 6, 7, 8, 9]
+    assert sink.committable_offsets() == {("transactions", 0): 4}
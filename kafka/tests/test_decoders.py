@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from decoders import SchemaDecoder, parse_schema
+
+SCHEMA = "amount:float64,hour:int64,online:bool"
+
+
+def decode(make_messages, payloads):
+    return SchemaDecoder(parse_schema(SCHEMA)).decode_batch(make_messages(payloads))
+
+
+def test_parse_schema():
+    assert parse_schema("amount, hour:int64") == [
+        ("amount", np.dtype("float64")), ("hour", np.dtype("int64"))]
+    with pytest.raises(ValueError):
+        parse_schema(" , ")
+
+
+def test_decodes_typed_columns(make_messages):
+    batch = decode(make_messages, [
+        {"amount": 2.5, "hour": 3, "online": True, "extra": "kept"},
+        {"amount": 7, "hour": 4, "online": False},
+    ])
+
+    assert batch.errors == []
+    assert batch.frame["amount"].tolist() == [2.5, 7.0]
+    assert batch.frame["hour"].dtype == np.int64
+    assert batch.frame["online"].tolist() == [True, False]
+    assert batch.inputs[0]["extra"] == "kept"
+
+
+@pytest.mark.parametrize("field, value", [
+    ("hour", 1.7),
+    ("hour", True),
+    ("amount", None),
+    ("amount", "2.5"),
+    ("online", "no"),
+    ("online", 1),
+])
+def test_wrongly_typed_values_are_errors(make_messages, field, value):
+    """numpy would convert these silently instead of rejecting them"""
+    payload = {"amount": 1.0, "hour": 1, "online": True}
+    batch = decode(make_messages, [payload, {**payload, field: value}, payload])
+
+    assert [msg.offset() for msg, _ in batch.errors] == [1]
+    assert isinstance(batch.errors[0][1], TypeError)
+    assert [msg.offset() for msg in batch.messages] == [0, 2]
+    assert len(batch.frame) == 2
+
+
+def test_missing_features_are_errors(make_messages):
+    batch = decode(make_messages, [{"amount": 1.0, "hour": 1}])
+
+    assert len(batch.errors) == 1
+    assert batch.frame.empty
@@ -0,0 +1,87 @@
+from dedup import BloomFilter, DedupIndex
+from sources import SourceMessage
+
+
+def message(offset: int, partition: int = 0) -> SourceMessage:
+    return SourceMessage(b"{}", "transactions", partition, offset)
+
+
+def fill(index: DedupIndex, ids, first_offset: int = 0) -> None:
+    for offset, transaction_id in enumerate(ids, first_offset):
+        assert not index.check(transaction_id, message(offset))
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(100, 0.01)
+    for i in range(100):
+        bloom.add(f"id-{i}")
+    assert all(f"id-{i}" in bloom for i in range(100))
+    assert sum(f"other-{i}" in bloom for i in range(1000)) < 50
+    assert 0 < bloom.false_positive_rate() < 0.05
+
+
+def test_exact_window():
+    index = DedupIndex(capacity=1000, window=10)
+    fill(index, ["a", "b"])
+
+    assert index.check("a", message(5))
+    assert index.check("b", message(0, partition=1))
+    assert not index.check(None, message(6))
+    assert not index.check("c", message(7))
+
+
+def test_same_message_replayed_is_scored_again():
+    """A replay from the last committed offset is not a duplicate"""
+    index = DedupIndex(capacity=1000, window=10)
+    fill(index, ["a", "b", "c"])
+
+    fill(index, ["a", "b", "c"])
+    assert index.check("a", message(3))
+
+
+def test_bloom_generations_rotate():
+    """IDs older than the kept generations are forgotten"""
+    index = DedupIndex(capacity=10, generations=2, window=1)
+    fill(index, [f"id-{i}" for i in range(25)])
+
+    assert len(index._filters) == 2
+    # Out of the exact window, caught by the Bloom filter
+    assert index.check("id-15", message(100))
+    # In the dropped generation
+    assert not index.check("id-5", message(101))
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "dedup.bin")
+    index = DedupIndex(capacity=10, generations=3, window=5, snapshot_path=path)
+    fill(index, [f"id-{i}" for i in range(25)])
+    index.close()
+
+    restored = DedupIndex(capacity=10, generations=3, window=5, snapshot_path=path)
+    assert not restored.check("id-24", message(24))
+    assert all(restored.check(f"id-{i}", message(100 + i)) for i in range(25))
+
+
+def test_snapshot_with_fewer_generations(tmp_path):
+    """Loading keeps the newest generations of the snapshot"""
+    path = str(tmp_path / "dedup.bin")
+    index = DedupIndex(capacity=10, generations=3, window=1, snapshot_path=path)
+    fill(index, [f"id-{i}" for i in range(25)])
+    index.close()
+
+    restored = DedupIndex(capacity=10, generations=2, window=1, snapshot_path=path)
+
+    assert len(restored._filters) == 2
+    assert [bloom.count for bloom in restored._filters] == [10, 5]
+    assert all(restored.check(f"id-{i}", message(100 + i)) for i in range(10, 25))
+    assert not restored.check("id-0", message(200))
+
+
+def test_snapshot_with_other_settings_is_ignored(tmp_path):
+    path = str(tmp_path / "dedup.bin")
+    index = DedupIndex(capacity=10, snapshot_path=path)
+    fill(index, ["a"])
+    index.close()
+
+    restored = DedupIndex(capacity=20, snapshot_path=path)
+    assert not restored.check("a", message(5))
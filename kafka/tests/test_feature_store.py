@@ -0,0 +1,149 @@
+import logging
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+from mlflow.models import ModelSignature
+from mlflow.types import ColSpec, Schema
+
+import consumer
+from consumer_logging import MessageLogSampler, PeriodicSummary
+from decoders import JsonDecoder, SchemaDecoder, dumps, parse_schema
+from feature_store import FeatureStore, model_input_names
+from model_watcher import ModelHandle
+from sources import SourceMessage
+
+PAYLOADS = [
+    {"txn_id": f"t{i}", "card_id": f"c{i % 2}", "merchant_id": f"m{i % 3}",
+     "amount": float(10 + i), "hour": i % 24}
+    for i in range(10)
+]
+
+
+def make_store(**kwargs) -> FeatureStore:
+    return FeatureStore(["card_id"], [("1m", 60), ("1h", 3600)], **kwargs)
+
+
+class ColumnModel:
+    """Model keeping the frames it scores, failing on other columns."""
+
+    def __init__(self, columns=None, signature=None):
+        self.columns = columns
+        self.frames = []
+        self.metadata = SimpleNamespace(get_input_schema=lambda: signature)
+
+    def predict(self, frame: pd.DataFrame):
+        if self.columns is not None and list(frame.columns) != self.columns:
+            raise ValueError(f"Feature names unseen at fit time: {list(frame.columns)}")
+        self.frames.append(frame.copy())
+        return np.zeros(len(frame))
+
+
+def score(store, decoder, model, messages):
+    logger = logging.getLogger("consumer.test")
+    sampler = MessageLogSampler(logger)
+    batch = consumer.prepare_batch(
+        decoder.decode_batch(messages), None, store, PeriodicSummary(logger, sampler=sampler))
+    return consumer.score_batch(
+        batch, ModelHandle(model, "1"), sampler, MessageLogSampler(logger),
+        PeriodicSummary(logger, sampler=sampler), features=store)
+
+
+def test_counts_decay():
+    """A transaction one window after the last sees its count decayed by e"""
+    store = make_store()
+    value = dumps(PAYLOADS[0])
+    first = SourceMessage(value, "transactions", 0, 0, 1_000_000)
+    second = SourceMessage(value, "transactions", 0, 1, 1_060_000)
+
+    assert store.features([PAYLOADS[0]], [first])[0]["card_id_txn_count_1m"] == 0
+    features = store.features([PAYLOADS[0]], [second])[0]
+
+    assert features["card_id_txn_count_1m"] == pytest.approx(math.exp(-1), abs=1e-4)
+    assert features["card_id_txn_count_1h"] == pytest.approx(math.exp(-1 / 60), abs=1e-4)
+    assert features["card_id_distinct_merchants_1m"] == 1
+
+
+def test_replayed_offsets_are_not_counted_twice(make_messages):
+    """Messages at offsets already applied do not change the aggregates"""
+    messages = make_messages(PAYLOADS, timestamp_ms=1_000_000)
+    replayed, straight = make_store(), make_store()
+
+    straight.features(PAYLOADS[:8], messages[:8])
+    replayed.features(PAYLOADS[:8], messages[:8])
+    # Redelivered after a rebalance, from the last committed offset
+    first = replayed.features(PAYLOADS[4:8], messages[4:8])
+    again = replayed.features(PAYLOADS[4:8], messages[4:8])
+
+    assert first == again
+    assert replayed.features(PAYLOADS[8:], messages[8:]) == \
+        straight.features(PAYLOADS[8:], messages[8:])
+
+
+def test_snapshot_round_trip(tmp_path, make_messages):
+    messages = make_messages(PAYLOADS, timestamp_ms=1_000_000)
+    path = str(tmp_path / "store.pkl")
+    store = make_store(snapshot_path=path)
+    store.features(PAYLOADS[:8], messages[:8])
+    store.close()
+
+    restored = make_store(snapshot_path=path)
+    # The replayed offsets are known, not applied again
+    restored.features(PAYLOADS[:8], messages[:8])
+    assert restored.features(PAYLOADS[8:], messages[8:]) == \
+        make_store().features(PAYLOADS, messages)[8:]
+
+
+def test_model_without_features_keeps_scoring(make_messages):
+    """A model trained on the payload fields only does not get the features"""
+    schema = "amount:float64,hour:int64"
+    store = make_store(schema_names=["amount", "hour"])
+    model = ColumnModel(["amount", "hour"])
+
+    records = score(store, SchemaDecoder(parse_schema(schema)), model, make_messages(PAYLOADS))
+
+    assert len(records) == len(PAYLOADS)
+    assert "card_id_txn_count_1m" not in records[0]["input"]
+
+
+def test_schema_features_are_joined_in_place(make_messages):
+    schema = "amount:float64,card_id_txn_count_1m:float64,hour:int64"
+    store = make_store(schema_names=[name for name, _ in parse_schema(schema)])
+    decoder = SchemaDecoder(parse_schema(schema), derived=store.feature_names())
+    model = ColumnModel(["amount", "card_id_txn_count_1m", "hour"])
+    messages = make_messages(PAYLOADS, timestamp_ms=1_000_000)
+
+    records = score(store, decoder, model, messages)
+
+    expected = [row["card_id_txn_count_1m"]
+                for row in make_store().features(PAYLOADS, messages)]
+    assert model.frames[0]["card_id_txn_count_1m"].tolist() == expected
+    assert model.frames[0]["hour"].dtype == np.int64
+    assert [record["input"]["card_id_txn_count_1m"] for record in records] == expected
+    assert "card_id_txn_count_1h" not in records[0]["input"]
+
+
+def test_signature_features_are_joined(make_messages):
+    signature = ModelSignature(inputs=Schema([
+        ColSpec("double", "amount"), ColSpec("double", "card_id_amount_zscore_1h")]))
+    model = ColumnModel(signature=signature.inputs)
+    assert model_input_names(model) == ["amount", "card_id_amount_zscore_1h"]
+
+    records = score(make_store(), JsonDecoder(), model, make_messages(PAYLOADS))
+
+    assert "card_id_amount_zscore_1h" in model.frames[0]
+    assert "card_id_txn_count_1h" not in model.frames[0]
+    assert "card_id_amount_zscore_1h" in records[0]["input"]
+
+
+def test_join_modes():
+    store = make_store()
+    # No schema and no signature: nothing to select from
+    assert store.joined_names(object(), "1") == []
+    assert make_store(join="all").joined_names(object(), "1") == store.feature_names()
+    assert make_store(join="none", schema_names=store.feature_names()) \
+        .joined_names(object(), "1") == []
+    with pytest.raises(ValueError):
+        make_store(join="some")
@@ -0,0 +1,106 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+import consumer
+from consumer_logging import MessageLogSampler, PeriodicSummary
+from decoders import SchemaDecoder, parse_schema
+from model_router import ModelRouter, ShadowScorer
+from model_watcher import ModelHandle
+
+SCHEMA = "amount:float64,hour:int64"
+PAYLOADS = [
+    {"txn_id": f"t{i}", "card_id": f"c{i % 3}", "merchant_id": f"m{i % 5}",
+     "amount": float(10 * i), "hour": i % 24}
+    for i in range(20)
+]
+
+
+class RecordingModel:
+    """Model failing like scikit-learn on columns it was not fitted on."""
+
+    def __init__(self, columns, prediction=0):
+        self.columns = list(columns)
+        self.prediction = prediction
+        self.inputs = []
+
+    def predict(self, frame: pd.DataFrame):
+        if list(frame.columns) != self.columns:
+            raise ValueError(f"Feature names unseen at fit time: {list(frame.columns)}")
+        self.inputs.append(frame.copy())
+        return np.full(len(frame), self.prediction)
+
+
+def log_helpers():
+    logger = logging.getLogger("consumer.test")
+    sampler = MessageLogSampler(logger)
+    return sampler, MessageLogSampler(logger), PeriodicSummary(logger, sampler=sampler)
+
+
+@pytest.fixture
+def fitted_model():
+    frame = pd.DataFrame(PAYLOADS)[["amount", "hour"]]
+    return LogisticRegression().fit(frame, np.arange(len(frame)) % 2)
+
+
+def test_shadow_scores_the_primary_inputs(make_messages, list_sink, fitted_model):
+    """Primary and shadow get the same decoded frame, not the raw payloads"""
+    batch = SchemaDecoder(parse_schema(SCHEMA)).decode_batch(make_messages(PAYLOADS))
+    shadow_model = RecordingModel(["amount", "hour"], prediction=1)
+    shadow = ShadowScorer(shadow_model, "shadow", list_sink, consumer.predict_batch,
+                          sample_rate=1.0).start()
+
+    records = consumer.score_batch(
+        batch, ModelHandle(fitted_model, "1"), *log_helpers(), shadow=shadow)
+    shadow.close(timeout=5)
+
+    assert len(records) == len(PAYLOADS)
+    assert len(list_sink.records) == len(PAYLOADS)
+    pd.testing.assert_frame_equal(shadow_model.inputs[0], batch.frame)
+    for record, comparison in zip(records, list_sink.records):
+        assert comparison["input"] == record["input"]
+        assert comparison["primary_prediction"] == record["prediction"]
+        assert comparison["primary_model_version"] == "1"
+        assert comparison["prediction"] == 1
+        assert comparison["model_version"] == "shadow"
+
+
+def test_shadow_samples_inputs_with_their_records(make_messages, list_sink):
+    batch = SchemaDecoder(parse_schema(SCHEMA)).decode_batch(make_messages(PAYLOADS))
+    shadow_model = RecordingModel(["amount", "hour"])
+    shadow = ShadowScorer(shadow_model, "shadow", list_sink, consumer.predict_batch,
+                          sample_rate=0.5).start()
+    records = [{"input": payload, "prediction": 0, "model_version": "1"}
+               for payload in batch.inputs]
+
+    shadow.offer(records, batch.frame)
+    shadow.close(timeout=5)
+
+    sampled = shadow_model.inputs[0]
+    assert 0 < len(sampled) < len(PAYLOADS)
+    assert sampled["amount"].tolist() == [
+        record["input"]["amount"] for record in list_sink.records]
+
+
+def test_router_falls_back_and_opens_the_circuit():
+    primary = RecordingModel(["other"])
+    fallback = RecordingModel(["amount"], prediction=1)
+    router = ModelRouter(fallback, "fallback", consumer.predict_batch,
+                         failure_threshold=2, cooldown=60)
+    frame = pd.DataFrame({"amount": [1.0, 2.0]})
+
+    for _ in range(2):
+        assert router.predict(primary, "1", frame) == ([1, 1], "fallback")
+    # The circuit is open, the primary is not called any more
+    primary.columns = ["amount"]
+    assert router.predict(primary, "1", frame) == ([1, 1], "fallback")
+    assert primary.inputs == []
+
+
+def test_router_uses_the_primary():
+    primary = RecordingModel(["amount"])
+    router = ModelRouter(RecordingModel(["amount"], 1), "fallback", consumer.predict_batch)
+    assert router.predict(primary, "1", pd.DataFrame({"amount": [1.0]})) == ([0], "1")
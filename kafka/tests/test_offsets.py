@@ -0,0 +1,85 @@
+from confluent_kafka import KafkaError, KafkaException, TopicPartition
+
+from offsets import OffsetCommitter
+
+
+class FakeSink:
+    def __init__(self, offsets=None):
+        self.offsets = offsets or {}
+
+    def committable_offsets(self):
+        return dict(self.offsets)
+
+
+class FakeConsumer:
+    """Records the commits of a consumer assigned the given partitions."""
+
+    def __init__(self, partitions, fail=False):
+        self.partitions = [TopicPartition("transactions", p) for p in partitions]
+        self.fail = fail
+        self.commits = []
+
+    def assignment(self):
+        return self.partitions
+
+    def commit(self, offsets, asynchronous=True):
+        if self.fail:
+            raise KafkaException(KafkaError(KafkaError._NO_OFFSET))
+        self.commits.append(
+            (sorted((tp.partition, tp.offset) for tp in offsets), asynchronous))
+
+
+def test_commits_the_durable_offsets_of_assigned_partitions():
+    sink = FakeSink({("transactions", 0): 5, ("transactions", 1): 7, ("other", 0): 3})
+    consumer = FakeConsumer([0, 1])
+    committer = OffsetCommitter(sink, interval=0)
+
+    committer.commit(consumer)
+
+    assert consumer.commits == [([(0, 5), (1, 7)], True)]
+
+
+def test_only_moved_offsets_are_committed():
+    sink = FakeSink({("transactions", 0): 5, ("transactions", 1): 7})
+    consumer = FakeConsumer([0, 1])
+    committer = OffsetCommitter(sink, interval=0)
+    committer.commit(consumer)
+
+    committer.commit(consumer)
+    sink.offsets[("transactions", 1)] = 9
+    committer.maybe_commit(consumer)
+
+    assert consumer.commits[1:] == [([(1, 9)], True)]
+
+
+def test_maybe_commit_waits_for_the_interval():
+    consumer = FakeConsumer([0])
+    committer = OffsetCommitter(FakeSink({("transactions", 0): 1}), interval=3600)
+    committer.maybe_commit(consumer)
+    assert consumer.commits == []
+
+
+def test_failed_commits_are_retried():
+    sink = FakeSink({("transactions", 0): 5})
+    committer = OffsetCommitter(sink, interval=0)
+    committer.commit(FakeConsumer([0], fail=True))
+
+    consumer = FakeConsumer([0])
+    committer.commit(consumer)
+    committer.on_commit(KafkaError(KafkaError._TIMED_OUT),
+                        [TopicPartition("transactions", 0, 5)])
+    committer.commit(consumer)
+
+    assert consumer.commits == [([(0, 5)], True)] * 2
+
+
+def test_revoked_partitions_are_committed_synchronously():
+    sink = FakeSink({("transactions", 0): 5, ("transactions", 1): 7})
+    consumer = FakeConsumer([0, 1])
+    committer = OffsetCommitter(sink, interval=0)
+
+    committer.on_revoke(consumer, [TopicPartition("transactions", 1)])
+    # Reassigned later: committed again even if the offset did not move
+    committer.on_revoke(consumer, [TopicPartition("transactions", 1)])
+
+    assert consumer.commits == [([(1, 7)], False)] * 2
@@ -0,0 +1,66 @@
+import threading
+
+from conftest import wait_for
+from pipeline import Pipeline
+
+
+def test_items_flow_through_the_stages_in_order():
+    results = []
+    pipeline = Pipeline([
+        ("double", lambda item: item * 2),
+        ("collect", results.append),
+    ], max_queue_batches=2).start()
+
+    for item in range(20):
+        assert pipeline.submit(item, timeout=5)
+    pipeline.close(timeout=5)
+
+    assert results == [item * 2 for item in range(20)]
+    assert not pipeline.is_alive()
+
+
+def test_none_and_failures_are_not_forwarded():
+    results = []
+
+    def parse(item):
+        if item == "bad":
+            raise ValueError(item)
+        return None if item == "skip" else item
+
+    pipeline = Pipeline([("parse", parse), ("collect", results.append)]).start()
+    for item in ["a", "bad", "skip", "b"]:
+        pipeline.submit(item, timeout=5)
+    pipeline.close(timeout=5)
+
+    assert results == ["a", "b"]
+
+
+def test_full_first_queue_rejects_without_blocking():
+    release = threading.Event()
+    pipeline = Pipeline([("slow", lambda item: release.wait(5))], max_queue_batches=1).start()
+
+    assert pipeline.submit(1)
+    # The stage is busy with item 1 once the queue is empty again
+    assert wait_for(lambda: pipeline.queue_depths() == {"slow": 0})
+    assert pipeline.submit(2)
+    assert not pipeline.submit(3)
+
+    release.set()
+    pipeline.close(timeout=5)
+
+
+def test_failed_items_are_passed_to_on_error():
+    failed = []
+
+    def parse(item):
+        if item == "bad":
+            raise ValueError(item)
+        return item
+
+    pipeline = Pipeline([("parse", parse), ("collect", lambda item: None)],
+                        on_error=lambda stage, item: failed.append((stage, item))).start()
+    for item in ["a", "bad", "b"]:
+        pipeline.submit(item, timeout=5)
+    pipeline.close(timeout=5)
+
+    assert failed == [("parse", "bad")]
@@ -0,0 +1,65 @@
+import time
+
+import numpy as np
+import pytest
+
+import prediction_cache
+from prediction_cache import MISS, LocalPredictionCache, cached_predictions, input_key
+
+
+def test_input_key_is_canonical():
+    assert input_key({"a": 1, "b": 2}, "1") == input_key({"b": 2, "a": 1}, "1")
+    assert input_key({"a": 1}, "1") != input_key({"a": 1}, "2")
+    assert input_key({"a": np.int64(1)}, "1") == input_key({"a": 1}, "1")
+
+
+def test_only_misses_are_scored():
+    cache = LocalPredictionCache()
+    scored = []
+
+    def predict(misses):
+        scored.append(misses)
+        return [f"p{i}" for i in misses]
+
+    inputs = [{"x": 1}, {"x": 2}]
+    assert cached_predictions(cache, "1", inputs, predict) == ["p0", "p1"]
+    assert cached_predictions(cache, "1", inputs + [{"x": 3}], predict) == ["p0", "p1", "p2"]
+    assert scored == [[0, 1], [2]]
+
+
+def test_uncacheable_predictions_are_not_kept():
+    """Predictions of the fallback model are not cached"""
+    cache = LocalPredictionCache()
+    cached_predictions(cache, "1", [{"x": 1}], lambda misses: [0], cacheable=lambda: False)
+    assert cache.get_many([input_key({"x": 1}, "1")]) == [MISS]
+
+
+def test_new_model_version_clears_the_cache():
+    cache = LocalPredictionCache()
+    cached_predictions(cache, "1", [{"x": 1}], lambda misses: [0])
+    cache.set_model_version("2")
+    assert cache.get_many([input_key({"x": 1}, "1")]) == [MISS]
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    cache = LocalPredictionCache(max_entries=2, ttl=10)
+    cache.put_many(["a", "b"], [1, 2])
+    cache.get_many(["a"])
+    cache.put_many(["c"], [3])
+    assert cache.get_many(["a", "b", "c"]) == [1, MISS, 3]
+
+    now = time.monotonic()
+    monkeypatch.setattr(prediction_cache.time, "monotonic", lambda: now + 11)
+    assert cache.get_many(["a"]) == [MISS]
+
+
+def test_none_is_a_cached_prediction():
+    cache = LocalPredictionCache()
+    cache.put_many(["a"], [None])
+    assert cache.get_many(["a"]) == [None]
+
+
+@pytest.mark.skipif(prediction_cache.redis is not None, reason="redis is installed")
+def test_redis_cache_requires_redis():
+    with pytest.raises(ImportError):
+        prediction_cache.RedisPredictionCache("redis://localhost:6379/0")
@@ -0,0 +1,149 @@
+import json
+import time
+
+import pyarrow.parquet as pq
+import pytest
+
+from conftest import MemorySink, wait_for
+from sinks import JsonlPredictionSink, ParquetPredictionSink
+
+TP = ("transactions", 0)
+
+
+def records(offsets, partition=0, **input_data):
+    return [
+        {"input": {"amount": 1.0, **input_data}, "prediction": 0, "model_version": "1",
+         "timestamp": time.time(), "topic": "transactions", "partition": partition,
+         "offset": offset}
+        for offset in offsets
+    ]
+
+
+def test_jsonl_sink(tmp_path):
+    path = tmp_path / "predictions.jsonl"
+    sink = JsonlPredictionSink(str(path), flush_records=2, flush_interval=60).start()
+    assert sink.submit(records([0, 1]))
+    assert sink.submit(records([2]))
+    assert wait_for(lambda: sink.committable_offsets() == {TP: 2})
+
+    sink.close(timeout=5)
+
+    assert [json.loads(line)["offset"] for line in path.read_text().splitlines()] == [0, 1, 2]
+    assert sink.committable_offsets() == {TP: 3}
+    assert not sink.is_alive()
+
+
+def test_jsonl_sink_rotates(tmp_path):
+    path = tmp_path / "predictions.jsonl"
+    sink = JsonlPredictionSink(str(path), flush_records=1, rotate_bytes=1).start()
+    sink.submit(records([0]))
+    sink.submit(records([1]))
+    sink.close(timeout=5)
+
+    assert len(list(tmp_path.glob("predictions.*.jsonl"))) == 2
+
+
+def test_full_queue_rejects_batches():
+    sink = MemorySink(max_queue_batches=1)
+    assert sink.submit(records([0]))
+    assert not sink.submit(records([1]))
+    assert sink.batches_rejected == 1
+    assert sink.queue_depth() == 1
+
+
+def test_commits_stop_at_failed_records():
+    """Records written after a failed batch do not move the commit past it"""
+    sink = MemorySink(fail_offsets={3}).start()
+    sink.submit(records([0, 1, 2]))
+    sink.submit(records([3, 4]))
+    sink.submit(records([5, 6]))
+    assert wait_for(lambda: len(sink.written) == 5)
+
+    assert wait_for(lambda: sink.committable_offsets() == {TP: 3})
+    sink.close(timeout=5)
+    assert sink.committable_offsets() == {TP: 3}
+
+
+def test_replayed_failed_records_unblock_commits():
+    """Once the failed records are consumed again and written, commits move on"""
+    sink = MemorySink(fail_offsets={3}).start()
+    sink.submit(records([0, 1, 2]))
+    sink.submit(records([3, 4]))
+    sink.submit(records([5]))
+    assert wait_for(lambda: sink.committable_offsets() == {TP: 3})
+
+    # Redelivered from the last commit after a rebalance
+    sink.fail_offsets.clear()
+    sink.submit(records([3, 4]))
+    assert wait_for(lambda: sink.committable_offsets() == {TP: 6})
+    sink.submit(records([6]))
+    sink.close(timeout=5)
+    assert sink.committable_offsets() == {TP: 7}
+
+
+def test_reported_failures_stop_commits():
+    """Records never produced (scoring failed) hold commits like a failed write"""
+    sink = MemorySink().start()
+    sink.submit(records([0, 1]))
+    assert sink.submit_failed(
+        [{"topic": "transactions", "partition": 0, "offset": offset} for offset in (2, 3)])
+    sink.submit(records([4, 5]))
+    sink.close(timeout=5)
+
+    assert [record["offset"] for record in sink.written] == [0, 1, 4, 5]
+    assert sink.committable_offsets() == {TP: 2}
+
+
+def test_partitions_are_committed_independently():
+    sink = MemorySink(fail_offsets={10}).start()
+    sink.submit(records([10, 11], partition=1))
+    sink.submit(records([0, 1]))
+    sink.close(timeout=5)
+
+    assert sink.committable_offsets() == {TP: 2, ("transactions", 1): 10}
+
+
+def test_flush_failure_is_not_durable():
+    class FailingFlush(MemorySink):
+        def _flush(self):
+            raise OSError("fsync failed")
+
+    sink = FailingFlush().start()
+    sink.submit(records([0, 1]))
+    sink.close(timeout=5)
+
+    assert sink.committable_offsets() == {TP: 0}
+
+
+def test_parquet_offsets_wait_for_the_closed_file(tmp_path):
+    """An open Parquet file cannot be read back, its rows are not durable"""
+    sink = ParquetPredictionSink(
+        str(tmp_path), row_group_size=2, flush_records=1, flush_interval=60).start()
+    sink.submit(records([0, 1, 2], card="a"))
+    assert wait_for(lambda: sink.committable_offsets() == {TP: 0})
+    assert not list(tmp_path.rglob("*.parquet"))
+
+    sink.close(timeout=5)
+
+    files = list(tmp_path.rglob("*.parquet"))
+    assert len(files) == 1
+    assert files[0].parent.parent.name == "model_version=1"
+    table = pq.read_table(files[0])
+    assert table.column("offset").to_pylist() == [0, 1, 2]
+    assert table.column("input_card").to_pylist() == ["a"] * 3
+    assert sink.committable_offsets() == {TP: 3}
+
+
+def test_parquet_schema_change_starts_a_new_file(tmp_path):
+    sink = ParquetPredictionSink(str(tmp_path), row_group_size=1, flush_interval=60).start()
+    sink.submit(records([0], card="a"))
+    sink.submit(records([1], card=1.5, extra=True))
+    sink.close(timeout=5)
+
+    assert len(list(tmp_path.rglob("*.parquet"))) == 2
+    assert sink.committable_offsets() == {TP: 2}
+
+
+def test_unknown_fsync_policy(tmp_path):
+    with pytest.raises(ValueError):
+        JsonlPredictionSink(str(tmp_path / "p.jsonl"), fsync_policy="always")
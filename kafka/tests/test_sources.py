@@ -0,0 +1,107 @@
+import json
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from decoders import loads
+from sources import (
+    JsonlFileSource,
+    ParquetFileSource,
+    RateLimitedSource,
+    SourceMessage,
+    SyntheticSource,
+)
+
+
+def drain(source, batch=100):
+    messages = []
+    while not source.exhausted:
+        messages.extend(source.consume(batch, timeout=0))
+    return messages
+
+
+def test_source_message():
+    msg = SourceMessage(b"{}", "t", 1, 5, 1000)
+    assert (msg.topic(), msg.partition(), msg.offset(), msg.error()) == ("t", 1, 5, None)
+    assert msg.timestamp() == (1, 1000)
+    assert SourceMessage(b"{}", "t", 1, 5).timestamp()[0] == 0
+
+
+def test_jsonl_payloads_and_prediction_records(tmp_path):
+    path = tmp_path / "replay.jsonl"
+    record = {"input": {"amount": 3.0}, "prediction": 1, "topic": "transactions",
+              "partition": 2, "offset": 40, "timestamp": 1000.5}
+    path.write_text('{"amount": 1.0}\n\n' + json.dumps(record) + "\n")
+    source = JsonlFileSource(str(path), topic="file")
+
+    messages = drain(source)
+
+    assert [(m.topic(), m.partition(), m.offset()) for m in messages] == [
+        ("file", 0, 0), ("transactions", 2, 40)]
+    assert loads(messages[1].value()) == {"amount": 3.0}
+    assert messages[1].timestamp() == (1, 1000500)
+    assert source.progress() == (path.stat().st_size,) * 2
+
+
+def test_jsonl_shards(tmp_path):
+    path = tmp_path / "replay.jsonl"
+    path.write_text("".join(f'{{"i": {i}}}\n' for i in range(10)))
+    shards = [drain(JsonlFileSource(str(path), shard=s, shards=3)) for s in range(3)]
+    assert sorted(m.offset() for shard in shards for m in shard) == list(range(10))
+    assert [m.offset() for m in shards[1]] == [1, 4, 7]
+
+
+def test_parquet_source_rebuilds_sink_payloads(tmp_path):
+    pq.write_table(pa.table({
+        "offset": [7, 8], "partition": [1, 1], "topic": ["transactions"] * 2,
+        "input_amount": [1.0, 2.0], "prediction": [0, 1],
+    }), tmp_path / "part-0.parquet")
+    source = ParquetFileSource(str(tmp_path), batch_rows=1)
+
+    messages = drain(source)
+
+    assert [loads(m.value()) for m in messages] == [{"amount": 1.0}, {"amount": 2.0}]
+    assert [(m.partition(), m.offset()) for m in messages] == [(1, 7), (1, 8)]
+    assert source.progress() == (2, 2)
+
+
+def test_synthetic_source_spreads_partitions():
+    source = SyntheticSource(count=10, partitions=2)
+    messages = drain(source, batch=4)
+    assert len(messages) == 10
+    assert [(m.partition(), m.offset()) for m in messages[:4]] == [(0, 0), (1, 0), (0, 1), (1, 1)]
+    assert set(loads(messages[0].value())) == {"amount", "merchant_category", "hour", "card_age_days"}
+    assert [tp.partition for tp in source.assignment()] == [0, 1]
+
+
+def test_paused_source_returns_nothing():
+    source = SyntheticSource(count=10)
+    source.pause(source.assignment())
+    assert source.consume(5, timeout=0) == []
+    source.resume(source.assignment())
+    assert len(source.consume(5, timeout=0)) == 5
+
+
+def test_rate_limited_source():
+    source = RateLimitedSource(SyntheticSource(), rate=200, count=20, record_release_times=True)
+    start = time.perf_counter()
+    messages = []
+    while not source.exhausted:
+        messages.extend(source.consume(100, timeout=0.1))
+
+    assert len(messages) == 20
+    # Message k is due k / rate seconds after the first one
+    assert time.perf_counter() - start >= 19 / 200
+    due = [source.release_times[(m.topic(), m.partition(), m.offset())] for m in messages]
+    assert due == sorted(due)
+
+
+def test_rate_limited_source_keeps_no_release_times_by_default():
+    """A long running consumer never pops them, they would leak"""
+    source = RateLimitedSource(SyntheticSource(), rate=1000, count=20)
+    while not source.exhausted:
+        source.consume(100, timeout=0.1)
+
+    assert source.released == 20
+    assert source.release_times == {}
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction import DictVectorizer
+
+logger = logging.getLogger("airflow.task")
+
+_ARRAYS = ("data", "indices", "indptr")
+
+
+def _is_file(artifact) -> bool:
+    return isinstance(artifact, (str, os.PathLike)) and os.path.isfile(artifact)
+
+
+def artifact_hash(artifact) -> str:
+    """
+    Content hash of a downloaded artifact.
+    :param artifact: Local path of the artifact file, or its loaded
+        records (a list of dicts). Records are hashed in their pickled
+        form, much cheaper than a canonical JSON dump; the same records with
+        keys in another order only make a cache miss
+    :return: Hex digest
+    """
+    digest = hashlib.sha256()
+    if _is_file(artifact):
+        with open(artifact, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    else:
+        digest.update(pickle.dumps(artifact, protocol=pickle.HIGHEST_PROTOCOL))
+    return digest.hexdigest()
+
+
+def _records(artifact) -> list:
+    """Records of a JSON artifact file, as split_data writes them."""
+    if _is_file(artifact):
+        with open(artifact) as f:
+            return json.load(f)
+    return artifact
+
+
+def _vectorizer_from_names(feature_names: list) -> DictVectorizer:
+    """A fitted DictVectorizer with the given vocabulary."""
+    dv = DictVectorizer()
+    dv.feature_names_ = feature_names
+    dv.vocabulary_ = {name: i for i, name in enumerate(feature_names)}
+    return dv
+
+
+def _vocabulary_hash(dv: DictVectorizer) -> str:
+    return hashlib.sha256(json.dumps(dv.feature_names_).encode()).hexdigest()
+
+
+class FeatureCache:
+    """
+    DictVectorizer outputs on disk, so the tasks that vectorize the same
+    train and test artifacts do it once. An entry is a directory holding
+    the vocabulary (vocabulary.json) and the data, indices and indptr
+    arrays of the CSR matrix as .npy files, loaded memory-mapped.
+
+    fit_transform entries are keyed by the content hash of the records,
+    transform entries by that hash and the vocabulary they were
+    transformed with.
+    """
+
+    def __init__(self, cache_dir: str, mmap: bool = True):
+        """
+        :param cache_dir: Directory of the entries, created if needed; a
+            volume shared by the Airflow workers
+        :param mmap: Memory-map the cached arrays instead of reading them
+        """
+        self.cache_dir = cache_dir
+        self.mmap = mmap
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _load(self, key: str):
+        path = self._entry(key)
+        if not os.path.isdir(path):
+            return None, None
+        with open(os.path.join(path, "vocabulary.json")) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, f"{name}.npy"),
+                          mmap_mode="r" if self.mmap else None)
+                  for name in _ARRAYS]
+        X = sp.csr_matrix(tuple(arrays), shape=tuple(meta["shape"]), copy=False)
+        return X, meta["feature_names"]
+
+    def _store(self, key: str, X, feature_names: list) -> None:
+        X = sp.csr_matrix(X)
+        # Written next to the entry and renamed, so a reader never sees a
+        # partial entry and concurrent writers do not collide
+        tmp = tempfile.mkdtemp(dir=self.cache_dir, prefix=f".{key}.")
+        try:
+            for name in _ARRAYS:
+                np.save(os.path.join(tmp, f"{name}.npy"), getattr(X, name))
+            with open(os.path.join(tmp, "vocabulary.json"), "w") as f:
+                json.dump({"shape": list(X.shape), "feature_names": feature_names}, f)
+            os.rename(tmp, self._entry(key))
+        except OSError:
+            if not os.path.isdir(self._entry(key)):
+                raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def fit_transform(self, records) -> tuple[DictVectorizer, sp.csr_matrix]:
+        """
+        DictVectorizer().fit_transform(records), from the cache if the same
+        records were vectorized before.
+        :param records: List of dicts, or the path of a JSON file of them,
+            which is only read on a cache miss
+        :return: Fitted vectorizer and feature matrix
+        """
+        start = time.perf_counter()
+        key = "fit-" + artifact_hash(records)
+        X, feature_names = self._load(key)
+        if X is not None:
+            self._log("hit", key, X, start)
+            return _vectorizer_from_names(feature_names), X
+        dv = DictVectorizer()
+        X = dv.fit_transform(_records(records))
+        self._store(key, X, list(dv.feature_names_))
+        self._log("miss", key, X, start)
+        return dv, X
+
+    def transform(self, dv: DictVectorizer, records) -> sp.csr_matrix:
+        """
+        dv.transform(records), from the cache if the same records were
+        transformed with the same vocabulary before.
+        :param dv: Fitted vectorizer, e.g. from fit_transform
+        :param records: See fit_transform
+        """
+        start = time.perf_counter()
+        key = "transform-" + hashlib.sha256(
+            (_vocabulary_hash(dv) + artifact_hash(records)).encode()).hexdigest()
+        X, _ = self._load(key)
+        if X is not None:
+            self._log("hit", key, X, start)
+            return X
+        X = dv.transform(_records(records))
+        self._store(key, X, list(dv.feature_names_))
+        self._log("miss", key, X, start)
+        return X
+
+    def _log(self, outcome: str, key: str, X, start: float) -> None:
+        logger.info(
+            f"Feature cache {outcome} {key[:20]}: {X.shape[0]}x{X.shape[1]} matrix "
+            f"in {(time.perf_counter() - start) * 1000:.1f} ms")
@@ -0,0 +1,208 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable
+
+import numpy as np
+from hyperopt import STATUS_FAIL, STATUS_OK, Trials, space_eval, tpe
+from hyperopt.base import (
+    JOB_STATE_DONE,
+    JOB_STATE_ERROR,
+    JOB_STATE_RUNNING,
+    Domain,
+    spec_from_misc,
+)
+from hyperopt.utils import coarse_utcnow
+from sklearn.model_selection import cross_val_score
+from threadpoolctl import threadpool_limits
+
+from orchestration.tuning_budget import TuningBudget, cv_splits
+
+# Training data and settings of a worker process, set by _init_worker
+_worker = {}
+
+
+def plan_cores(parallel_trials: int, max_cores: int = None, cv: int = 5) -> tuple[int, int]:
+    """
+    Size the process pool of a parallel search.
+    :param parallel_trials: Trials to evaluate at the same time
+    :param max_cores: Cores the tuning may use, all of them by default
+    :param cv: Number of cross validation folds
+    :return: Number of worker processes, never more than max_cores, and
+        number of trials evaluated at the same time
+    """
+    cores = max_cores or os.cpu_count() or 1
+    processes = max(1, min(cores, parallel_trials * cv))
+    return processes, max(1, min(parallel_trials, processes))
+
+
+def _init_worker(model_class, X_train, y_train, metric_name: str, folds: list) -> None:
+    # One core per worker process: no BLAS or OpenMP threads
+    threadpool_limits(1)
+    _worker.update(
+        model_class=model_class,
+        X_train=X_train,
+        y_train=y_train,
+        metric_name=metric_name,
+        folds=folds,
+    )
+
+
+def first_folds(fold_scores: dict, count: int) -> list:
+    """
+    Scores of folds 0 to count - 1, as the serial search sees them.
+    :param fold_scores: Scores of the finished folds, by fold index
+    :return: The scores in fold order, empty until all of them are finished
+    """
+    if not all(fold in fold_scores for fold in range(count)):
+        return []
+    return [fold_scores[fold] for fold in range(count)]
+
+
+def evaluate_fold(params: dict, fold: int) -> tuple[float, float]:
+    """
+    Score one set of hyperparameters on one cross validation fold, in a
+    worker process. Models that run their own threads are limited to one.
+    :param params: Hyperparameters of the model
+    :param fold: Index of the fold
+    :return: Score on the fold's test split and the seconds it took
+    """
+    start = time.perf_counter()
+    model_class = _worker["model_class"]
+    model_params = dict(params)
+    if "n_jobs" in model_class().get_params():
+        model_params.setdefault("n_jobs", 1)
+    score = cross_val_score(
+        model_class(**model_params), _worker["X_train"], _worker["y_train"],
+        cv=[_worker["folds"][fold]], scoring=_worker["metric_name"])[0]
+    return score, time.perf_counter() - start
+
+
+def parallel_fmin(
+    model_class,
+    space: dict[any, any],
+    X_train,
+    y_train,
+    metric_name: str,
+    loss_fn: Callable[[float], float],
+    max_evals: int,
+    trials: Trials,
+    rstate: np.random.Generator,
+    parallel_trials: int,
+    max_cores: int = None,
+    cv: int = 5,
+    on_result: Callable[[dict, float], None] = None,
+    budget: TuningBudget = None,
+) -> dict[any, any]:
+    """
+    Run hyperopt's TPE search, evaluating several trials at once in a
+    process pool, every cross validation fold of a trial as its own task.
+    A new trial is suggested, from the results so far, as soon as a running
+    one finishes, so the pool stays busy. The training data is sent once to
+    every worker process. The folds are the ones cross_val_score uses, the
+    scores are the same as the serial search's.
+    :param model_class: Model class to tune
+    :param space: Hyperopt search space
+    :param X_train: Training features
+    :param y_train: Training target variable
+    :param metric_name: Scikit-learn scoring name
+    :param loss_fn: Turns a cross validation score into a hyperopt loss
+    :param max_evals: Number of trials to evaluate
+    :param trials: Trials the results are added to
+    :param rstate: Random state of the search
+    :param parallel_trials: Trials to evaluate at the same time
+    :param max_cores: Cores the tuning may use, all of them by default
+    :param cv: Number of cross validation folds
+    :param on_result: Called in this process with the hyperparameters and
+        the mean score of every finished trial
+    :param budget: Timeout, early stopping and pruning rules, see
+        TuningBudget; a trial is pruned on its first folds by index, as in
+        the serial search, whatever order they finish in, and its folds
+        that have not started yet are cancelled
+    :return: Best hyperparameters, as returned by hyperopt's fmin
+    """
+    if budget is None:
+        budget = TuningBudget(max_evals=max_evals, cv=cv)
+    processes, concurrent_trials = plan_cores(parallel_trials, max_cores, cv)
+    folds = cv_splits(model_class(), X_train, y_train, cv)
+    domain = Domain(lambda params: None, space)
+    # Trial, hyperparameters, fold scores by fold index and fold seconds of
+    # the running trials, by trial id
+    running = {}
+    # (trial id, fold index) of the submitted folds
+    pending = {}
+    queued = 0
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_worker,
+        initargs=(model_class, X_train, y_train, metric_name, folds),
+    ) as executor:
+        while (queued < max_evals and not budget.should_stop()) or pending:
+            while (len(running) < concurrent_trials and queued < max_evals
+                   and not budget.should_stop()):
+                new_ids = trials.new_trial_ids(1)
+                trials.refresh()
+                docs = tpe.suggest(new_ids, domain, trials, rstate.integers(2**31 - 1))
+                trials.insert_trial_docs(docs)
+                trials.refresh()
+                for trial in trials._dynamic_trials[-len(docs):]:
+                    params = space_eval(space, spec_from_misc(trial["misc"]))
+                    trial["state"] = JOB_STATE_RUNNING
+                    trial["book_time"] = trial["refresh_time"] = coarse_utcnow()
+                    running[trial["tid"]] = (trial, params, {}, [])
+                    for fold in range(len(folds)):
+                        future = executor.submit(evaluate_fold, params, fold)
+                        pending[future] = (trial["tid"], fold)
+                queued += len(docs)
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                tid, fold = pending.pop(future)
+                if tid not in running:
+                    # A fold of a pruned trial that had already started
+                    if future.exception() is None:
+                        budget.folds += 1
+                        budget.fold_seconds += future.result()[1]
+                    continue
+                trial, params, scores, seconds = running[tid]
+                try:
+                    score, fold_seconds = future.result()
+                except Exception as e:
+                    for other in pending:
+                        other.cancel()
+                    trial["state"] = JOB_STATE_ERROR
+                    trial["misc"]["error"] = (str(type(e)), str(e))
+                    trials.refresh()
+                    raise
+                scores[fold] = score
+                seconds.append(fold_seconds)
+                pruned = False
+                if budget.prune_after_folds and len(scores) >= budget.prune_after_folds:
+                    first = first_folds(scores, budget.prune_after_folds)
+                    # Once per trial, as soon as its first folds are all in
+                    if first and fold < budget.prune_after_folds:
+                        pruned = budget.should_prune([loss_fn(s) for s in first])
+                if not pruned and len(scores) < len(folds):
+                    continue
+                del running[tid]
+                losses = [loss_fn(scores[fold]) for fold in sorted(scores)]
+                folds_skipped = None
+                if pruned:
+                    remaining = [other for other, (other_tid, _) in pending.items()
+                                 if other_tid == tid]
+                    folds_skipped = sum(other.cancel() for other in remaining)
+                    for other in remaining:
+                        if other.cancelled():
+                            del pending[other]
+                budget.record_trial(losses, sum(seconds), pruned, folds_skipped)
+                score = float(np.mean(list(scores.values())))
+                trial["state"] = JOB_STATE_DONE
+                # A pruned trial's loss is partial, see TuningBudget
+                trial["result"] = {"loss": float(np.mean(losses)),
+                                   "status": STATUS_FAIL if pruned else STATUS_OK,
+                                   "pruned": pruned}
+                trial["refresh_time"] = coarse_utcnow()
+                if on_result is not None:
+                    on_result(params, score)
+            trials.refresh()
+    return trials.argmin
@@ -6,17 +6,17 @@ class ModelRegistry:
         self._models = {}
 
     def register(self, name: str, model_class):
-        """ Registers a model class with optional parameters. """
+        """ Registers a model class under a name. """
         if name in self._models:
             raise ValueError(f"Model with name '{name}' is already registered.")
         self._models[name] = {"model_class": model_class}
 
     def get(self, name: str):
-        """ Retrieves the model class and parameters by name. """
+        """ Retrieves the model class by name. """
         model_info = self._models.get(name)
         if model_info is None:
             raise ValueError(f"Model '{name}' not found in registry.")
-        return model_info["model_class"], model_info["params"]
+        return model_info["model_class"]
 
     def list_models(self):
         """ List all registered model names. """
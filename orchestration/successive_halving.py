@@ -0,0 +1,236 @@
+import logging
+import math
+import time
+from typing import Callable
+
+import numpy as np
+from hyperopt import Trials, rand, space_eval
+from hyperopt.base import Domain, spec_from_misc
+from sklearn.base import is_classifier
+from sklearn.model_selection import cross_val_score, train_test_split
+
+logger = logging.getLogger("airflow.task")
+
+# Resource meaning a number of training rows, any other resource is the
+# name of a hyperparameter (e.g. n_estimators, the boosting rounds of
+# XGBClassifier or the trees of RandomForestClassifier)
+SAMPLES = "samples"
+
+
+def sample_configurations(space: dict[any, any], n_configs: int,
+                          rstate: np.random.Generator) -> list[dict]:
+    """
+    Draw random configurations from a hyperopt search space.
+    :return: Raw values of every configuration, in the format fmin returns
+        (indices for hp.choice)
+    """
+    trials = Trials()
+    domain = Domain(lambda params: None, space)
+    docs = rand.suggest(trials.new_trial_ids(n_configs), domain, trials,
+                        rstate.integers(2**31 - 1))
+    return [spec_from_misc(doc["misc"]) for doc in docs]
+
+
+def rung_resources(min_resource: float, max_resource: float, n_configs: int,
+                   eta: int) -> list[float]:
+    """
+    Resources of the rungs of one successive halving bracket: the last
+    rung gets max_resource, every rung before it eta times less, as long as
+    that is at least min_resource and enough configurations remain.
+    """
+    rungs = 1 + min(
+        int(math.floor(math.log(n_configs, eta) + 1e-9)),
+        int(math.floor(math.log(max_resource / min_resource, eta) + 1e-9)),
+    )
+    return [max_resource / eta ** (rungs - 1 - rung) for rung in range(rungs)]
+
+
+def resource_bounds(resource: str, n_samples: int, min_resource: float = None,
+                    max_resource: float = None, eta: int = 3, cv: int = 5) -> tuple[float, float]:
+    """
+    Resources of the first and the last rung, see successive_halving.
+    :raises ValueError: If max_resource is missing for a hyperparameter resource
+    """
+    if resource == SAMPLES:
+        max_resource = max_resource or n_samples
+        return min_resource or min(max_resource, 50 * cv), max_resource
+    if max_resource is None:
+        raise ValueError(f"max_resource is required for the {resource!r} resource")
+    return min_resource or max(1, max_resource / eta ** 3), max_resource
+
+
+def _subsample(y_train, size: int, classifier: bool, random_state: int,
+               cv: int = 5) -> np.ndarray:
+    """
+    Row indices of a subsample of size rows, stratified for classifiers.
+    A classifier's subsample is enlarged until every class has cv rows, so
+    no cross validation fold misses a class (and scores NaN).
+    """
+    n_samples = len(y_train)
+    if classifier:
+        _, counts = np.unique(y_train, return_counts=True)
+        size = max(size, math.ceil(cv * n_samples / counts.min()))
+    if size >= n_samples:
+        return np.arange(n_samples)
+    indices, _ = train_test_split(
+        np.arange(n_samples), train_size=size, random_state=random_state,
+        stratify=y_train if classifier else None)
+    return np.sort(indices)
+
+
+def successive_halving(
+    model_class,
+    space: dict[any, any],
+    X_train,
+    y_train,
+    metric_name: str,
+    loss_fn: Callable[[float], float],
+    n_configs: int,
+    rstate: np.random.Generator,
+    eta: int = 3,
+    resource: str = SAMPLES,
+    min_resource: float = None,
+    max_resource: float = None,
+    cv: int = 5,
+    on_result: Callable[[dict, float], None] = None,
+    configs: list[dict] = None,
+) -> tuple[dict[any, any], list[dict]]:
+    """
+    Successive halving: evaluate n_configs random configurations with a
+    small resource, keep the best 1/eta of them, evaluate those with eta
+    times the resource, and so on until the last configurations get
+    max_resource. With the samples resource a rung cross validates on a
+    stratified subsample of the training rows, the same one for every
+    configuration of the rung; the last rung uses all rows.
+    :param model_class: Model class to tune, e.g. from the model registry
+    :param space: Hyperopt search space
+    :param X_train: Training features
+    :param y_train: Training target variable
+    :param metric_name: Scikit-learn scoring name
+    :param loss_fn: Turns a mean cross validation score into a loss, lower is better
+    :param n_configs: Configurations evaluated in the first rung
+    :param rstate: Random state of the search
+    :param eta: Fraction (1/eta) of the configurations promoted to the next rung
+    :param resource: SAMPLES or the name of a hyperparameter
+    :param min_resource: Resource of the first rung, by default 50 rows per
+        fold or max_resource / eta^3 for a hyperparameter
+    :param max_resource: Resource of the last rung, by default all rows;
+        required for a hyperparameter
+    :param cv: Number of cross validation folds
+    :param on_result: Called with the hyperparameters and the mean score of
+        every configuration of the last rung
+    :param configs: Configurations to evaluate instead of random ones, raw
+        values as returned by sample_configurations
+    :return: Raw values of the best configuration of the last rung, in the
+        format fmin returns, with a hyperparameter resource set to the
+        max_resource it was scored with, and a summary of every rung
+    """
+    y_train = np.asarray(y_train)
+    min_resource, max_resource = resource_bounds(
+        resource, len(y_train), min_resource, max_resource, eta, cv)
+    if configs is None:
+        configs = sample_configurations(space, n_configs, rstate)
+    classifier = is_classifier(model_class())
+    random_state = int(rstate.integers(2**31 - 1))
+
+    rungs = []
+    resources = rung_resources(min_resource, max_resource, len(configs), eta)
+    for rung, amount in enumerate(resources):
+        last = rung == len(resources) - 1
+        start = time.perf_counter()
+        X_rung, y_rung = X_train, y_train
+        if resource == SAMPLES:
+            rows = _subsample(y_train, int(amount), classifier, random_state + rung, cv)
+            X_rung, y_rung = X_train[rows], y_train[rows]
+            amount = len(rows)
+        losses = []
+        for config in configs:
+            params = space_eval(space, config)
+            if resource != SAMPLES:
+                params[resource] = int(round(amount))
+            score = cross_val_score(
+                model_class(**params), X_rung, y_rung, cv=cv, scoring=metric_name).mean()
+            losses.append(loss_fn(score))
+            if last and on_result is not None:
+                on_result(params, score)
+        rungs.append({
+            "resource": amount,
+            "configs": len(configs),
+            "best_loss": min(losses),
+            "seconds": time.perf_counter() - start,
+        })
+        logger.info(
+            f"Successive halving rung {rung}: {len(configs)} configurations with "
+            f"{resource}={amount:g}, best loss {min(losses):.6f}")
+        order = np.argsort(losses, kind="stable")
+        keep = len(configs) if last else max(1, len(configs) // eta)
+        configs = [configs[i] for i in order[:keep]]
+    best = configs[0]
+    if resource != SAMPLES:
+        best = {**best, resource: int(round(max_resource))}
+    return best, rungs
+
+
+def hyperband(
+    model_class,
+    space: dict[any, any],
+    X_train,
+    y_train,
+    metric_name: str,
+    loss_fn: Callable[[float], float],
+    rstate: np.random.Generator,
+    eta: int = 3,
+    resource: str = SAMPLES,
+    min_resource: float = None,
+    max_resource: float = None,
+    cv: int = 5,
+    on_result: Callable[[dict, float], None] = None,
+) -> tuple[dict[any, any], list[dict]]:
+    """
+    Hyperband: successive halving brackets from aggressive (many
+    configurations, starting at min_resource) to conservative (few
+    configurations, all at max_resource), so a bad guess of how small a
+    resource still ranks configurations well does not decide the search.
+    Same parameters as successive_halving.
+    :return: Raw values of the configuration with the lowest loss at
+        max_resource over all brackets, and a summary of every rung
+    """
+    y_train = np.asarray(y_train)
+    min_resource, max_resource = resource_bounds(
+        resource, len(y_train), min_resource, max_resource, eta, cv)
+    s_max = int(math.floor(math.log(max_resource / min_resource, eta) + 1e-9))
+
+    best, best_loss, rungs = None, float("inf"), []
+    for s in range(s_max, -1, -1):
+        n_configs = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+        config, bracket = successive_halving(
+            model_class, space, X_train, y_train, metric_name, loss_fn,
+            n_configs=n_configs, rstate=rstate, eta=eta, resource=resource,
+            min_resource=max_resource / eta ** s, max_resource=max_resource, cv=cv,
+            on_result=on_result)
+        for rung in bracket:
+            rung["bracket"] = s
+        rungs.extend(bracket)
+        if bracket[-1]["best_loss"] < best_loss:
+            best, best_loss = config, bracket[-1]["best_loss"]
+    return best, rungs
+
+
+def compute_report(rungs: list[dict], max_resource: float) -> dict[str, float]:
+    """
+    Compute spent by a multi-fidelity search, against evaluating every
+    configuration it tried at max_resource.
+    :param rungs: Rung summaries returned by successive_halving or hyperband
+    """
+    first_rungs = [rung for i, rung in enumerate(rungs)
+                   if i == 0 or rung.get("bracket") != rungs[i - 1].get("bracket")]
+    configurations = sum(rung["configs"] for rung in first_rungs)
+    spent = sum(rung["configs"] * rung["resource"] for rung in rungs)
+    full = configurations * max_resource
+    return {
+        "configurations": configurations,
+        "evaluations": sum(rung["configs"] for rung in rungs),
+        "full_budget_evaluations": round(spent / max_resource, 2),
+        "compute_fraction": round(spent / full, 4) if full else 0.0,
+        "seconds": round(sum(rung["seconds"] for rung in rungs), 3),
+    }
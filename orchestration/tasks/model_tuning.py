@@ -1,14 +1,39 @@
+import time
+
 import mlflow
 import numpy as np
 
 from airflow.decorators import task
 from hyperopt import fmin, tpe, Trials
-from hyperopt import STATUS_OK
+from hyperopt import STATUS_FAIL, STATUS_OK
 from sklearn.feature_extraction import DictVectorizer
 from sklearn.model_selection import cross_val_score
 import mlflow.artifacts
 
+from orchestration.feature_cache import FeatureCache
+from orchestration.parallel_tuning import parallel_fmin
 from orchestration.registries import model_registry
+from orchestration.successive_halving import (
+    SAMPLES,
+    compute_report,
+    hyperband,
+    resource_bounds,
+    successive_halving,
+)
+from orchestration.tuning_budget import (
+    TuningBudget,
+    cross_val_score_with_pruning,
+    cv_splits,
+)
+from orchestration.trials_store import (
+    TrialsStore,
+    dataset_fingerprint,
+    study_key,
+)
+
+# TPE is hyperopt's sequential search, the others evaluate many random
+# configurations on a small resource and promote the best ones
+TUNING_STRATEGIES = ("tpe", "successive_halving", "hyperband")
 
 
 @task.python
@@ -25,6 +50,16 @@ def model_tuning(
     params: dict[any, any] = None,
     random_state: int = 42,
     max_evals: int = 10,
+    parallel_trials: int = 1,
+    max_cores: int = None,
+    timeout: float = None,
+    early_stop_rounds: int = 0,
+    prune_after_folds: int = 0,
+    tuning_strategy: str = "tpe",
+    resource: str = SAMPLES,
+    max_resource: float = None,
+    trials_store: str = None,
+    feature_cache_dir: str = None,
 ) -> dict[any, any]:
     """
     Perform hyperparameter tuning using Hyperopt and log the best model
@@ -38,6 +73,32 @@ def model_tuning(
     :param max_evals: Maximum number of evaluations for Hyperopt
     :param model_name: Name of the model to be tuned
     :param params: Hyperparameters for the model
+    :param parallel_trials: Trials evaluated at the same time in a process
+        pool, 1 evaluates them one after another
+    :param max_cores: Cores a parallel tuning may use, all of them by default
+    :param timeout: Seconds after which no new trial starts, no limit by default
+    :param early_stop_rounds: Stop after this many trials without
+        improvement, 0 never stops early
+    :param prune_after_folds: Cross validation folds after which a trial
+        worse than the median of the others is stopped, 0 never prunes
+    :param tuning_strategy: One of TUNING_STRATEGIES; successive_halving
+        starts max_evals random configurations on a small resource,
+        hyperband runs several successive halving brackets. Both run
+        serially and do not support parallel_trials, timeout,
+        early_stop_rounds, prune_after_folds or trials_store
+    :param resource: Resource of successive_halving and hyperband, "samples"
+        (stratified subsamples of the training rows) or a hyperparameter
+        such as n_estimators
+    :param max_resource: Resource of the final evaluations, all the rows by
+        default, required for a hyperparameter resource
+    :param trials_store: SQLite file keeping the completed TPE trials of
+        every search. A retry of the same run resumes its search, counting
+        the trials it completed towards max_evals; a later run on the same
+        data, model, search space and metric warm-starts TPE from all the
+        stored trials and runs max_evals new ones. None keeps the trials in
+        memory only
+    :param feature_cache_dir: Directory caching the vectorized training
+        features, see FeatureCache; None vectorizes them every time
     :return: Best hyperparameters found by Hyperopt
     """
     return _model_tuning(
@@ -53,6 +114,16 @@ def model_tuning(
         dst_path=dst_path,
         random_state=random_state,
         max_evals=max_evals,
+        parallel_trials=parallel_trials,
+        max_cores=max_cores,
+        timeout=timeout,
+        early_stop_rounds=early_stop_rounds,
+        prune_after_folds=prune_after_folds,
+        tuning_strategy=tuning_strategy,
+        resource=resource,
+        max_resource=max_resource,
+        trials_store=trials_store,
+        feature_cache_dir=feature_cache_dir,
     )
 
 
@@ -69,6 +140,16 @@ def _model_tuning(
     params: dict[any, any] = None,
     random_state: int = 42,
     max_evals: int = 10,
+    parallel_trials: int = 1,
+    max_cores: int = None,
+    timeout: float = None,
+    early_stop_rounds: int = 0,
+    prune_after_folds: int = 0,
+    tuning_strategy: str = "tpe",
+    resource: str = SAMPLES,
+    max_resource: float = None,
+    trials_store: str = None,
+    feature_cache_dir: str = None,
 ) -> dict[any, any]:
     """
     Perform hyperparameter tuning using Hyperopt and log the best model
@@ -82,8 +163,53 @@ def _model_tuning(
     :param max_evals: Maximum number of evaluations for Hyperopt
     :param model_name: Name of the model to be tuned
     :param params: Hyperparameters for the model
+    :param parallel_trials: Trials evaluated at the same time in a process
+        pool, with the cross validation folds of each trial in parallel too;
+        1 evaluates the trials and their folds one after another
+    :param max_cores: Cores a parallel tuning may use, all of them by default
+    :param timeout: Seconds after which no new trial starts, no limit by default
+    :param early_stop_rounds: Stop after this many trials without
+        improvement, 0 never stops early
+    :param prune_after_folds: Cross validation folds after which a trial
+        worse than the median of the others is stopped, 0 never prunes
+    :param tuning_strategy: One of TUNING_STRATEGIES; successive_halving
+        starts max_evals random configurations on a small resource,
+        hyperband runs several successive halving brackets. Both run
+        serially and do not support parallel_trials, timeout,
+        early_stop_rounds, prune_after_folds or trials_store
+    :param resource: Resource of successive_halving and hyperband, "samples"
+        (stratified subsamples of the training rows) or a hyperparameter
+        such as n_estimators
+    :param max_resource: Resource of the final evaluations, all the rows by
+        default, required for a hyperparameter resource
+    :param trials_store: SQLite file keeping the completed TPE trials of
+        every search. A retry of the same run resumes its search, counting
+        the trials it completed towards max_evals; a later run on the same
+        data, model, search space and metric warm-starts TPE from all the
+        stored trials and runs max_evals new ones. None keeps the trials in
+        memory only
+    :param feature_cache_dir: Directory caching the vectorized training
+        features, see FeatureCache; None vectorizes them every time
     :return: Best hyperparameters found by Hyperopt
     """
+    if tuning_strategy not in TUNING_STRATEGIES:
+        raise ValueError(
+            f"Unknown tuning strategy '{tuning_strategy}', "
+            f"expected one of {TUNING_STRATEGIES}")
+    if tuning_strategy != "tpe":
+        # Values templated from the DAG run conf arrive as strings
+        tpe_only = {
+            "parallel_trials": int(parallel_trials or 1) > 1,
+            "timeout": bool(timeout and float(timeout)),
+            "early_stop_rounds": bool(int(early_stop_rounds or 0)),
+            "prune_after_folds": bool(int(prune_after_folds or 0)),
+            "trials_store": bool(trials_store),
+        }
+        ignored = [name for name, is_set in tpe_only.items() if is_set]
+        if ignored:
+            raise ValueError(
+                f"{', '.join(ignored)} only apply to the tpe strategy, "
+                f"not to {tuning_strategy}")
     model_class = model_registry.get(model_name)
     X_train = mlflow.artifacts.download_artifacts(
         artifact_uri=X_train_filename, run_id=run_id,
@@ -95,8 +221,25 @@ def _model_tuning(
         artifact_path=artifact_path,
         dst_path=dst_path
     )
-    dv = DictVectorizer()
-    X_train = dv.fit_transform(X_train)
+    if feature_cache_dir:
+        dv, X_train = FeatureCache(feature_cache_dir).fit_transform(X_train)
+    else:
+        dv = DictVectorizer()
+        X_train = dv.fit_transform(X_train)
+
+    budget = TuningBudget(
+        max_evals=int(max_evals),
+        timeout=float(timeout) if timeout else None,
+        early_stop_rounds=int(early_stop_rounds or 0),
+        prune_after_folds=int(prune_after_folds or 0),
+    )
+
+    splits = None
+    if budget.prune_after_folds:
+        splits = cv_splits(model_class(), X_train, y_train, cv=5)
+
+    def loss_fn(score):
+        return score if metric_greater_is_better else -score
 
     def objective(params):
         with mlflow.start_run(
@@ -106,22 +249,128 @@ def _model_tuning(
         ):
             mlflow.log_params(params)
             model = model_class(**params)
-            score = cross_val_score(
-                model, X_train,
-                y_train, cv=5, scoring=metric_name).mean()
+            start = time.perf_counter()
+            if budget.prune_after_folds:
+                scores, pruned = cross_val_score_with_pruning(
+                    model, X_train, y_train, splits, metric_name, loss_fn, budget)
+            else:
+                scores, pruned = cross_val_score(
+                    model, X_train,
+                    y_train, cv=5, scoring=metric_name), False
+            budget.record_trial(
+                [loss_fn(fold_score) for fold_score in scores],
+                time.perf_counter() - start, pruned)
+            score = scores.mean()
             if metric_greater_is_better:
                 score = -score
             mlflow.log_metric(metric_name, score)
-            return {'loss': -score, 'status': STATUS_OK}
+            # The loss of a pruned trial is partial, TPE and the best trial
+            # must not take it for a full cross validation loss
+            status = STATUS_FAIL if pruned else STATUS_OK
+            return {'loss': -score, 'status': status, 'pruned': pruned}
+
+    def log_trial(trial_params, score):
+        if metric_greater_is_better:
+            score = -score
+        with mlflow.start_run(
+            run_id=run_id,
+            nested=True,
+            run_name="model_tuning"
+        ):
+            mlflow.log_params(trial_params)
+            mlflow.log_metric(metric_name, score)
+
+    if tuning_strategy != "tpe":
+        max_resource = float(max_resource) if max_resource else None
+        search = dict(
+            model_class=model_class,
+            space=model_hyperparameters,
+            X_train=X_train,
+            y_train=y_train,
+            metric_name=metric_name,
+            loss_fn=loss_fn,
+            rstate=np.random.default_rng(random_state),
+            resource=resource,
+            max_resource=max_resource,
+            on_result=log_trial,
+        )
+        if tuning_strategy == "successive_halving":
+            best, rungs = successive_halving(n_configs=int(max_evals), **search)
+        else:
+            best, rungs = hyperband(**search)
+        _, max_resource = resource_bounds(resource, len(y_train), max_resource=max_resource)
+        report = compute_report(rungs, max_resource)
+        with mlflow.start_run(
+            run_id=run_id,
+            nested=True,
+            run_name="model_tuning"
+        ):
+            mlflow.log_metrics({f"tuning_{name}": value for name, value in report.items()})
+            mlflow.set_tag("tuning_strategy", tuning_strategy)
+        return best
 
     trials = Trials()
+    store = None
+    if trials_store:
+        store = TrialsStore(trials_store)
+        dataset = dataset_fingerprint(X_train, y_train, dv.get_feature_names_out())
+        study = study_key(dataset, model_name, model_hyperparameters,
+                          metric_name, metric_greater_is_better)
+        store.register(study, model_name, metric_name, dataset, model_hyperparameters)
+        trials, completed = store.load(study, run_id)
+        budget.max_evals = max(0, budget.max_evals - completed)
+    loaded = len(trials)
 
-    best = fmin(
-        fn=objective,
-        space=model_hyperparameters,
-        algo=tpe.suggest,
-        max_evals=50,
-        trials=trials,
-        rstate=np.random.default_rng(random_state)
-    )
+    def save_trials():
+        if store is not None:
+            store.save(study, trials, run_id)
+
+    def early_stop_fn(trials, *args):
+        save_trials()
+        return budget.early_stop_fn(trials, *args)
+
+    def log_and_save_trial(trial_params, score):
+        log_trial(trial_params, score)
+        save_trials()
+
+    # Values templated from the DAG run conf arrive as strings
+    parallel_trials = int(parallel_trials or 1)
+    budget.start()
+    if parallel_trials > 1:
+        best = parallel_fmin(
+            model_class=model_class,
+            space=model_hyperparameters,
+            X_train=X_train,
+            y_train=y_train,
+            metric_name=metric_name,
+            loss_fn=loss_fn,
+            max_evals=budget.max_evals,
+            trials=trials,
+            rstate=np.random.default_rng(random_state),
+            parallel_trials=parallel_trials,
+            max_cores=int(max_cores) if max_cores else None,
+            on_result=log_and_save_trial,
+            budget=budget,
+        )
+    else:
+        best = fmin(
+            fn=objective,
+            space=model_hyperparameters,
+            algo=tpe.suggest,
+            max_evals=loaded + budget.max_evals,
+            trials=trials,
+            early_stop_fn=early_stop_fn,
+            rstate=np.random.default_rng(random_state)
+        )
+    save_trials()
+
+    report = budget.log_report()
+    report["trials_loaded"] = loaded
+    with mlflow.start_run(
+        run_id=run_id,
+        nested=True,
+        run_name="model_tuning"
+    ):
+        mlflow.log_metrics({f"tuning_{name}": value for name, value in report.items()})
+        mlflow.set_tag("tuning_stopped_by", budget.stopped_by or "max_evals")
     return best
@@ -4,6 +4,7 @@ from airflow.decorators import task
 import mlflow.artifacts
 from sklearn.feature_extraction import DictVectorizer
 
+from orchestration.feature_cache import FeatureCache
 from orchestration.metric_registry import metric_registry
 
 
@@ -25,6 +26,7 @@ def train_and_save_model(
     y_test_filename: str,
     dst_path: str,
     artifact_path: str,
+    feature_cache_dir: str = None,
 ) -> None:
     """
     Train and save the model to MLflow.
@@ -33,11 +35,14 @@ def train_and_save_model(
     :param X_train_filename: Path to the training features file
     :param y_train_filename: Path to the training target variable file
     :param artifact_path: Path to save the model in MLflow
+    :param feature_cache_dir: Directory caching the vectorized train and
+        test features, see FeatureCache; None vectorizes them every time
     """
     _train_and_save_model(
         run_id=run_id,
         model_name=model_name,
         model_mlflow_name=model_mlflow_name,
+        model_mlflow_tags=model_mlflow_tags,
         X_train_filename=X_train_filename,
         y_train_filename=y_train_filename,
         artifact_path=artifact_path,
@@ -50,6 +55,7 @@ def train_and_save_model(
         model_version=model_version,
         dataset_name=dataset_name,
         model_type=model_type,
+        feature_cache_dir=feature_cache_dir,
     )
 
 
@@ -70,6 +76,7 @@ def _train_and_save_model(
     y_test_filename: str,
     artifact_path: str,
     dst_path: str,
+    feature_cache_dir: str = None,
 ) -> None:
     """
     Train and save the model to MLflow.
@@ -78,6 +85,8 @@ def _train_and_save_model(
     :param X_train_filename: Path to the training features file
     :param y_train_filename: Path to the training target variable file
     :param artifact_path: Path to save the model in MLflow
+    :param feature_cache_dir: Directory caching the vectorized train and
+        test features, see FeatureCache; None vectorizes them every time
     """
     with mlflow.start_run(run_id=run_id, nested=True, run_name="train_model"):
         mlflow.set_tag("model", model_name)
@@ -106,9 +115,14 @@ def _train_and_save_model(
             artifact_path=artifact_path,
             dst_path=dst_path
         )
-        dv = DictVectorizer()
-        X_train = dv.fit_transform(X_train)
-        X_test = dv.transform(X_test)
+        if feature_cache_dir:
+            feature_cache = FeatureCache(feature_cache_dir)
+            dv, X_train = feature_cache.fit_transform(X_train)
+            X_test = feature_cache.transform(dv, X_test)
+        else:
+            dv = DictVectorizer()
+            X_train = dv.fit_transform(X_train)
+            X_test = dv.transform(X_test)
         # Train the model
         model = model_name(**model_hyperparameters)
         model.fit(X_train, y_train)
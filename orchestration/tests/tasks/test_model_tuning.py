@@ -2,6 +2,8 @@ import pytest
 import numpy as np
 from unittest.mock import patch, MagicMock, call
 
+from hyperopt import hp
+
 from orchestration.tasks.model_tuning import (
     _model_tuning
 )
@@ -153,7 +155,7 @@ def test_model_tuning_complete_flow(
     mock_fmin.assert_called_once()
     assert mock_fmin.call_args[1]['space'] == model_hyperparameters
     assert mock_fmin.call_args[1]['algo'] is not None
-    assert mock_fmin.call_args[1]['max_evals'] == 50
+    assert mock_fmin.call_args[1]['max_evals'] == max_evals
     assert mock_fmin.call_args[1]['trials'] == mock_trials.return_value
 
     # Check the result is as expected
@@ -294,6 +296,46 @@ def test_model_tuning_metric_not_greater_is_better(
         assert result['loss'] == -expected_score
 
 
+def test_model_tuning_objective_pruned_trial(
+    mock_mlflow, mock_model_registry, mock_artifacts,
+    mock_dict_vectorizer, mock_cross_val_score
+):
+    """Test that a pruned trial is reported as failed, its loss is partial"""
+    with patch("orchestration.tasks.model_tuning.fmin") as mock_fmin, \
+            patch("orchestration.tasks.model_tuning.cv_splits"), \
+            patch("orchestration.tasks.model_tuning."
+                  "cross_val_score_with_pruning") as mock_pruning:
+        def capture_objective(fn, **kwargs):
+            test_model_tuning_objective_pruned_trial.captured_objective = fn
+            return {"param1": 0.75, "param2": 0.25}
+
+        mock_fmin.side_effect = capture_objective
+        mock_pruning.return_value = (np.array([0.5, 0.6]), True)
+
+        _model_tuning(
+            run_id="test_run_id",
+            X_train_filename="X_train.json",
+            y_train_filename="y_train.json",
+            model_name="test_model",
+            model_hyperparameters={"param1": [0, 1], "param2": [0.1, 0.5]},
+            metric_name="accuracy",
+            metric_greater_is_better=True,
+            artifact_path="artifacts",
+            dst_path="/tmp",
+            params={"param1": 0.5, "param2": 0.3},
+            random_state=42,
+            max_evals=10,
+            prune_after_folds=2,
+        )
+
+        objective_fn = test_model_tuning_objective_pruned_trial.captured_objective
+        result = objective_fn({"param1": 0.6, "param2": 0.4})
+
+        assert result['status'] == 'fail'
+        assert result['pruned']
+        assert result['loss'] == pytest.approx(0.55)
+
+
 def test_model_tuning_error_downloading_artifacts():
     """Test error handling when downloading artifacts fails"""
     with patch("orchestration.tasks."
@@ -371,3 +413,146 @@ def test_model_tuning_invalid_model(mock_error_model_registry):
 
     assert "Model not found in registry" in str(exc_info.value)
     mock_error_model_registry.get.assert_called_with(model_name)
+
+
+def test_model_tuning_parallel_trials(
+    mock_mlflow, mock_model_registry, mock_artifacts,
+    mock_dict_vectorizer, mock_fmin
+):
+    """Test that parallel_trials > 1 runs the search in a process pool"""
+    with patch("orchestration.tasks.model_tuning"
+               ".parallel_fmin") as mock_parallel_fmin:
+        mock_parallel_fmin.return_value = {"param1": 0.5}
+
+        result = _model_tuning(
+            run_id="test_run_id",
+            X_train_filename="X_train.json",
+            y_train_filename="y_train.json",
+            model_name="test_model",
+            model_hyperparameters={"param1": [0, 1]},
+            metric_name="accuracy",
+            metric_greater_is_better=True,
+            artifact_path="artifacts",
+            dst_path="/tmp",
+            parallel_trials="4",
+            max_cores="8",
+        )
+
+        assert result == {"param1": 0.5}
+        mock_fmin.assert_not_called()
+        kwargs = mock_parallel_fmin.call_args[1]
+        assert kwargs["model_class"] == mock_model_registry.get.return_value
+        assert kwargs["parallel_trials"] == 4
+        assert kwargs["max_cores"] == 8
+        # Same loss and logged metric as the serial objective
+        assert kwargs["loss_fn"](0.8) == 0.8
+        kwargs["on_result"]({"param1": 1}, 0.8)
+        mock_mlflow.log_params.assert_called_with({"param1": 1})
+        mock_mlflow.log_metric.assert_called_with("accuracy", -0.8)
+
+
+def test_model_tuning_successive_halving(
+    mock_mlflow, mock_model_registry, mock_artifacts,
+    mock_dict_vectorizer, mock_fmin
+):
+    """Test that the successive_halving strategy replaces the TPE search"""
+    with patch("orchestration.tasks.model_tuning"
+               ".successive_halving") as mock_halving:
+        mock_halving.return_value = (
+            {"param1": 1},
+            [{"resource": 2, "configs": 1, "best_loss": -0.9, "seconds": 0.1}],
+        )
+
+        result = _model_tuning(
+            run_id="test_run_id",
+            X_train_filename="X_train.json",
+            y_train_filename="y_train.json",
+            model_name="test_model",
+            model_hyperparameters={"param1": [0, 1]},
+            metric_name="accuracy",
+            metric_greater_is_better=True,
+            artifact_path="artifacts",
+            dst_path="/tmp",
+            max_evals=27,
+            tuning_strategy="successive_halving",
+        )
+
+        assert result == {"param1": 1}
+        mock_fmin.assert_not_called()
+        kwargs = mock_halving.call_args[1]
+        assert kwargs["n_configs"] == 27
+        assert kwargs["model_class"] == mock_model_registry.get.return_value
+        assert kwargs["resource"] == "samples"
+        mock_mlflow.set_tag.assert_called_with(
+            "tuning_strategy", "successive_halving")
+
+
+@pytest.mark.parametrize("option", [
+    {"parallel_trials": 4},
+    {"timeout": "60"},
+    {"early_stop_rounds": 5},
+    {"prune_after_folds": 2},
+    {"trials_store": "/tmp/trials.db"},
+])
+def test_model_tuning_tpe_only_options(mock_model_registry, option):
+    """Test that options successive halving would ignore are rejected"""
+    with pytest.raises(ValueError, match=next(iter(option))):
+        _model_tuning(
+            run_id="test_run_id",
+            X_train_filename="X_train.json",
+            y_train_filename="y_train.json",
+            model_name="test_model",
+            model_hyperparameters={"param1": [0, 1]},
+            metric_name="accuracy",
+            metric_greater_is_better=True,
+            artifact_path="artifacts",
+            dst_path="/tmp",
+            tuning_strategy="hyperband",
+            **option,
+        )
+
+
+def test_model_tuning_unknown_strategy(mock_model_registry):
+    """Test that an unknown strategy fails before any download"""
+    with pytest.raises(ValueError):
+        _model_tuning(
+            X_train_filename="X_train.json",
+            y_train_filename="y_train.json",
+            model_name="test_model",
+            model_hyperparameters={},
+            metric_name="accuracy",
+            metric_greater_is_better=True,
+            artifact_path="artifacts",
+            dst_path="/tmp",
+            tuning_strategy="grid",
+        )
+    mock_model_registry.get.assert_not_called()
+
+
+def test_model_tuning_trials_store(
+    tmp_path, mock_mlflow, mock_model_registry, mock_artifacts,
+    mock_dict_vectorizer, mock_cross_val_score
+):
+    """Test that a retry resumes the search and a later run warm-starts it"""
+    def tune(run_id):
+        return _model_tuning(
+            run_id=run_id,
+            X_train_filename="X_train.json",
+            y_train_filename="y_train.json",
+            model_name="test_model",
+            model_hyperparameters={"param1": hp.uniform("param1", 0, 1)},
+            metric_name="accuracy",
+            metric_greater_is_better=True,
+            artifact_path="artifacts",
+            dst_path="/tmp",
+            max_evals=3,
+            trials_store=str(tmp_path / "trials.db"),
+        )
+
+    tune("run_1")
+    assert mock_cross_val_score.call_count == 3
+    # A retry of the same run has nothing left to evaluate
+    tune("run_1")
+    assert mock_cross_val_score.call_count == 3
+    tune("run_2")
+    assert mock_cross_val_score.call_count == 6
@@ -266,3 +266,40 @@ def test_train_and_save_model_error_handling(mock_mlflow, mock_artifacts):
 
     # Check that the exception message is correct
     assert "Failed to download artifact" in str(excinfo.value)
+
+
+def test_train_and_save_model_feature_cache(
+        tmp_path, mock_mlflow, mock_artifacts, mock_metric_registry, mock_model):
+    """Test that the features come from the cache when it is enabled"""
+    with patch("orchestration.tasks.train_and_save_model"
+               ".FeatureCache") as mock_cache:
+        mock_cache.return_value.fit_transform.return_value = (
+            MagicMock(), np.array([[1, 2], [3, 4]]))
+        mock_cache.return_value.transform.return_value = np.array([[5, 6], [7, 8]])
+
+        _train_and_save_model(
+            run_id="test_run_id",
+            model_name=mock_model,
+            model_mlflow_name="test_model",
+            model_mlflow_tags={},
+            model_version="v1",
+            dataset_name="test_dataset",
+            model_type="classification",
+            model_hyperparameters={},
+            metric_name="accuracy",
+            metric_greater_is_better=True,
+            X_train_filename="X_train.json",
+            y_train_filename="y_train.json",
+            X_test_filename="X_test.json",
+            y_test_filename="y_test.json",
+            dst_path="/tmp",
+            artifact_path="artifacts",
+            feature_cache_dir=str(tmp_path),
+        )
+
+        mock_cache.assert_called_once_with(str(tmp_path))
+        dv = mock_cache.return_value.fit_transform.return_value[0]
+        mock_cache.return_value.transform.assert_called_once_with(
+            dv, [{"feature1": 5, "feature2": 6}, {"feature1": 7, "feature2": 8}])
+        mock_model.return_value.predict.assert_called_once_with(
+            mock_cache.return_value.transform.return_value)
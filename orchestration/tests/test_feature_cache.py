@@ -0,0 +1,74 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction import DictVectorizer
+
+from orchestration.feature_cache import FeatureCache, artifact_hash
+
+TRAIN = [{"amount": 10.0, "country": "DE"}, {"amount": 3.5, "country": "FR"},
+         {"amount": 7.0, "merchant": "shop"}]
+TEST = [{"amount": 1.0, "country": "FR"}, {"country": "US"}]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return FeatureCache(str(tmp_path / "features"))
+
+
+def test_artifact_hash(tmp_path):
+    assert artifact_hash(TRAIN) == artifact_hash([dict(row) for row in TRAIN])
+    assert artifact_hash(TRAIN) != artifact_hash(TEST)
+    path = tmp_path / "train.json"
+    path.write_text("[]")
+    assert artifact_hash(str(path)) == artifact_hash(path)
+    other = tmp_path / "test.json"
+    other.write_text("[{}]")
+    assert artifact_hash(str(path)) != artifact_hash(str(other))
+
+
+def test_fit_transform_matches_dict_vectorizer(cache):
+    """Test that the cached matrix and vocabulary are the vectorizer's"""
+    expected = DictVectorizer().fit(TRAIN)
+    for _ in range(2):
+        dv, X = cache.fit_transform(TRAIN)
+        assert list(dv.get_feature_names_out()) == list(expected.get_feature_names_out())
+        np.testing.assert_array_equal(X.toarray(), expected.transform(TRAIN).toarray())
+        # A vectorizer loaded from the cache transforms new records too
+        np.testing.assert_array_equal(
+            dv.transform(TEST).toarray(), expected.transform(TEST).toarray())
+    assert len(os.listdir(cache.cache_dir)) == 1
+
+
+def test_json_artifact_file(cache, tmp_path):
+    """A downloaded artifact file is vectorized like its records"""
+    path = tmp_path / "train.json"
+    path.write_text(json.dumps(TRAIN))
+    dv, X = cache.fit_transform(str(path))
+    np.testing.assert_array_equal(X.toarray(), DictVectorizer().fit_transform(TRAIN).toarray())
+    np.testing.assert_array_equal(cache.transform(dv, str(path)).toarray(), X.toarray())
+    assert cache.fit_transform(str(path))[1].shape == X.shape
+
+
+def test_transform_is_keyed_by_vocabulary(cache):
+    """The same records transformed with another vocabulary are another entry"""
+    dv, _ = cache.fit_transform(TRAIN)
+    X_test = cache.transform(dv, TEST)
+    np.testing.assert_array_equal(X_test.toarray(), dv.transform(TEST).toarray())
+    np.testing.assert_array_equal(cache.transform(dv, TEST).toarray(), X_test.toarray())
+
+    other, _ = cache.fit_transform(TEST)
+    assert cache.transform(other, TEST).shape == (2, len(other.feature_names_))
+    assert len(os.listdir(cache.cache_dir)) == 4
+
+
+def test_cache_hit_skips_vectorizing(cache, monkeypatch):
+    cache.fit_transform(TRAIN)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("vectorized again")
+
+    monkeypatch.setattr(DictVectorizer, "fit_transform", fail)
+    _, X = FeatureCache(cache.cache_dir, mmap=False).fit_transform(TRAIN)
+    assert X.shape == (3, 4)
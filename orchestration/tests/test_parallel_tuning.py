@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from hyperopt import Trials, hp
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import cross_val_score
+
+from orchestration.parallel_tuning import parallel_fmin, plan_cores
+
+
+@pytest.mark.parametrize("parallel_trials, max_cores, expected", [
+    (4, 8, (8, 4)),
+    (4, 2, (2, 2)),
+    (2, 64, (10, 2)),
+    (1, 1, (1, 1)),
+])
+def test_plan_cores(parallel_trials, max_cores, expected):
+    """The pool never has more processes than the core cap"""
+    assert plan_cores(parallel_trials, max_cores, cv=5) == expected
+
+
+def test_parallel_fmin():
+    """Test that every trial is evaluated and the best one is returned"""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 3))
+    y = (X[:, 0] > 0).astype(int)
+    space = {"C": hp.loguniform("C", -4, 2)}
+    trials = Trials()
+    results = []
+
+    best = parallel_fmin(
+        model_class=LogisticRegression,
+        space=space,
+        X_train=X,
+        y_train=y,
+        metric_name="accuracy",
+        loss_fn=lambda score: -score,
+        max_evals=6,
+        trials=trials,
+        rstate=np.random.default_rng(42),
+        parallel_trials=2,
+        max_cores=2,
+        on_result=lambda params, score: results.append((params, score)),
+    )
+
+    assert len(trials.trials) == 6
+    assert len(results) == 6
+    assert all(trial["result"]["status"] == "ok" for trial in trials.trials)
+    best_score = max(score for _, score in results)
+    assert trials.best_trial["result"]["loss"] == -best_score
+    assert set(best) == {"C"}
+
+
+def test_parallel_fmin_scores_match_cross_val_score():
+    """Fold tasks score the same folds as the serial cross_val_score"""
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(150, 3))
+    y = (X[:, 1] + rng.normal(size=150) > 0).astype(int)
+    results = []
+
+    parallel_fmin(
+        model_class=LogisticRegression,
+        space={"C": hp.choice("C", [0.1])},
+        X_train=X,
+        y_train=y,
+        metric_name="roc_auc",
+        loss_fn=lambda score: -score,
+        max_evals=1,
+        trials=Trials(),
+        rstate=np.random.default_rng(42),
+        parallel_trials=2,
+        max_cores=2,
+        on_result=lambda params, score: results.append(score),
+    )
+
+    expected = cross_val_score(
+        LogisticRegression(C=0.1), X, y, cv=5, scoring="roc_auc").mean()
+    assert results == [pytest.approx(expected)]
@@ -0,0 +1,28 @@
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from orchestration.registries import ModelRegistry
+
+
+def test_model_registry_get_returns_the_model_class():
+    """Regression test: get used to read a "params" key register never sets"""
+    registry = ModelRegistry()
+    registry.register(name="RandomForestClassifier", model_class=RandomForestClassifier)
+    assert registry.get("RandomForestClassifier") is RandomForestClassifier
+    assert registry.list_models() == ["RandomForestClassifier"]
+
+
+def test_model_registry_errors():
+    registry = ModelRegistry()
+    registry.register(name="model", model_class=RandomForestClassifier)
+    with pytest.raises(ValueError):
+        registry.register(name="model", model_class=RandomForestClassifier)
+    with pytest.raises(ValueError):
+        registry.get("missing")
+
+
+def test_registered_models():
+    from orchestration.model_registry import model_registry
+
+    assert set(model_registry.list_models()) == {"XGBClassifier", "RandomForestClassifier"}
+    assert model_registry.get("RandomForestClassifier") is RandomForestClassifier
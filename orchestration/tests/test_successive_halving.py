@@ -0,0 +1,147 @@
+import numpy as np
+import pytest
+from hyperopt import hp
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+from orchestration.successive_halving import (
+    compute_report,
+    hyperband,
+    rung_resources,
+    sample_configurations,
+    successive_halving,
+)
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(900, 4))
+    y = (X[:, 0] + 0.5 * rng.normal(size=900) > 0).astype(int)
+    return X, y
+
+
+def test_rung_resources():
+    """The last rung gets max_resource, the ones before eta times less"""
+    assert rung_resources(100, 900, 27, 3) == [100, 300, 900]
+    # Limited by the number of configurations
+    assert rung_resources(100, 900, 5, 3) == [300, 900]
+    assert rung_resources(900, 900, 27, 3) == [900]
+
+
+def test_successive_halving_promotes_the_best(data):
+    """Test that a bad configuration is dropped and the best one is returned"""
+    X, y = data
+    space = {"C": hp.choice("C", [1e-6, 1e-5, 1.0])}
+    configs = [{"C": 0}, {"C": 1}, {"C": 2}]
+    results = []
+
+    best, rungs = successive_halving(
+        model_class=LogisticRegression,
+        space=space,
+        X_train=X,
+        y_train=y,
+        metric_name="roc_auc",
+        loss_fn=lambda score: -score,
+        n_configs=3,
+        rstate=np.random.default_rng(42),
+        min_resource=300,
+        configs=configs,
+        on_result=lambda params, score: results.append(params),
+    )
+
+    assert best == {"C": 2}
+    assert [rung["resource"] for rung in rungs] == [300, 900]
+    assert [rung["configs"] for rung in rungs] == [3, 1]
+    # Only the last rung is reported
+    assert results == [{"C": 1.0}]
+
+
+def test_successive_halving_hyperparameter_resource(data):
+    """Test that a hyperparameter resource overrides the configuration's value"""
+    X, y = data
+    space = {"max_depth": hp.choice("max_depth", [2, 4])}
+    results = []
+
+    best, rungs = successive_halving(
+        model_class=RandomForestClassifier,
+        space=space,
+        X_train=X,
+        y_train=y,
+        metric_name="accuracy",
+        loss_fn=lambda score: -score,
+        n_configs=3,
+        rstate=np.random.default_rng(42),
+        resource="n_estimators",
+        max_resource=9,
+        on_result=lambda params, score: results.append(params),
+    )
+
+    assert [rung["resource"] for rung in rungs] == [3, 9]
+    assert results[0]["n_estimators"] == 9
+    # The final model is trained with the resource the best one was scored at
+    assert best["n_estimators"] == 9
+
+
+def test_successive_halving_imbalanced_subsamples(data):
+    """Test that every class keeps cv rows in a subsample, no fold scores NaN"""
+    X, _ = data
+    y = np.zeros(len(X), dtype=int)
+    y[::100] = 1
+
+    _, rungs = successive_halving(
+        model_class=LogisticRegression,
+        space={"C": hp.loguniform("C", -4, 2)},
+        X_train=X,
+        y_train=y,
+        metric_name="roc_auc",
+        loss_fn=lambda score: -score,
+        n_configs=9,
+        rstate=np.random.default_rng(42),
+        min_resource=100,
+    )
+
+    # 9 positives need 500 rows for 5 of them
+    assert [rung["resource"] for rung in rungs] == [500, 500, 900]
+    assert all(np.isfinite(rung["best_loss"]) for rung in rungs)
+
+
+def test_successive_halving_requires_max_resource(data):
+    X, y = data
+    with pytest.raises(ValueError):
+        successive_halving(
+            LogisticRegression, {"C": hp.uniform("C", 0.1, 1)}, X, y, "accuracy",
+            lambda score: -score, n_configs=3, rstate=np.random.default_rng(42),
+            resource="max_iter")
+
+
+def test_hyperband(data):
+    """Test that every bracket ends at max_resource and compute is saved"""
+    X, y = data
+    best, rungs = hyperband(
+        model_class=LogisticRegression,
+        space={"C": hp.loguniform("C", -8, 2)},
+        X_train=X,
+        y_train=y,
+        metric_name="roc_auc",
+        loss_fn=lambda score: -score,
+        rstate=np.random.default_rng(42),
+        min_resource=100,
+    )
+
+    assert set(best) == {"C"}
+    assert sorted({rung["bracket"] for rung in rungs}) == [0, 1, 2]
+    for bracket in (0, 1, 2):
+        assert [r for r in rungs if r["bracket"] == bracket][-1]["resource"] == 900
+
+    report = compute_report(rungs, 900)
+    # Brackets of 9, 5 and 3 configurations
+    assert report["configurations"] == 17
+    assert report["compute_fraction"] < 1
+
+
+def test_sample_configurations():
+    space = {"C": hp.choice("C", [0.1, 1.0])}
+    configs = sample_configurations(space, 4, np.random.default_rng(0))
+    assert len(configs) == 4
+    assert all(config["C"] in (0, 1) for config in configs)
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from hyperopt import STATUS_OK, Trials, fmin, hp, tpe
+
+from orchestration.trials_store import (
+    TrialsStore,
+    dataset_fingerprint,
+    study_key,
+)
+
+SPACE = {"x": hp.uniform("x", -1, 1), "kind": hp.choice("kind", ["a", "b"])}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TrialsStore(str(tmp_path / "trials.db"))
+
+
+def run_fmin(trials, max_evals):
+    evaluated = []
+
+    def objective(params):
+        evaluated.append(params)
+        return {"loss": params["x"] ** 2, "status": STATUS_OK}
+
+    fmin(objective, SPACE, algo=tpe.suggest, max_evals=max_evals, trials=trials,
+         rstate=np.random.default_rng(0), show_progressbar=False)
+    return evaluated
+
+
+def test_dataset_fingerprint():
+    X = np.array([[1.0, 0.0], [0.0, 2.0]])
+    y = [0, 1]
+    assert dataset_fingerprint(X, y) == dataset_fingerprint(X.copy(), np.array(y))
+    assert dataset_fingerprint(sp.csr_matrix(X), y) == dataset_fingerprint(sp.csr_matrix(X), y)
+    assert dataset_fingerprint(X, y) != dataset_fingerprint(X, [1, 0])
+    assert dataset_fingerprint(X, y, ["a", "b"]) != dataset_fingerprint(X, y, ["b", "a"])
+
+
+def test_study_key():
+    key = study_key("data", "model", SPACE, "accuracy", True)
+    assert key == study_key("data", "model", dict(SPACE), "accuracy", True)
+    assert key != study_key("data", "model", {"x": hp.uniform("x", -2, 1)}, "accuracy", True)
+    assert key != study_key("data", "other_model", SPACE, "accuracy", True)
+    assert key != study_key("data", "model", SPACE, "accuracy", False)
+
+
+def test_save_and_load(store):
+    trials = Trials()
+    run_fmin(trials, 4)
+    assert store.save("study", trials, "run") == 4
+    # Already stored trials are not appended twice
+    assert store.save("study", trials, "run") == 0
+
+    loaded, completed = store.load("study", "run")
+    assert completed == 4
+    assert loaded.losses() == trials.losses()
+    assert loaded.argmin == trials.argmin
+    assert store.load("study", "other_run")[1] == 0
+    assert len(store.load("other_study")[0]) == 0
+
+
+def test_resume_and_warm_start(store):
+    """Test that a reloaded search only evaluates new trials"""
+    trials = Trials()
+    run_fmin(trials, 3)
+    store.save("study", trials, "run")
+
+    trials, _ = store.load("study", "run")
+    evaluated = run_fmin(trials, len(trials) + 2)
+    assert len(evaluated) == 2
+    assert store.save("study", trials, "later_run") == 2
+
+    trials, completed = store.load("study", "later_run")
+    assert len(trials) == 5
+    assert completed == 2
+    assert sorted(trial["tid"] for trial in trials.trials) == list(range(5))
+
+
+def test_load_renumbers_trial_ids(store):
+    """Trials stored from a search that failed midway leave gaps in the ids"""
+    trials = Trials()
+    run_fmin(trials, 3)
+    trials._dynamic_trials[1]["state"] = 0
+    store.save("study", trials, "run")
+
+    trials, _ = store.load("study", "run")
+    assert [trial["tid"] for trial in trials.trials] == [0, 1]
+    assert trials.trials[1]["misc"]["idxs"]["x"] == [1]
+    assert len(run_fmin(trials, 3)) == 1
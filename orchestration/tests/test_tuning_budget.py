@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+from hyperopt import STATUS_FAIL, STATUS_OK, Trials, fmin, hp, tpe
+from sklearn.linear_model import LogisticRegression
+
+from orchestration.parallel_tuning import first_folds, parallel_fmin
+from orchestration.tuning_budget import (
+    TuningBudget,
+    cross_val_score_with_pruning,
+    cv_splits,
+)
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 3))
+    y = (X[:, 0] + rng.normal(size=200) > 0).astype(int)
+    return X, y
+
+
+def test_prune_after_startup_trials():
+    """A trial worse than the median of the previous ones is pruned"""
+    budget = TuningBudget(max_evals=10, prune_after_folds=2, prune_startup_trials=3)
+    for loss in (0.1, 0.2, 0.3):
+        assert not budget.should_prune([loss, loss])
+    # Only checked once the trial has scored prune_after_folds folds
+    assert not budget.should_prune([0.9])
+    assert budget.should_prune([0.9, 0.9])
+    assert not budget.should_prune([0.15, 0.15])
+
+
+def test_early_stop_after_rounds_without_improvement():
+    """Test that the search stops after early_stop_rounds trials without improvement"""
+    budget = TuningBudget(max_evals=10, early_stop_rounds=2)
+    budget.record_trial([0.5] * 5, 1.0)
+    budget.record_trial([0.4] * 5, 1.0)
+    budget.record_trial([0.6] * 5, 1.0)
+    assert not budget.should_stop()
+    budget.record_trial([0.4] * 5, 1.0)
+    assert budget.should_stop()
+    assert budget.stopped_by == "early_stop"
+
+    report = budget.report()
+    assert report["trials"] == 4
+    assert report["folds_saved_by_early_stop"] == 6 * 5
+    assert report["seconds_saved_by_early_stop"] == pytest.approx(6 * 5 * 0.2)
+
+
+def test_timeout():
+    """No trial starts once the timeout has passed"""
+    budget = TuningBudget(max_evals=10, timeout=0).start()
+    assert budget.should_stop()
+    assert budget.stopped_by == "timeout"
+    assert budget.early_stop_fn(Trials()) == (True, [])
+
+
+def test_pruning_report():
+    """Test that a pruned trial reports the folds it did not score as saved"""
+    budget = TuningBudget(max_evals=2, prune_after_folds=2)
+    budget.record_trial([0.1] * 5, 5.0)
+    budget.record_trial([0.9, 0.9], 2.0, pruned=True)
+    assert budget.should_stop()
+    assert budget.stopped_by == "max_evals"
+
+    report = budget.report()
+    assert report["trials_pruned"] == 1
+    assert report["folds"] == 7
+    assert report["folds_saved_by_pruning"] == 3
+    assert report["seconds_saved_by_pruning"] == pytest.approx(3.0)
+    assert report["folds_saved_by_timeout"] == 0
+
+
+def test_prune_after_folds_lower_than_cv():
+    with pytest.raises(ValueError):
+        TuningBudget(max_evals=10, prune_after_folds=5, cv=5)
+
+
+def test_cross_val_score_with_pruning(data):
+    """Test that the remaining folds of a pruned trial are skipped"""
+    X, y = data
+    model = LogisticRegression()
+    splits = cv_splits(model, X, y, cv=5)
+    budget = TuningBudget(max_evals=10, prune_after_folds=2, prune_startup_trials=1)
+    budget.should_prune([-1.0, -1.0])
+
+    scores, pruned = cross_val_score_with_pruning(
+        model, X, y, splits, "accuracy", lambda score: -score, budget)
+
+    assert pruned
+    assert len(scores) == 2
+
+
+def test_fmin_early_stop_fn(data):
+    """Test that hyperopt's fmin stops on the budget's early stop rule"""
+    X, y = data
+    splits = cv_splits(LogisticRegression(), X, y)
+    budget = TuningBudget(max_evals=30, early_stop_rounds=3)
+
+    def objective(params):
+        scores, _ = cross_val_score_with_pruning(
+            LogisticRegression(**params), X, y, splits, "accuracy",
+            lambda score: -score, budget)
+        budget.record_trial(list(-scores), 0.0)
+        return {"loss": -scores.mean(), "status": STATUS_OK}
+
+    trials = Trials()
+    fmin(fn=objective, space={"C": hp.choice("C", [1.0])}, algo=tpe.suggest,
+         max_evals=budget.max_evals, trials=trials, early_stop_fn=budget.early_stop_fn,
+         rstate=np.random.default_rng(42), show_progressbar=False)
+
+    # The first trial sets the best loss, the next 3 cannot improve on it
+    assert len(trials.trials) == 4
+    assert budget.stopped_by == "early_stop"
+    assert budget.report()["folds_saved_by_early_stop"] == 26 * 5
+
+
+def test_parallel_fmin_with_budget(data):
+    """Test that the parallel search honors the stop and pruning rules"""
+    X, y = data
+    budget = TuningBudget(max_evals=30, early_stop_rounds=4, prune_after_folds=1,
+                          prune_startup_trials=2)
+    trials = Trials()
+
+    parallel_fmin(
+        model_class=LogisticRegression,
+        space={"C": hp.loguniform("C", -8, 2)},
+        X_train=X,
+        y_train=y,
+        metric_name="accuracy",
+        loss_fn=lambda score: -score,
+        max_evals=budget.max_evals,
+        trials=trials,
+        rstate=np.random.default_rng(42),
+        parallel_trials=2,
+        max_cores=2,
+        budget=budget,
+    )
+
+    assert budget.stopped_by == "early_stop"
+    assert len(trials.trials) == budget.trials < 30
+    assert budget.trials_pruned == sum(trial["result"]["pruned"] for trial in trials.trials)
+    assert budget.folds <= budget.trials * 5
+    # Pruned trials only have a partial loss, the best trial is a full one
+    for trial in trials.trials:
+        expected = STATUS_FAIL if trial["result"]["pruned"] else STATUS_OK
+        assert trial["result"]["status"] == expected
+    assert not trials.best_trial["result"]["pruned"]
+
+
+def test_first_folds():
+    """Test that pruning waits for the first folds by index, in order"""
+    assert first_folds({1: 0.9, 2: 0.8}, 2) == []
+    assert first_folds({1: 0.9, 2: 0.8, 0: 0.7}, 2) == [0.7, 0.9]
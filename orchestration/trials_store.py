@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import pickle
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import scipy.sparse as sp
+from hyperopt import Trials, pyll
+from hyperopt.base import JOB_STATE_DONE
+
+logger = logging.getLogger("airflow.task")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS studies (
+    study TEXT PRIMARY KEY,
+    model_name TEXT,
+    metric_name TEXT,
+    dataset TEXT,
+    space TEXT
+);
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    study TEXT NOT NULL,
+    run_id TEXT,
+    loss REAL,
+    doc BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trials_study ON trials (study);
+"""
+
+
+def dataset_fingerprint(X_train, y_train, feature_names: list = None) -> str:
+    """
+    Content hash of a training dataset.
+    :param X_train: Training features, a dense array or a scipy sparse matrix
+    :param y_train: Training target variable
+    :param feature_names: Names of the columns of X_train, e.g. from
+        DictVectorizer.get_feature_names_out()
+    :return: Hex digest, the same for the same rows in the same order
+    """
+    digest = hashlib.sha256()
+    if sp.issparse(X_train):
+        X_train = X_train.tocsr()
+        digest.update(f"csr{X_train.shape}".encode())
+        for array in (X_train.data, X_train.indices, X_train.indptr):
+            digest.update(np.ascontiguousarray(array).tobytes())
+    else:
+        X_train = np.ascontiguousarray(X_train)
+        digest.update(f"{X_train.dtype}{X_train.shape}".encode())
+        digest.update(X_train.tobytes())
+    y_train = np.asarray(y_train)
+    digest.update(f"{y_train.dtype}{y_train.shape}".encode())
+    digest.update(np.ascontiguousarray(y_train).tobytes())
+    if feature_names is not None:
+        digest.update(json.dumps([str(name) for name in feature_names]).encode())
+    return digest.hexdigest()
+
+
+def space_fingerprint(space) -> str:
+    """Hash of a hyperopt search space: its labels, distributions and choices."""
+    return hashlib.sha256(str(pyll.as_apply(space)).encode()).hexdigest()
+
+
+def study_key(dataset: str, model_name: str, space, metric_name: str,
+              metric_greater_is_better: bool) -> str:
+    """
+    Key of the trials of one search. Trials are only reused by a search
+    with the same data, model, search space and loss.
+    :param dataset: See dataset_fingerprint
+    """
+    return hashlib.sha256(json.dumps([
+        dataset, model_name, space_fingerprint(space), metric_name,
+        bool(metric_greater_is_better),
+    ]).encode()).hexdigest()
+
+
+def _renumber(doc: dict, tid: int) -> dict:
+    """Give a stored trial a new trial id, unique in the Trials it joins."""
+    doc["tid"] = tid
+    doc["misc"]["tid"] = tid
+    doc["misc"]["idxs"] = {
+        label: [tid] * len(idxs) for label, idxs in doc["misc"]["idxs"].items()
+    }
+    return doc
+
+
+class TrialsStore:
+    """
+    Completed hyperopt trials, persisted in a SQLite file so a retried task
+    resumes its search and later searches on the same data warm-start TPE.
+
+    Every trial is stored with the MLflow run_id of the search that ran it.
+    load returns all the trials of a study and how many of them the given
+    run already completed; save appends the trials completed since.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: SQLite file, created if it does not exist
+        """
+        self.path = path
+        # Trial ids already stored, by study
+        self._stored = {}
+        with closing(self._connect()) as connection:
+            connection.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Several Airflow workers may share the file
+        return sqlite3.connect(self.path, timeout=60)
+
+    def register(self, study: str, model_name: str, metric_name: str,
+                 dataset: str, space) -> None:
+        """Describe a study, for whoever inspects the file."""
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO studies VALUES (?, ?, ?, ?, ?)",
+                (study, model_name, metric_name, dataset, str(pyll.as_apply(space))))
+
+    def load(self, study: str, run_id: str = None) -> tuple[Trials, int]:
+        """
+        :param study: See study_key
+        :param run_id: MLflow run of the search
+        :return: Trials holding every stored trial of the study, and the
+            number of them run_id completed
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT run_id, doc FROM trials WHERE study = ? ORDER BY id",
+                (study,)).fetchall()
+        trials = Trials()
+        docs = [_renumber(pickle.loads(doc), tid) for tid, (_, doc) in enumerate(rows)]
+        if docs:
+            trials.insert_trial_docs(docs)
+            trials.refresh()
+        self._stored[study] = {doc["tid"] for doc in docs}
+        completed = sum(stored_run_id == run_id for stored_run_id, _ in rows)
+        logger.info(
+            f"Loaded {len(docs)} trials of study {study[:12]} from {self.path}, "
+            f"{completed} of them from run {run_id}")
+        return trials, completed
+
+    def save(self, study: str, trials: Trials, run_id: str = None) -> int:
+        """
+        Append the completed trials that are not stored yet.
+        :return: Number of trials appended
+        """
+        stored = self._stored.setdefault(study, set())
+        new = [trial for trial in trials._dynamic_trials
+               if trial["state"] == JOB_STATE_DONE and trial["tid"] not in stored]
+        if not new:
+            return 0
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(
+                "INSERT INTO trials (study, run_id, loss, doc) VALUES (?, ?, ?, ?)",
+                [(study, run_id, trial["result"].get("loss"), pickle.dumps(trial))
+                 for trial in new])
+        stored.update(trial["tid"] for trial in new)
+        return len(new)
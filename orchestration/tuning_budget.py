@@ -0,0 +1,209 @@
+import logging
+import time
+
+import numpy as np
+from sklearn.base import is_classifier
+from sklearn.model_selection import check_cv, cross_val_score
+
+logger = logging.getLogger("airflow.task")
+
+
+def cv_splits(model, X_train, y_train, cv: int = 5) -> list:
+    """
+    Train/test index pairs of the folds cross_val_score(model, cv=cv) uses.
+    :param model: Model instance or class
+    :param cv: Number of cross validation folds
+    :return: List of (train indices, test indices)
+    """
+    return list(check_cv(cv, y_train, classifier=is_classifier(model)).split(X_train, y_train))
+
+
+class TuningBudget:
+    """
+    Decides how much compute a hyperparameter search spends, and reports
+    how much each rule saved. Compute is counted in folds, one model fit
+    and scoring on one cross validation split.
+
+    - max_evals: number of trials.
+    - timeout: wall-clock seconds; no new trial starts after it, the
+      running ones finish.
+    - early_stop_rounds: stop once this many trials in a row did not
+      lower the best loss by more than min_improvement.
+    - prune_after_folds: once a trial has scored this many folds, its mean
+      loss so far is compared with the other trials' mean loss over the
+      same number of folds. If it is worse than their prune_quantile, the
+      remaining folds are skipped. The trial keeps its partial loss but is
+      reported as failed (STATUS_FAIL), so TPE does not learn from it and
+      it is never the best trial. Pruning starts after
+      prune_startup_trials trials reached that point.
+
+    The stop rules are checked by early_stop_fn, hyperopt's fmin hook, or
+    by should_stop in a parallel search. Trials report their fold losses
+    to should_prune and record_trial.
+    """
+
+    def __init__(
+        self,
+        max_evals: int,
+        timeout: float = None,
+        early_stop_rounds: int = 0,
+        min_improvement: float = 0.0,
+        prune_after_folds: int = 0,
+        prune_quantile: float = 0.5,
+        prune_startup_trials: int = 5,
+        cv: int = 5,
+    ):
+        """
+        :param max_evals: Maximum number of trials
+        :param timeout: Seconds after which no new trial starts, None for no limit
+        :param early_stop_rounds: Trials without improvement that stop the
+            search, 0 disables early stopping
+        :param min_improvement: Loss decrease that counts as an improvement
+        :param prune_after_folds: Folds after which a trial may be pruned,
+            0 disables pruning
+        :param prune_quantile: Quantile of the other trials' partial losses
+            a trial must not exceed to keep going
+        :param prune_startup_trials: Trials that are never pruned
+        :param cv: Number of cross validation folds of a trial
+        """
+        if prune_after_folds >= cv:
+            raise ValueError(
+                f"prune_after_folds ({prune_after_folds}) must be lower than cv ({cv})")
+        self.max_evals = max_evals
+        self.timeout = timeout
+        self.early_stop_rounds = early_stop_rounds
+        self.min_improvement = min_improvement
+        self.prune_after_folds = prune_after_folds
+        self.prune_quantile = prune_quantile
+        self.prune_startup_trials = prune_startup_trials
+        self.cv = cv
+        self.stopped_by = None
+        self.trials = 0
+        self.trials_pruned = 0
+        self.folds = 0
+        self.fold_seconds = 0.0
+        self.folds_saved_by_pruning = 0
+        self.seconds_saved_by_pruning = 0.0
+        self._started = time.monotonic()
+        self._best_loss = float("inf")
+        self._without_improvement = 0
+        # Mean loss over the first prune_after_folds folds of every trial
+        self._partial_losses = []
+
+    def start(self) -> "TuningBudget":
+        self._started = time.monotonic()
+        return self
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    def should_prune(self, fold_losses: list) -> bool:
+        """
+        Call once per trial, with the losses of its first prune_after_folds folds.
+        :return: True if the trial's remaining folds should be skipped
+        """
+        if not self.prune_after_folds or len(fold_losses) != self.prune_after_folds:
+            return False
+        partial = float(np.mean(fold_losses))
+        previous = self._partial_losses
+        self._partial_losses = previous + [partial]
+        if len(previous) < self.prune_startup_trials:
+            return False
+        return partial > np.quantile(previous, self.prune_quantile)
+
+    def record_trial(self, fold_losses: list, seconds: float, pruned: bool = False,
+                     folds_skipped: int = None) -> None:
+        """
+        Account for a finished trial.
+        :param fold_losses: Losses of the folds the trial scored
+        :param seconds: Compute time of those folds
+        :param pruned: The trial was pruned, its loss is partial
+        :param folds_skipped: Folds saved by pruning the trial, by default
+            the folds it did not score
+        """
+        self.trials += 1
+        self.folds += len(fold_losses)
+        self.fold_seconds += seconds
+        if pruned:
+            self.trials_pruned += 1
+            if folds_skipped is None:
+                folds_skipped = self.cv - len(fold_losses)
+            self.folds_saved_by_pruning += folds_skipped
+            # Estimated from the trial's own folds, cheap trials save little
+            if fold_losses:
+                self.seconds_saved_by_pruning += folds_skipped * seconds / len(fold_losses)
+            # A pruned trial never improves on the best loss
+            self._without_improvement += 1
+            return
+        loss = float(np.mean(fold_losses))
+        if loss < self._best_loss - self.min_improvement:
+            self._best_loss = loss
+            self._without_improvement = 0
+        else:
+            self._without_improvement += 1
+
+    def should_stop(self) -> bool:
+        """True once the search must not start new trials."""
+        if self.stopped_by is not None:
+            return True
+        if self.trials >= self.max_evals:
+            self.stopped_by = "max_evals"
+        elif self.timeout is not None and self.elapsed() >= self.timeout:
+            self.stopped_by = "timeout"
+        elif self.early_stop_rounds and self._without_improvement >= self.early_stop_rounds:
+            self.stopped_by = "early_stop"
+        return self.stopped_by is not None
+
+    def early_stop_fn(self, trials, *args) -> tuple[bool, list]:
+        """Stop rule hook of hyperopt's fmin (its early_stop_fn argument)."""
+        return self.should_stop() and self.stopped_by != "max_evals", []
+
+    def report(self) -> dict[str, float]:
+        """
+        Compute spent and saved by each rule, in folds and in seconds. The
+        seconds saved are estimated: from the folds of the pruned trials for
+        pruning, from the mean fold time for the stop rules.
+        """
+        fold_seconds = self.fold_seconds / self.folds if self.folds else 0.0
+        saved = {"pruning": (self.folds_saved_by_pruning, self.seconds_saved_by_pruning),
+                 "timeout": (0, 0.0), "early_stop": (0, 0.0)}
+        if self.stopped_by in ("timeout", "early_stop"):
+            folds = (self.max_evals - self.trials) * self.cv
+            saved[self.stopped_by] = (folds, folds * fold_seconds)
+        report = {
+            "trials": self.trials,
+            "trials_pruned": self.trials_pruned,
+            "folds": self.folds,
+            "elapsed_seconds": round(self.elapsed(), 3),
+        }
+        for rule, (folds, seconds) in saved.items():
+            report[f"folds_saved_by_{rule}"] = folds
+            report[f"seconds_saved_by_{rule}"] = round(seconds, 3)
+        return report
+
+    def log_report(self) -> dict[str, float]:
+        report = self.report()
+        logger.info(
+            f"Tuning stopped by {self.stopped_by or 'max_evals'} after {self.trials} trials "
+            f"({self.trials_pruned} pruned, {self.folds} folds); saved "
+            f"{report['folds_saved_by_pruning']} folds by pruning, "
+            f"{report['folds_saved_by_timeout']} by the timeout, "
+            f"{report['folds_saved_by_early_stop']} by early stopping")
+        return report
+
+
+def cross_val_score_with_pruning(model, X_train, y_train, splits: list, scoring: str,
+                                 loss_fn, budget: TuningBudget) -> tuple[np.ndarray, bool]:
+    """
+    cross_val_score, one fold at a time, stopping early when the budget
+    prunes the trial.
+    :param splits: Folds, see cv_splits
+    :param loss_fn: Turns a fold score into a loss
+    :return: Scores of the folds evaluated and whether the trial was pruned
+    """
+    scores = []
+    for split in splits:
+        scores.append(cross_val_score(model, X_train, y_train, cv=[split], scoring=scoring)[0])
+        if budget.should_prune([loss_fn(score) for score in scores]):
+            return np.array(scores), True
+    return np.array(scores), False